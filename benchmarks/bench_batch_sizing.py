@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Throughput of fixed batch sizes against ADAPTIVE_BATCHING, under latency.
+
+Each configuration runs one cycle: BENCH_ORDERS inbound orders synced into TracOS
+and a backlog of BENCH_BACKLOG unsynced workorders claimed, exported and
+acknowledged. By default TracOS is InMemoryTracOSAdapter, whose round trips take
+BENCH_LATENCY_MS plus BENCH_ITEM_LATENCY_MS per document and time out past
+MONGO_TIMEOUT_MS. With BENCH_BACKEND=mongo it is the MongoDB at MONGO_URI
+(`docker compose up -d`), with latency injected on the network, for instance:
+    sudo tc qdisc add dev lo root netem delay 5ms
+    sudo tc qdisc del dev lo root netem
+Usage:
+    poetry run python benchmarks/bench_batch_sizing.py [fixed sizes...]
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from loguru import logger
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import FaultInjection, InMemoryTracOSAdapter
+from adapters.mongo_retry import MongoDBUnavailable
+from settings import Settings
+
+BACKEND = os.getenv("BENCH_BACKEND", "memory")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+BENCH_DATABASE = "tractian_bench"
+BENCH_COLLECTION = "workorders_bench"
+ORDERS = int(os.getenv("BENCH_ORDERS", "10000"))
+BACKLOG = int(os.getenv("BENCH_BACKLOG", "5000"))
+FAULTS = FaultInjection(
+    latency=float(os.getenv("BENCH_LATENCY_MS", "5")) / 1000,
+    item_latency=float(os.getenv("BENCH_ITEM_LATENCY_MS", "0.2")) / 1000,
+    timeout=int(os.getenv("MONGO_TIMEOUT_MS", "5000")) / 1000,
+)
+DEFAULT_FIXED_SIZES = [10, 100, 1000]
+SIZERS = ("inbound_write", "outbound_claim", "outbound_ack")
+
+
+def write_inbound_file(inbound: Path) -> None:
+    date = "2025-06-01T00:00:00+00:00"
+    with open(inbound / "orders.jsonl", "w") as f:
+        for number in range(ORDERS):
+            workorder = {
+                "orderNo": number,
+                "isActive": False,
+                "isCanceled": False,
+                "isDeleted": False,
+                "isDone": False,
+                "isOnHold": False,
+                "isPending": True,
+                "isSynced": False,
+                "summary": f"Batch sizing benchmark #{number}",
+                "creationDate": date,
+                "lastUpdateDate": date,
+                "deletedDate": None,
+            }
+            f.write(json.dumps(workorder) + "\n")
+
+
+def make_backlog() -> list[dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "number": n,
+            "status": "pending",
+            "title": f"Example workorder #{n}",
+            "description": "Batch sizing benchmark",
+            "createdAt": now,
+            "updatedAt": now,
+            "deleted": False,
+            "isSynced": False,
+        }
+        for n in range(ORDERS, ORDERS + BACKLOG)
+    ]
+
+
+async def open_tracos(settings: Settings):
+    if BACKEND == "mongo":
+        client, tracos, journal = await main.start(settings)
+        await tracos.collection.delete_many({})
+        if BACKLOG:
+            await tracos.collection.insert_many(make_backlog())
+        return client, tracos, journal
+    tracos = InMemoryTracOSAdapter(FAULTS)
+    tracos.insert_documents(make_backlog())
+    await tracos.load_existence_filter(settings.existence_filter_path)
+    return ClientERP(), tracos, main.open_checkpoint_journal(settings, tracos)
+
+
+async def run(settings: Settings) -> list[Any]:
+    """records/s of one cycle, then the tuned batch sizes"""
+    workdir = Path(tempfile.mkdtemp(prefix="bench_batch_sizing_"))
+    settings = dataclasses.replace(
+        settings,
+        data_inbound_dir=workdir / "inbound",
+        data_outbound_dir=workdir / "outbound",
+        data_archive_dir=workdir / "archive",
+        data_dead_letter_dir=workdir / "dead_letter",
+        mongo_uri=MONGO_URI,
+        mongo_database=BENCH_DATABASE,
+        mongo_collection=BENCH_COLLECTION,
+        existence_filter_path=workdir / "existing-numbers.bloom",
+        checkpoint_journal="off",
+    )
+    settings.data_inbound_dir.mkdir()
+    settings.data_outbound_dir.mkdir()
+    write_inbound_file(settings.data_inbound_dir)
+    try:
+        client, tracos, journal = await open_tracos(settings)
+        started = time.perf_counter()
+        try:
+            metrics = await main.run_cycle(settings, client, tracos, journal)
+        except MongoDBUnavailable:
+            # retries exhausted: batches of this size keep timing out
+            return ["gave up"] + ["-"] * len(SIZERS)
+        finally:
+            if BACKEND == "mongo":
+                await tracos.collection.drop()
+                tracos.client.close()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir)
+    synced = metrics["inbound.inserted"] + metrics["outbound.acknowledged"]
+    return [round(synced / elapsed)] + [
+        metrics.gauges.get(f"batching.{name}.size", "-") for name in SIZERS
+    ]
+
+
+async def bench(fixed_sizes: list[int]):
+    logger.remove()
+    print(
+        f"{BACKEND}: {ORDERS} inbound orders, {BACKLOG} outbound workorders"
+        + (
+            f", {FAULTS.latency * 1000:g} ms + {FAULTS.item_latency * 1000:g} ms/doc"
+            if BACKEND == "memory"
+            else ""
+        )
+    )
+    print(" ".join(f"{c:>15}" for c in ("batch size", "records/s", *SIZERS)))
+    base = Settings.from_env() if BACKEND == "mongo" else Settings()
+    configurations = [
+        (
+            str(size),
+            dataclasses.replace(
+                base,
+                inbound_sync_batch_size=size,
+                outbound_batch_size=size,
+                adaptive_batching=False,
+            ),
+        )
+        for size in fixed_sizes
+    ]
+    configurations.append(
+        ("adaptive", dataclasses.replace(base, adaptive_batching=True))
+    )
+    for name, settings in configurations:
+        print(" ".join(f"{c:>15}" for c in (name, *await run(settings))))
+
+
+if __name__ == "__main__":
+    asyncio.run(bench([int(a) for a in sys.argv[1:]] or DEFAULT_FIXED_SIZES))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Peak memory (RSS) of a run over synthetic orders, under MEMORY_BUDGET_MB.
+
+The orders are written as JSON Lines files and synced into an in-memory TracOS
+that counts documents instead of keeping them, so the peak is that of the sync
+process alone: it should stay under the budget however many orders there are.
+The run keeps the default settings, checkpoint journal included, whose keys held
+in memory (journal_entries) should not grow with the orders either.
+Prints the result as a JSON line (tests/test_memory_budget.py reads it). Usage:
+    poetry run python benchmarks/bench_memory.py [orders]
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from loguru import logger
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import InMemoryTracOSAdapter
+from services.memory_budget import current_rss, peak_rss
+from settings import Settings
+
+DEFAULT_ORDERS = 1_000_000
+ORDERS_PER_FILE = int(os.getenv("BENCH_ORDERS_PER_FILE", "10000"))
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "160"))
+
+
+class CountingTracOS(InMemoryTracOSAdapter):
+    """Counts the documents written instead of storing them"""
+
+    def __init__(self):
+        super().__init__()
+        self.inserted = 0
+
+    def insert_documents(self, documents: list[dict[str, Any]]) -> None:
+        self.inserted += len(documents)
+
+
+def write_inbound_files(inbound: Path, orders: int) -> None:
+    date = "2025-06-01T00:00:00+00:00"
+    for first in range(0, orders, ORDERS_PER_FILE):
+        with open(inbound / f"orders-{first:08d}.jsonl", "w") as f:
+            for number in range(first, min(first + ORDERS_PER_FILE, orders)):
+                workorder = {
+                    "orderNo": number,
+                    "isActive": False,
+                    "isCanceled": False,
+                    "isDeleted": False,
+                    "isDone": False,
+                    "isOnHold": False,
+                    "isPending": True,
+                    "isSynced": False,
+                    "summary": f"Memory benchmark #{number}",
+                    "creationDate": date,
+                    "lastUpdateDate": date,
+                    "deletedDate": None,
+                }
+                f.write(json.dumps(workorder) + "\n")
+
+
+async def run(orders: int) -> dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_memory_"))
+    try:
+        settings = Settings(
+            data_inbound_dir=workdir / "inbound",
+            data_outbound_dir=workdir / "outbound",
+            data_archive_dir=workdir / "archive",
+            data_dead_letter_dir=workdir / "dead_letter",
+            checkpoint_path=workdir / "checkpoints" / "journal.jsonl",
+            memory_budget_mb=MEMORY_BUDGET_MB,
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        write_inbound_files(settings.data_inbound_dir, orders)
+        tracos = CountingTracOS()
+        await tracos.load_existence_filter(settings.existence_filter_path)
+        journal = main.open_checkpoint_journal(settings, tracos)
+        await journal.open()
+        record = journal.record
+        journal_entries = 0
+
+        async def record_and_count(phase: str, keys: Iterable[str]) -> None:
+            nonlocal journal_entries
+            await record(phase, keys)
+            held = sum(keys.entries for keys in list(journal.completed.values()))
+            journal_entries = max(journal_entries, held)
+
+        journal.record = record_and_count
+
+        baseline = current_rss()
+        started = time.perf_counter()
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+        return {
+            "orders": orders,
+            "synced": tracos.inserted,
+            "seconds": round(time.perf_counter() - started, 1),
+            "budget_mb": MEMORY_BUDGET_MB,
+            "baseline_rss_mb": baseline >> 20,
+            "peak_rss_mb": peak_rss() >> 20,
+            "inbound_batch_min": metrics["memory.inbound.smallest_batch"],
+            "inbound_record_bytes": metrics["memory.inbound.record_bytes"],
+            "journal_entries": journal_entries,
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    logger.remove()
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ORDERS
+    print(json.dumps(asyncio.run(run(orders))))
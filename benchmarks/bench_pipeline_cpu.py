@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""CPU cost of the inbound and outbound pipelines, against InMemoryTracOSAdapter.
+
+No MongoDB needed: TracOS is a dict with injected round-trip latency, so the
+numbers measure our own Python overhead (parsing, validation, translation,
+files). Usage:
+    poetry run python benchmarks/bench_pipeline_cpu.py [latencies in ms...]
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from loguru import logger
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import FaultInjection, InMemoryTracOSAdapter
+from settings import Settings
+
+FILES = int(os.getenv("BENCH_FILES", "5000"))
+UNSYNCED = int(os.getenv("BENCH_UNSYNCED", "5000"))
+TRANSLATION = os.getenv("OUTBOUND_TRANSLATION", "python")
+DEFAULT_LATENCIES_MS = [0.0, 1.0, 5.0]
+
+
+def write_inbound_files(inbound: Path) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(FILES):
+        workorder = {
+            "orderNo": i,
+            "isActive": False,
+            "isCanceled": False,
+            "isDeleted": False,
+            "isDone": False,
+            "isOnHold": False,
+            "isPending": True,
+            "isSynced": False,
+            "summary": f"CPU benchmark #{i}",
+            "creationDate": now,
+            "lastUpdateDate": now,
+            "deletedDate": None,
+        }
+        (inbound / f"{i}.json").write_text(json.dumps(workorder))
+
+
+def unsynced_documents() -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "number": FILES + i,
+            "status": "in_progress",
+            "title": f"Example workorder #{FILES + i}",
+            "description": f"CPU benchmark #{FILES + i}",
+            "createdAt": now,
+            "updatedAt": now,
+            "deleted": False,
+            "isSynced": False,
+        }
+        for i in range(UNSYNCED)
+    ]
+
+
+async def run(latency_ms: float) -> tuple[float, float]:
+    """Wall and CPU seconds of one cycle"""
+    workdir = Path(tempfile.mkdtemp(prefix="bench_cpu_"))
+    try:
+        settings = Settings(
+            data_inbound_dir=workdir / "inbound",
+            data_outbound_dir=workdir / "outbound",
+            data_archive_dir=workdir / "archive",
+            data_dead_letter_dir=workdir / "dead_letter",
+            checkpoint_journal="off",
+            outbound_translation=TRANSLATION,
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        write_inbound_files(settings.data_inbound_dir)
+        tracos = InMemoryTracOSAdapter(FaultInjection(latency=latency_ms / 1000))
+        tracos.insert_documents(unsynced_documents())
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        await main.run_cycle(settings, ClientERP(), tracos, journal)
+        return time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        shutil.rmtree(workdir)
+
+
+async def main_bench(latencies_ms: list[float]):
+    logger.remove()
+    records = FILES + UNSYNCED
+    print(
+        f"{FILES} inbound files, {UNSYNCED} unsynced workorders, "
+        f"outbound translation: {TRANSLATION}"
+    )
+    print(f"{'latency ms':>10} {'wall s':>8} {'cpu s':>8} {'cpu us/record':>14}")
+    for latency_ms in latencies_ms:
+        wall, cpu = await run(latency_ms)
+        print(
+            f"{latency_ms:>10.1f} {wall:>8.2f} {cpu:>8.2f} {cpu / records * 1e6:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench([float(a) for a in sys.argv[1:]] or DEFAULT_LATENCIES_MS))
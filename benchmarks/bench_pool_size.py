@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Concurrent write throughput of TracOSAdapter for several connection pool sizes.
+
+Requires a running MongoDB (`docker compose up -d`). Usage:
+    poetry run python benchmarks/bench_pool_size.py [pool sizes...]
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from loguru import logger
+
+from adapters.mongo_options import MongoClientOptions
+from adapters.tracos_adapter import TracOSAdapter
+from models.tracOS_models import TracOSWorkorder
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+BENCH_DATABASE = "tractian_bench"
+BENCH_COLLECTION = "workorders_bench"
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "64"))
+BATCHES_PER_TASK = int(os.getenv("BENCH_BATCHES_PER_TASK", "20"))
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", "50"))
+DEFAULT_POOL_SIZES = [1, 4, 16, 64, 100]
+
+
+def make_batch(start: int) -> list[TracOSWorkorder]:
+    now = datetime.now(timezone.utc)
+    return [
+        TracOSWorkorder(
+            number=n,
+            status="pending",
+            title=f"Example workorder #{n}",
+            description="Pool size benchmark",
+            createdAt=now,
+            updatedAt=now,
+            deleted=False,
+            isSynced=False,
+        )
+        for n in range(start, start + BATCH_SIZE)
+    ]
+
+
+async def run(pool_size: int) -> float:
+    options = MongoClientOptions(
+        max_pool_size=pool_size,
+        min_pool_size=pool_size,
+        compressors=tuple(filter(None, os.getenv("MONGO_COMPRESSORS", "").split(","))),
+    )
+    tracos = TracOSAdapter(MONGO_URI, BENCH_DATABASE, BENCH_COLLECTION, options)
+    await tracos.collection.delete_many({})
+    await tracos.check_connection()
+
+    async def task(task_no: int):
+        for batch_no in range(BATCHES_PER_TASK):
+            start = (task_no * BATCHES_PER_TASK + batch_no) * BATCH_SIZE
+            await tracos.write_workorders(make_batch(start), [])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(task(i) for i in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+
+    await tracos.collection.drop()
+    tracos.client.close()
+    return CONCURRENCY * BATCHES_PER_TASK * BATCH_SIZE / elapsed
+
+
+async def main(pool_sizes: list[int]):
+    logger.remove()
+    print(
+        f"{CONCURRENCY} concurrent writers, {BATCHES_PER_TASK}x{BATCH_SIZE} docs each"
+    )
+    print(f"{'maxPoolSize':>12} {'docs/s':>12}")
+    for pool_size in pool_sizes:
+        throughput = await run(pool_size)
+        print(f"{pool_size:>12} {throughput:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or DEFAULT_POOL_SIZES))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Aggregate inbound throughput for 1..N partitioned workers (src/workers.py).
+
+Requires a running MongoDB (`docker compose up -d`). Usage:
+    poetry run python benchmarks/bench_workers.py [worker counts...]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import MongoClient
+
+ROOT = Path(__file__).resolve().parents[1]
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+BENCH_DATABASE = "tractian_bench"
+BENCH_COLLECTION = "workorders_bench"
+FILES = int(os.getenv("BENCH_FILES", "5000"))
+DEFAULT_WORKER_COUNTS = [1, 2, 4]
+
+
+def write_inbound_files(inbound: Path) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(FILES):
+        workorder = {
+            "orderNo": i,
+            "isActive": False,
+            "isCanceled": False,
+            "isDeleted": False,
+            "isDone": False,
+            "isOnHold": False,
+            "isPending": True,
+            "isSynced": False,
+            "summary": f"Worker benchmark #{i}",
+            "creationDate": now,
+            "lastUpdateDate": now,
+            "deletedDate": None,
+        }
+        (inbound / f"{i}.json").write_text(json.dumps(workorder))
+
+
+def run(workers: int, workdir: Path) -> float:
+    collection = MongoClient(MONGO_URI)[BENCH_DATABASE][BENCH_COLLECTION]
+    collection.drop()
+    env = {
+        **os.environ,
+        "DATA_INBOUND_DIR": str(workdir / "inbound"),
+        "DATA_OUTBOUND_DIR": str(workdir / "outbound"),
+        "MONGO_DATABASE": BENCH_DATABASE,
+        "MONGO_COLLECTION": BENCH_COLLECTION,
+    }
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(ROOT / "src" / "workers.py"), str(workers)],
+        env=env,
+        check=True,
+        stderr=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - started
+    assert collection.count_documents({}) == FILES, "every file processed once"
+    collection.drop()
+    return FILES / elapsed
+
+
+def main(worker_counts: list[int]):
+    workdir = Path(tempfile.mkdtemp())
+    (workdir / "inbound").mkdir()
+    write_inbound_files(workdir / "inbound")
+    try:
+        print(f"{FILES} inbound files")
+        print(f"{'workers':>8} {'files/s':>10}")
+        for workers in worker_counts:
+            print(f"{workers:>8} {run(workers, workdir):>10.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_WORKER_COUNTS)
@@ -0,0 +1,314 @@
+import asyncio
+import bisect
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from adapters.mongo_retry import CircuitBreaker, RetryPolicy, retry_on_mongodb_error
+
+JOURNAL_BACKENDS = ("off", "file", "mongo")
+
+
+class PositionRanges:
+    """A set of positions (ints) kept as sorted, disjoint ranges: the positions of
+    a file synced in order take one range however many records it holds"""
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.ends: list[int] = []  # inclusive
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self.starts, self.ends))
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in zip(self.starts, self.ends):
+            yield from range(start, end + 1)
+
+    def __contains__(self, position: int) -> bool:
+        i = bisect.bisect_right(self.starts, position) - 1
+        return i >= 0 and position <= self.ends[i]
+
+    def add(self, position: int) -> None:
+        i = bisect.bisect_right(self.starts, position) - 1
+        if i >= 0 and position <= self.ends[i]:
+            return
+        joins_left = i >= 0 and self.ends[i] == position - 1
+        joins_right = i + 1 < len(self.starts) and self.starts[i + 1] == position + 1
+        if joins_left and joins_right:
+            self.ends[i] = self.ends.pop(i + 1)
+            del self.starts[i + 1]
+        elif joins_left:
+            self.ends[i] = position
+        elif joins_right:
+            self.starts[i + 1] = position
+        else:
+            self.starts.insert(i + 1, position)
+            self.ends.insert(i + 1, position)
+
+    def discard(self, position: int) -> None:
+        i = bisect.bisect_right(self.starts, position) - 1
+        if i < 0 or position > self.ends[i]:
+            return
+        start, end = self.starts[i], self.ends[i]
+        if start == end:
+            del self.starts[i], self.ends[i]
+        elif position == start:
+            self.starts[i] = position + 1
+        elif position == end:
+            self.ends[i] = position - 1
+        else:
+            self.ends[i] = position - 1
+            self.starts.insert(i + 1, position + 1)
+            self.ends.insert(i + 1, end)
+
+
+class CompletedKeys:
+    """The keys of one phase. A key "<group>#<n>" (e.g. the record at line n of an
+    inbound file) is kept as position n of the ranges of its group, so the keys of
+    a group take memory in proportion to its gaps, not to its records"""
+
+    def __init__(self):
+        self.keys: set[str] = set()
+        self.groups: dict[str, PositionRanges] = {}
+
+    @staticmethod
+    def _split(key: str) -> tuple[str, int] | None:
+        group, sep, position = key.rpartition("#")
+        if sep and position.isdigit():
+            return group, int(position)
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        split = self._split(key)
+        if split is None:
+            return key in self.keys
+        positions = self.groups.get(split[0])
+        return positions is not None and split[1] in positions
+
+    def __len__(self) -> int:
+        # groups may be discarded meanwhile from a pipeline thread
+        return len(self.keys) + sum(map(len, list(self.groups.values())))
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.keys
+        for group, positions in list(self.groups.items()):
+            for position in positions:
+                yield f"{group}#{position}"
+
+    @property
+    def entries(self) -> int:
+        """Keys and ranges held, what the memory taken grows with"""
+        groups = list(self.groups.values())
+        return len(self.keys) + sum(len(p.starts) for p in groups)
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            split = self._split(key)
+            if split is None:
+                self.keys.add(key)
+            else:
+                self.groups.setdefault(split[0], PositionRanges()).add(split[1])
+
+    def difference_update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            split = self._split(key)
+            if split is None:
+                self.keys.discard(key)
+            elif split[0] in self.groups:
+                positions = self.groups[split[0]]
+                positions.discard(split[1])
+                if not positions.starts:
+                    del self.groups[split[0]]
+
+    def discard_group(self, group: str) -> bool:
+        return self.groups.pop(group, None) is not None
+
+
+class CheckpointJournal:
+    """Completed chunks of work of the current run, by phase.
+
+    Work is recorded as opaque keys once it is durable (written to MongoDB or to
+    the outbound directory). After a crash, the next run loads the keys and skips
+    that work, so recovery costs only what was left unfinished. The journal is
+    cleared when a run completes without failures. Otherwise, keys forgotten once
+    their work no longer needs them (e.g. an archived inbound file) are compacted
+    out of it. Keys "<group>#<n>" are held as ranges of n (see CompletedKeys).
+
+    This base class keeps keys in memory only (no journal).
+    """
+
+    def __init__(self):
+        self.completed: dict[str, CompletedKeys] = defaultdict(CompletedKeys)
+        self._forgotten = False  # keys were forgotten since the last compaction
+
+    async def open(self) -> None:
+        """Loads the keys recorded by an interrupted run"""
+        for phase, keys in await self._load():
+            self.completed[phase].update(keys)
+        if self.completed:
+            logger.info(
+                "Resuming from checkpoint: "
+                + ", ".join(f"{p}={len(k)}" for p, k in self.completed.items())
+            )
+
+    def is_done(self, phase: str, key: str) -> bool:
+        return key in self.completed[phase]
+
+    async def record(self, phase: str, keys: Iterable[str]) -> None:
+        keys = [key for key in keys if key not in self.completed[phase]]
+        if not keys:
+            return
+        await self._append(phase, keys)
+        self.completed[phase].update(keys)
+
+    def forget(self, phase: str, keys: Iterable[str]) -> None:
+        """Drops keys from memory at once, and from the journal at the next compact().
+        Safe to call from pipeline threads."""
+        completed = self.completed[phase]
+        recorded = len(completed)
+        completed.difference_update(keys)
+        if len(completed) != recorded:
+            self._forgotten = True
+
+    def forget_group(self, phase: str, group: str) -> None:
+        """Like forget(), for all the keys "<group>#<n>" at once"""
+        if self.completed[phase].discard_group(group):
+            self._forgotten = True
+
+    async def compact(self) -> None:
+        """Rewrites the journal without the keys forgotten since the last compaction"""
+        if not self._forgotten:
+            return
+        self._forgotten = False
+        await self._rewrite(
+            [(phase, sorted(keys)) for phase, keys in self.completed.items() if keys]
+        )
+
+    async def clear(self) -> None:
+        await self._truncate()
+        self.completed.clear()
+        self._forgotten = False
+
+    async def _load(self) -> list[tuple[str, list[str]]]:
+        return []
+
+    async def _append(self, phase: str, keys: list[str]) -> None:
+        return None
+
+    async def _truncate(self) -> None:
+        return None
+
+    async def _rewrite(self, entries: list[tuple[str, list[str]]]) -> None:
+        # a crash in between loses checkpoints: their work is redone, not lost
+        await self._truncate()
+        for phase, keys in entries:
+            await self._append(phase, keys)
+
+
+class DisabledJournal(CheckpointJournal):
+    """CHECKPOINT_JOURNAL=off: nothing is recorded, not even in memory, so the keys
+    of a long run do not pile up"""
+
+    async def record(self, phase: str, keys: Iterable[str]) -> None:
+        return None
+
+
+class FileJournal(CheckpointJournal):
+    """Journal kept as an append-only JSON Lines file, fsynced after each chunk"""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+
+    async def _load(self) -> list[tuple[str, list[str]]]:
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be cut short by the crash
+                    logger.warning(f"Ignoring truncated entry of {self.path}")
+                    continue
+                entries.append((entry["phase"], entry["keys"]))
+        return entries
+
+    def _write(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _append(self, phase: str, keys: list[str]) -> None:
+        entry = {
+            "phase": phase,
+            "keys": keys,
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        await asyncio.to_thread(self._write, json.dumps(entry) + "\n")
+
+    async def _truncate(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+    def _replace(self, lines: list[str]) -> None:
+        staged = self.path.with_name(self.path.name + ".tmp")
+        with open(staged, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staged, self.path)
+
+    async def _rewrite(self, entries: list[tuple[str, list[str]]]) -> None:
+        at = datetime.now(timezone.utc).isoformat()
+        lines = [
+            json.dumps({"phase": phase, "keys": keys, "at": at}) + "\n"
+            for phase, keys in entries
+        ]
+        await asyncio.to_thread(self._replace, lines)
+
+
+class MongoJournal(CheckpointJournal):
+    """Journal kept as one document per chunk in a MongoDB collection"""
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        owner: str,
+        retry_policy: RetryPolicy | None = None,
+    ):
+        super().__init__()
+        self.collection = collection
+        self.owner = owner
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = CircuitBreaker(
+            self.retry_policy.breaker_threshold, self.retry_policy.breaker_cooldown
+        )
+
+    @retry_on_mongodb_error
+    async def _load(self) -> list[tuple[str, list[str]]]:
+        cursor = self.collection.find({"owner": self.owner})
+        return [(doc["phase"], doc["keys"]) async for doc in cursor]
+
+    @retry_on_mongodb_error
+    async def _append(self, phase: str, keys: list[str]) -> None:
+        await self.collection.insert_one(
+            {
+                "owner": self.owner,
+                "phase": phase,
+                "keys": keys,
+                "at": datetime.now(timezone.utc),
+            }
+        )
+
+    @retry_on_mongodb_error
+    async def _truncate(self) -> None:
+        await self.collection.delete_many({"owner": self.owner})
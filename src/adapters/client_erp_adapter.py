@@ -1,57 +1,336 @@
+import bz2
+import gzip
+import heapq
 import json
+import lzma
+import os
+import shutil
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 from loguru import logger
-from typing import Any
+from typing import IO, Any, Callable, Iterator
+
+from adapters.scan_options import ScanOptions
+from services.partitioning import shard_of
+
+# flat: <dir>/<orderNo>.json; hash: <dir>/<00-ff>/<orderNo>.json;
+# date: <dir>/<YYYY-MM-DD>/<orderNo>.json (export day)
+OUTBOUND_LAYOUTS = ("flat", "hash", "date")
+
+# inbound files may be compressed: <name>.json.gz, <name>.jsonl.xz, ...
+COMPRESSED_OPENERS: dict[str, Callable[..., IO[str]]] = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+JSON_SUFFIXES = (".json",)
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+
+
+class InvalidCompressedData(ValueError):
+    """A compressed inbound file whose data is corrupt"""
+
+
+# Raised while decompressing or decoding an inbound file, reported like malformed
+# JSON. Any other OSError is a failure to read the file, which is left in place.
+# ValueError covers json and UTF-8 decoding errors, and InvalidCompressedData.
+DECODE_ERRORS = (
+    ValueError,
+    EOFError,
+    gzip.BadGzipFile,
+    zlib.error,
+    lzma.LZMAError,
+)
+
+# Read size of the incremental parser of top-level json arrays
+JSON_CHUNK_SIZE = 1 << 16
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = " \t\n\r"
+_JSON_NUMBER_CHARS = "0123456789+-.eE"
 
 
 class ClientERP:
     def __init__(self):
         return
 
-    # TODO add tests
-    def capture_json_filenames(self, dir: Path) -> list[Path]:
-        """Captures json filenames for future processing"""
+    @staticmethod
+    def _payload_suffix(path: Path) -> str:
+        """Suffix of path once its compression suffix, if any, is removed"""
+        name = path.name
+        if path.suffix in COMPRESSED_OPENERS:
+            name = name[: -len(path.suffix)]
+        return Path(name).suffix
+
+    def is_inbound_file(self, path: Path) -> bool:
+        return self._payload_suffix(path) in JSON_SUFFIXES + JSON_LINES_SUFFIXES
+
+    def is_json_lines(self, path: Path) -> bool:
+        return self._payload_suffix(path) in JSON_LINES_SUFFIXES
+
+    @contextmanager
+    def open_text(self, path: Path) -> Iterator[IO[str]]:
+        """Opens path for reading as UTF-8 text, decompressing it on the fly.
+
+        bz2 reports corrupt data with a bare OSError, raised as
+        InvalidCompressedData so that it is not mistaken for an I/O error.
+        """
+        opener = COMPRESSED_OPENERS.get(path.suffix)
+        if opener is None:
+            with path.open("r", encoding="utf-8") as f:
+                yield f
+            return
+        with opener(path, "rt", encoding="utf-8") as f:
+            try:
+                yield f
+            except OSError as e:
+                if opener is bz2.open and type(e) is OSError and e.errno is None:
+                    raise InvalidCompressedData(str(e)) from e
+                raise
+
+    def scan_json_files(
+        self,
+        dir: Path,
+        options: ScanOptions | None = None,
+        include: Callable[[Path], bool] | None = None,
+    ) -> Iterator[Path]:
+        """Yields inbound files (json, JSON Lines, possibly compressed) of dir that
+        include accepts, within the limits of options.
+
+        Entries are read with os.scandir and yielded as they are found, and the
+        walk stops as soon as the run window is full.
+        Oldest first, a directory is listed whole before its first file is yielded,
+        holding an entry per file; with max_files, only the max_files oldest.
+        """
+        options = options or ScanOptions()
         if dir.is_dir() is False:
             logger.warning(
                 "DATA_INBOUND_DIR environment variable does not resolve to a directory."
             )
-            return []
+            return
+
+        logger.info(f"Scanning json files inside {dir}")
+        files = 0
+        size = 0
+        for entry, entry_size in self._scan_entries(dir, options, include):
+            if options.max_files and files >= options.max_files:
+                logger.info(f"Run window full: {options.max_files} files")
+                break
+            # a file bigger than max_bytes still gets a run of its own
+            if options.max_bytes and files and size + entry_size > options.max_bytes:
+                logger.info(f"Run window full: {size} bytes")
+                break
+            files += 1
+            size += entry_size
+            yield Path(entry.path)
+        logger.info(f"Scanned {files} json files ({size} bytes) inside {dir}")
+
+    def _scan_entries(
+        self,
+        dir: Path,
+        options: ScanOptions,
+        include: Callable[[Path], bool] | None = None,
+    ) -> Iterator[tuple[os.DirEntry, int]]:
+        """(entry, size) of the json files of dir that include accepts, then of its
+        shards if options.sharded"""
+        shards: list[os.DirEntry] = []
+
+        def listed() -> Iterator[tuple[int, str, os.DirEntry, int]]:
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    # dotfiles are partial writes or reports of other tools
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        shards.append(entry)
+                        continue
+                    if (
+                        not self.is_inbound_file(Path(entry.name))
+                        or not entry.is_file()
+                    ):
+                        continue
+                    if include is not None and not include(Path(entry.path)):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # removed while scanning
+                    yield stat.st_mtime_ns, entry.name, entry, stat.st_size
 
-        logger.info(f"Capturing full pathnames of json files inside {dir}")
         try:
-            return list(dir.glob("*.json"))
+            if not options.oldest_first:
+                for _, _, entry, size in listed():
+                    yield entry, size
+            else:
+                # a run window takes the oldest max_files: no need to hold more
+                oldest = (
+                    heapq.nsmallest(options.max_files, listed(), key=lambda f: f[:2])
+                    if options.max_files
+                    else sorted(listed(), key=lambda f: f[:2])
+                )
+                for _, _, entry, size in oldest:
+                    yield entry, size
         except PermissionError:
             logger.warning(f"No permission to read directory {dir}")
-            return []
+            return
 
-    # TODO tests
-    def read_json_file(
-        self, path: Path
-    ) -> dict[str, Any] | None:  # pyright: ignore[reportExplicitAny]
-        """Read JSON file and return dict object if sucessfull"""
+        if options.sharded:
+            for shard in sorted(shards, key=lambda e: e.name):
+                yield from self._scan_entries(Path(shard.path), options, include)
 
-        try:
-            logger.info(f"Reading file {path}")
-            with path.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except PermissionError:
-            logger.warning(f"No permission to read file {path}")
-            return None
-        except json.JSONDecodeError:
-            logger.warning(f"{path} is a malformed JSON")
-            return None
+    def load_json_file(self, path: Path) -> Any:
+        """Read JSON file, raising PermissionError or one of DECODE_ERRORS on failure"""
+        logger.info(f"Reading file {path}")
+        with self.open_text(path) as f:
+            return json.load(f)
+
+    def iter_json_file(self, path: Path) -> Iterator[tuple[int | None, Any]]:
+        """Yields (position, document) for a json file.
+
+        A single document is yielded as (None, document). The elements of a
+        top-level array are parsed incrementally and yielded as (index from 1,
+        element), so memory use does not depend on the size of the array. Raises
+        PermissionError or one of DECODE_ERRORS.
+        """
+        logger.info(f"Reading file {path}")
+        with self.open_text(path) as f:
+            head = ""
+            while True:
+                chunk = f.read(JSON_CHUNK_SIZE)
+                head = (head + chunk).lstrip(_JSON_WHITESPACE + "\ufeff")
+                if head or not chunk:
+                    break
+            if not head.startswith("["):
+                yield None, json.loads(head + f.read())
+                return
+            yield from self._iter_json_array(f, head)
+
+    @staticmethod
+    def _iter_json_array(f: IO[str], buffer: str) -> Iterator[tuple[int, Any]]:
+        """Elements of the json array that starts buffer and continues in f.
+        Only the unparsed tail of the input is kept in memory."""
+        pos = 1  # past "["
+        eof = False
+
+        def fill(size: int = JSON_CHUNK_SIZE) -> None:
+            nonlocal buffer, pos, eof
+            chunk = f.read(size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        def next_token() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if eof:
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                fill()
+
+        def end_of_array() -> None:
+            """Consumes the closing "]", only whitespace may follow it"""
+            nonlocal pos
+            pos += 1
+            while True:
+                while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+                    pos += 1
+                if pos < len(buffer):
+                    raise json.JSONDecodeError("Extra data", buffer, pos)
+                if eof:
+                    return
+                fill()
+
+        def complete(element: Any, end: int) -> bool:
+            """Whether element, decoded up to end, cannot continue in the next chunk.
+            A number can: "1" may be the start of "12" or "1.5"."""
+            if eof:
+                return True
+            if end == len(buffer):
+                return False
+            if isinstance(element, (int, float)) and not isinstance(element, bool):
+                return buffer[end] not in _JSON_NUMBER_CHARS
+            return True
+
+        index = 0
+        if next_token() == "]":
+            end_of_array()
+            return
+        while True:
+            # a value that ends at the end of the buffer may continue in the next chunk
+            while True:
+                try:
+                    element, end = _JSON_DECODER.raw_decode(buffer, pos)
+                    if complete(element, end):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # read at least as much again as is buffered: linear for big elements
+                fill(max(JSON_CHUNK_SIZE, len(buffer) - pos))
+            index += 1
+            pos = end
+            yield index, element
+
+            token = next_token()
+            if token == "]":
+                end_of_array()
+                return
+            if token != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+            next_token()
+
+    def iter_json_lines(self, path: Path) -> Iterator[tuple[int, Any, str | None]]:
+        """Yields (line number, document, error) for each non-blank line of a JSON
+        Lines file. A line that is not valid JSON comes with its error message
+        instead of a document. Decompression errors are raised (DECODE_ERRORS).
+        """
+        logger.info(f"Reading JSON Lines file {path}")
+        with self.open_text(path) as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line), None
+                except json.JSONDecodeError as e:
+                    yield line_no, None, str(e)
+
+    @staticmethod
+    def outbound_subdir(dir: Path, order_no: Any, layout: str = "flat") -> Path:
+        """Directory of the outbound file of an order for the given layout"""
+        if layout == "flat":
+            return dir
+        if layout == "hash":
+            return dir / f"{shard_of(str(order_no), 256):02x}"
+        if layout == "date":
+            return dir / datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        raise ValueError(
+            f"Unsupported outbound layout {layout!r}, expected one of {OUTBOUND_LAYOUTS}"
+        )
 
     # TODO tests
-    def write_json_file(self, dir: Path, content: dict[str, Any]) -> bool:
-        """Writes contents of an object to a file in the filesystem"""
-        filepath: Path = dir / f"{content['orderNo']}.json"
+    def write_json_file(
+        self, dir: Path, content: dict[str, Any], layout: str = "flat"
+    ) -> bool:
+        """Writes contents of an object to a file in the filesystem.
+
+        The file is written under a temporary dotfile name and renamed into place,
+        so readers of the outbound directory never see a partial file.
+        """
+        subdir = self.outbound_subdir(dir, content["orderNo"], layout)
+        filepath: Path = subdir / f"{content['orderNo']}.json"
+        partial = subdir / f".{content['orderNo']}.json.tmp"
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
+            if subdir != dir and dir.is_dir():
+                subdir.mkdir(exist_ok=True)
+            with open(partial, "w", encoding="utf-8") as f:
                 json.dump(content, f)
-                logger.success(
-                    f"Order #{content['orderNo']} contents saved in {filepath}"
-                )
-                return True
+            os.replace(partial, filepath)
+            logger.success(f"Order #{content['orderNo']} contents saved in {filepath}")
+            return True
         except FileNotFoundError:
             logger.error(
                 f"Outbound directory '{dir}' does not exist. Could not write {content['orderNo']}.json"
@@ -61,3 +340,84 @@ class ClientERP:
         except PermissionError:
             logger.error(f"No permission to write file {filepath}")
             return False
+
+    @staticmethod
+    def _free_path(path: Path) -> Path:
+        """path, or a variant of it that does not exist yet"""
+        if not path.exists():
+            return path
+        stamp = datetime.now(timezone.utc).strftime("%H%M%S%f")
+        return path.with_name(f"{path.stem}.{stamp}{path.suffix}")
+
+    def archive_file(
+        self, path: Path, archive_dir: Path, compress: bool = False
+    ) -> Path | None:
+        """Moves a processed file to archive_dir/<YYYY-MM-DD>/, gzip-compressed if asked"""
+        day_dir = archive_dir / datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        try:
+            day_dir.mkdir(parents=True, exist_ok=True)
+            if not compress or path.suffix in COMPRESSED_OPENERS:
+                target = self._free_path(day_dir / path.name)
+                shutil.move(path, target)
+            else:
+                target = self._free_path(day_dir / f"{path.name}.gz")
+                partial = target.with_name(f".{target.name}.tmp")
+                with path.open("rb") as src, gzip.open(partial, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(partial, target)
+                path.unlink()
+        except OSError as e:
+            logger.error(f"Could not archive {path}: {e}")
+            return None
+        logger.info(f"Archived {path} to {target}")
+        return target
+
+    def write_error_report(
+        self,
+        path: Path,
+        dead_letter_dir: Path,
+        reason: str,
+        error: str,
+        rejected: list[dict[str, Any]] | None = None,
+        name: str | None = None,
+    ) -> Path:
+        """Writes <name>.error.json about path to dead_letter_dir (name defaults to
+        the name of path). rejected lists the records of a JSON Lines file that
+        were rejected (line, reason, error)."""
+        dead_letter_dir.mkdir(parents=True, exist_ok=True)
+        report: dict[str, Any] = {
+            "file": str(path),
+            "reason": reason,
+            "error": error,
+            "rejectedAt": datetime.now(timezone.utc).isoformat(),
+        }
+        if rejected:
+            report["rejectedRecords"] = rejected
+        report_path = self._free_path(
+            dead_letter_dir / f"{name or path.name}.error.json"
+        )
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report_path
+
+    def quarantine_file(
+        self,
+        path: Path,
+        dead_letter_dir: Path,
+        reason: str,
+        error: str,
+        rejected: list[dict[str, Any]] | None = None,
+    ) -> Path | None:
+        """Moves a rejected file to dead_letter_dir with a <name>.error.json report next to it"""
+        try:
+            target = self._free_path(dead_letter_dir / path.name)
+            # the report is written first: a quarantined file always has one
+            self.write_error_report(
+                path, dead_letter_dir, reason, error, rejected, name=target.name
+            )
+            shutil.move(path, target)
+        except OSError as e:
+            logger.error(f"Could not quarantine {path}: {e}")
+            return None
+        logger.warning(f"Quarantined {path} to {target} ({reason})")
+        return target
@@ -0,0 +1,435 @@
+import asyncio
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from bson import ObjectId
+from loguru import logger
+from pydantic_core import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, ExecutionTimeout
+from pymongo.results import BulkWriteResult
+
+from adapters.mongo_retry import CircuitBreaker, RetryPolicy, retry_on_mongodb_error
+from adapters.tracos_adapter import (
+    EXISTENCE_FILTER_MIN_CAPACITY,
+    LEASE_FIELDS,
+    UPDATE_MODES,
+    NumberRange,
+    Watermark,
+    WorkorderLease,
+    WorkorderVersion,
+    WorkorderWriter,
+)
+from adapters.version_cache import VersionCache
+from models.tracOS_models import TracOSWorkorder
+from services.bloom_filter import BloomFilter
+from services.translator import TRACOS_TO_CLIENT_PROJECTION
+
+
+def evaluate(expression: Any, doc: dict[str, Any]) -> Any:
+    """Evaluates the aggregation expressions of TRACOS_TO_CLIENT_PROJECTION against
+    doc, with MongoDB semantics ($field of a missing field is missing)"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return doc.get(expression[1:])
+    if not isinstance(expression, dict):
+        return expression
+    (operator, args), *_ = expression.items()
+    if operator == "$literal":
+        return args
+    if operator == "$eq":
+        return evaluate(args[0], doc) == evaluate(args[1], doc)
+    if operator == "$ifNull":
+        value = evaluate(args[0], doc)
+        return evaluate(args[1], doc) if value is None else value
+    raise ValueError(f"Unsupported aggregation operator {operator}")
+
+
+def project(doc: dict[str, Any], projection: dict[str, Any]) -> dict[str, Any]:
+    """What a $project stage returns for doc"""
+    projected = {}
+    for name, expression in projection.items():
+        if expression == 0:
+            continue
+        if expression == 1:
+            expression = f"${name}"
+        if isinstance(expression, str) and expression[1:] not in doc:
+            continue
+        projected[name] = evaluate(expression, doc)
+    return projected
+
+
+def matches(doc: dict[str, Any], query: dict[str, Any]) -> bool:
+    """Whether doc matches query, for the filters of TracOSAdapter's bulk writes"""
+    for name, condition in query.items():
+        if name == "$or":
+            if not any(matches(doc, alternative) for alternative in condition):
+                return False
+        elif isinstance(condition, dict):
+            ((operator, value),) = condition.items()
+            if operator == "$lt":
+                if name not in doc or not doc[name] < value:
+                    return False
+            elif operator == "$ne":
+                if doc.get(name) == value:
+                    return False
+            else:
+                raise ValueError(f"Unsupported query operator {operator}")
+        elif doc.get(name) != condition:
+            return False
+    return True
+
+
+def apply_update(doc: dict[str, Any], update: dict[str, Any]) -> dict[str, Any]:
+    """doc after the $set and $unset of update: fields it does not name are kept"""
+    updated = {**doc, **update.get("$set", {})}
+    for name in update.get("$unset", {}):
+        updated.pop(name, None)
+    return updated
+
+
+@dataclass(frozen=True)
+class FaultInjection:
+    """Latency and failures injected into every round trip of InMemoryTracOSAdapter"""
+
+    latency: float = 0.0  # seconds per round trip
+    jitter: float = 0.0  # extra seconds, uniform in [0, jitter]
+    failure_rate: float = 0.0  # share of round trips failing with a transient error
+    seed: int = 0
+    item_latency: float = 0.0  # extra seconds per document of a bulk operation
+    # like timeoutMS: longer round trips fail with ExecutionTimeout once it
+    # elapses (0: no timeout)
+    timeout: float = 0.0
+    # share of the operations of a bulk write failing alone with a transient
+    # write error, while the others are applied (a partial BulkWriteError)
+    write_failure_rate: float = 0.0
+    # workorders whose writes fail with a validation error, which is not retried
+    rejected_numbers: frozenset[int] = frozenset()
+
+    def __post_init__(self):
+        if min(self.latency, self.jitter, self.item_latency, self.timeout) < 0:
+            raise ValueError("latencies and timeout must not be negative")
+        if not 0 <= self.failure_rate < 1 or not 0 <= self.write_failure_rate < 1:
+            raise ValueError("failure rates must be in [0, 1)")
+
+
+class InMemoryTracOSAdapter(WorkorderWriter):
+    """TracOSAdapter stand-in keeping workorder documents in a dict.
+
+    Implements the TracOS protocol (tracos_protocol.py) with the semantics of the
+    MongoDB queries of TracOSAdapter: conditional updates, idempotent inserts,
+    leases, watermarks, version cache and existence filter. Every operation is one
+    simulated round trip, which sleeps for the injected latency (longer for bulk
+    operations over more documents) and may fail with AutoReconnect, or with
+    ExecutionTimeout past the injected timeout, retried by retry_on_mongodb_error
+    like real transient errors. Failures are drawn from a seeded generator, so
+    runs are reproducible.
+
+    Workorders are written by the code of TracOSAdapter (WorkorderWriter), over
+    a bulk write that applies its requests to the dict. Single operations of a bulk
+    write can fail too, so its partial failure handling runs without MongoDB.
+    """
+
+    def __init__(
+        self,
+        faults: FaultInjection | None = None,
+        retry_policy: RetryPolicy | None = None,
+        update_mode: str = "full",
+        version_cache: VersionCache | None = None,
+    ):
+        if update_mode not in UPDATE_MODES:
+            raise ValueError(
+                f"Unsupported update mode {update_mode!r}, expected one of {UPDATE_MODES}"
+            )
+        self.faults = faults or FaultInjection()
+        self.random = random.Random(self.faults.seed)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = CircuitBreaker(
+            self.retry_policy.breaker_threshold, self.retry_policy.breaker_cooldown
+        )
+        self.update_mode = update_mode
+        self.delta_bytes_saved = 0
+        self.version_cache = (
+            version_cache if version_cache is not None else VersionCache(max_entries=0)
+        )
+        self.existence_filter: BloomFilter | None = None
+        # workorder documents by number, as stored in MongoDB
+        self.documents: dict[int, dict[str, Any]] = {}
+        self.watermarks: dict[str, Watermark] = {}
+        # round trips by operation, failed ones included
+        self.round_trips: Counter[str] = Counter()
+        self.injected_failures = 0
+        # numbers in insertion order, and how many the existence filter has seen
+        self._inserted: list[int] = []
+        self._scanned = 0
+
+    async def _round_trip(self, operation: str, documents: int = 0) -> None:
+        self.round_trips[operation] += 1
+        delay = self.faults.latency + documents * self.faults.item_latency
+        if self.faults.jitter:
+            delay += self.random.uniform(0, self.faults.jitter)
+        if self.faults.timeout and delay > self.faults.timeout:
+            await asyncio.sleep(self.faults.timeout)
+            self.injected_failures += 1
+            raise ExecutionTimeout(f"injected timeout in {operation}")
+        # a round trip always yields to the event loop, like socket I/O
+        await asyncio.sleep(delay)
+        if self.faults.failure_rate and self.random.random() < self.faults.failure_rate:
+            self.injected_failures += 1
+            raise AutoReconnect(f"injected failure in {operation}")
+
+    def insert_documents(self, documents: list[dict[str, Any]]) -> None:
+        """Stores documents as they are, without a round trip (test and benchmark
+        setup, or writes made by TracOS itself)"""
+        for doc in documents:
+            doc = {"_id": ObjectId(), **doc}
+            if doc["number"] not in self.documents:
+                self._inserted.append(doc["number"])
+            self.documents[doc["number"]] = doc
+
+    @retry_on_mongodb_error
+    async def ensure_indexes(self) -> None:
+        """Nothing to create: documents are keyed by number"""
+        await self._round_trip("ensure_indexes")
+
+    @retry_on_mongodb_error
+    async def check_connection(self) -> None:
+        await self._round_trip("check_connection")
+
+    @retry_on_mongodb_error
+    async def capture_workorder(self, orderNo: int) -> TracOSWorkorder | None:
+        await self._round_trip("capture_workorder")
+        doc = self.documents.get(orderNo)
+        if doc is None:
+            return None
+        try:
+            workorder = TracOSWorkorder.model_validate(self._workorder_fields(doc))
+        except ValidationError as e:
+            logger.error(f"Stored document not compliant with TracOSWorkorder: {e}")
+            return None
+        self._remember(workorder)
+        if self.existence_filter is not None:
+            self.existence_filter.add(orderNo)
+        return workorder
+
+    @staticmethod
+    def _workorder_fields(doc: dict[str, Any]) -> dict[str, Any]:
+        return {k: v for k, v in doc.items() if k not in LEASE_FIELDS}
+
+    def _injected_write_error(self, number: int) -> dict[str, Any] | None:
+        if number in self.faults.rejected_numbers:
+            return {"code": 121, "errmsg": f"injected validation error of #{number}"}
+        if (
+            self.faults.write_failure_rate
+            and self.random.random() < self.faults.write_failure_rate
+        ):
+            self.injected_failures += 1
+            return {"code": 189, "errmsg": f"injected write error of #{number}"}
+        return None
+
+    def _apply(self, index: int, request: UpdateOne, result: dict[str, Any]) -> None:
+        """Applies one request of a bulk write, counting it in result"""
+        query, update = request._filter, request._doc
+        stored = self.documents.get(query["number"])
+        if stored is None:
+            if request._upsert:
+                doc = {"_id": ObjectId(), **update["$setOnInsert"]}
+                self.insert_documents([doc])
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": index, "_id": doc["_id"]})
+            return
+        if not matches(stored, query):
+            return
+        result["nMatched"] += 1
+        updated = apply_update(stored, update)
+        if updated != stored:
+            self.documents[query["number"]] = updated
+            result["nModified"] += 1
+
+    @retry_on_mongodb_error
+    async def _bulk_write(self, requests: list[UpdateOne]) -> BulkWriteResult:
+        """collection.bulk_write(requests, ordered=False) over the dict"""
+        await self._round_trip("write_workorders", len(requests))
+        result: dict[str, Any] = {
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "upserted": [],
+            "writeErrors": [],
+        }
+        for index, request in enumerate(requests):
+            error = self._injected_write_error(request._filter["number"])
+            if error is not None:
+                result["writeErrors"].append({"index": index, **error})
+            else:
+                self._apply(index, request, result)
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, acknowledged=True)
+
+    @retry_on_mongodb_error
+    async def build_existence_filter(self, error_rate: float = 0.01) -> BloomFilter:
+        await self._round_trip("build_existence_filter")
+        bloom = BloomFilter(
+            max(2 * len(self.documents), EXISTENCE_FILTER_MIN_CAPACITY), error_rate
+        )
+        bloom.update(self._inserted)
+        self.existence_filter, self._scanned = bloom, len(self._inserted)
+        return bloom
+
+    async def load_existence_filter(
+        self, snapshot: Path, error_rate: float = 0.01
+    ) -> BloomFilter:
+        """Builds the existence filter: a scan of the dict costs less than a snapshot"""
+        return await self.build_existence_filter(error_rate)
+
+    @retry_on_mongodb_error
+    async def refresh_existence_filter(self) -> None:
+        """Adds the workorders inserted since the last scan"""
+        if self.existence_filter is None:
+            return
+        await self._round_trip("refresh_existence_filter")
+        if self.existence_filter.is_full:
+            await self.build_existence_filter(self.existence_filter.error_rate)
+            return
+        self.existence_filter.update(self._inserted[self._scanned :])
+        self._scanned = len(self._inserted)
+
+    def save_existence_filter(self, snapshot: Path) -> None:
+        """Nothing to save, the filter is rebuilt from the dict"""
+
+    def _unsynced(self) -> list[dict[str, Any]]:
+        return [doc for doc in self.documents.values() if not doc["isSynced"]]
+
+    @retry_on_mongodb_error
+    async def unsynced_number_ranges(self, partitions: int) -> list[NumberRange]:
+        """Splits the unsynced workorders into up to partitions number ranges of
+        about the same size, see TracOSAdapter.unsynced_number_ranges"""
+        await self._round_trip("unsynced_number_ranges")
+        numbers = sorted(doc["number"] for doc in self._unsynced())
+        if partitions <= 1 or not numbers:
+            return [NumberRange()]
+        size = math.ceil(len(numbers) / partitions)
+        return NumberRange.split(numbers[size::size])
+
+    def _claimable(
+        self,
+        batch_size: int,
+        after: Watermark | None,
+        numbers: NumberRange,
+        now: datetime,
+    ) -> list[dict[str, Any]]:
+        """The next page of unleased unsynced workorders, in (updatedAt, number) order"""
+        return sorted(
+            (
+                doc
+                for doc in self._unsynced()
+                if (doc.get("leaseExpiresAt") is None or doc["leaseExpiresAt"] <= now)
+                and (numbers.low is None or doc["number"] >= numbers.low)
+                and (numbers.high is None or doc["number"] < numbers.high)
+                and (
+                    after is None
+                    or (doc["updatedAt"], doc["number"])
+                    > (after.updated_at, after.number)
+                )
+            ),
+            key=lambda doc: (doc["updatedAt"], doc["number"]),
+        )[:batch_size]
+
+    @retry_on_mongodb_error
+    async def claim_unsynced_workorders(
+        self,
+        owner: str,
+        batch_size: int,
+        lease_seconds: float,
+        after: Watermark | None = None,
+        client_shape: bool = False,
+        numbers: NumberRange | None = None,
+    ) -> WorkorderLease:
+        """Leases up to batch_size unsynced workorders to owner, see
+        TracOSAdapter.claim_unsynced_workorders"""
+        numbers = numbers or NumberRange()
+        # the round trip takes as long as the page it reads; the page is taken
+        # after it, as other claims may have leased part of it meanwhile
+        await self._round_trip(
+            "claim_unsynced_workorders",
+            len(
+                self._claimable(batch_size, after, numbers, datetime.now(timezone.utc))
+            ),
+        )
+        now = datetime.now(timezone.utc)
+        candidates = self._claimable(batch_size, after, numbers, now)
+        watermark = (
+            Watermark(candidates[-1]["updatedAt"], candidates[-1]["number"])
+            if candidates
+            else None
+        )
+
+        lease_id = uuid4().hex
+        expires_at = now + timedelta(seconds=lease_seconds)
+        workorders, client_documents = [], []
+        for doc in candidates:
+            doc.update(leaseOwner=owner, leaseId=lease_id, leaseExpiresAt=expires_at)
+            if client_shape:
+                client_documents.append(project(doc, TRACOS_TO_CLIENT_PROJECTION))
+                continue
+            try:
+                workorders.append(
+                    TracOSWorkorder.model_validate(self._workorder_fields(doc))
+                )
+            except ValidationError as e:
+                logger.warning(f"Invalid workorder document skipped: {e}")
+        return WorkorderLease(
+            owner,
+            lease_id,
+            expires_at,
+            workorders,
+            len(candidates),
+            watermark,
+            client_documents,
+        )
+
+    @retry_on_mongodb_error
+    async def load_watermark(self, owner: str) -> Watermark | None:
+        await self._round_trip("load_watermark")
+        return self.watermarks.get(owner)
+
+    @retry_on_mongodb_error
+    async def save_watermark(self, owner: str, watermark: Watermark | None) -> None:
+        await self._round_trip("save_watermark")
+        if watermark is None:
+            self.watermarks.pop(owner, None)
+        else:
+            self.watermarks[owner] = watermark
+
+    @retry_on_mongodb_error
+    async def acknowledge_workorders(
+        self,
+        lease: WorkorderLease,
+        exported: list[TracOSWorkorder] | list[WorkorderVersion],
+    ) -> int:
+        """Marks exported workorders of a lease as synced and releases them, see
+        TracOSAdapter.acknowledge_workorders"""
+        if not exported:
+            return 0
+        await self._round_trip("acknowledge_workorders", len(exported))
+        synced_at = datetime.now(timezone.utc)
+        acknowledged = 0
+        for order in exported:
+            doc = self.documents.get(order.number)
+            if (
+                doc is None
+                or doc.get("leaseId") != lease.lease_id
+                or doc["updatedAt"] != order.updatedAt
+            ):
+                continue
+            doc.update(isSynced=True, syncedAt=synced_at)
+            for field in LEASE_FIELDS:
+                doc.pop(field, None)
+            acknowledged += 1
+        return acknowledged
@@ -0,0 +1,102 @@
+import os
+from dataclasses import dataclass
+from typing import Any
+
+SUPPORTED_COMPRESSORS = ("zlib", "snappy", "zstd")
+READ_CONCERN_LEVELS = ("local", "available", "majority", "linearizable", "snapshot")
+
+
+def _optional_int(value: str | None) -> int | None:
+    return int(value) if value not in (None, "") else None
+
+
+@dataclass(frozen=True)
+class MongoClientOptions:
+    """Driver options used by TracOSAdapter to build its Motor client"""
+
+    connect_timeout_ms: int = 5000
+    socket_timeout_ms: int = 5000
+    timeout_ms: int = 5000
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: int | None = None
+    compressors: tuple[str, ...] = ()
+    zlib_compression_level: int = -1
+    read_concern_level: str | None = None
+    write_concern_w: int | str | None = None
+    write_concern_journal: bool | None = None
+
+    def __post_init__(self):
+        for name in ("connect_timeout_ms", "socket_timeout_ms", "timeout_ms"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive")
+        if self.max_pool_size < 1:
+            raise ValueError("max_pool_size must be at least 1")
+        if not 0 <= self.min_pool_size <= self.max_pool_size:
+            raise ValueError("min_pool_size must be between 0 and max_pool_size")
+        if self.max_idle_time_ms is not None and self.max_idle_time_ms <= 0:
+            raise ValueError("max_idle_time_ms must be positive")
+        for compressor in self.compressors:
+            if compressor not in SUPPORTED_COMPRESSORS:
+                raise ValueError(
+                    f"Unsupported compressor {compressor!r}, expected one of {SUPPORTED_COMPRESSORS}"
+                )
+        if not -1 <= self.zlib_compression_level <= 9:
+            raise ValueError("zlib_compression_level must be between -1 and 9")
+        if (
+            self.read_concern_level is not None
+            and self.read_concern_level not in READ_CONCERN_LEVELS
+        ):
+            raise ValueError(
+                f"Unsupported read concern {self.read_concern_level!r}, expected one of {READ_CONCERN_LEVELS}"
+            )
+        if isinstance(self.write_concern_w, int) and self.write_concern_w < 0:
+            raise ValueError("write_concern_w must not be negative")
+
+    @classmethod
+    def from_env(cls) -> "MongoClientOptions":
+        """Reads MONGO_* environment variables, falling back to the defaults above"""
+        w = os.getenv("MONGO_WRITE_CONCERN_W") or None
+        journal = os.getenv("MONGO_WRITE_CONCERN_JOURNAL") or None
+        return cls(
+            connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+            socket_timeout_ms=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "5000")),
+            timeout_ms=int(os.getenv("MONGO_TIMEOUT_MS", "5000")),
+            max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+            min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+            max_idle_time_ms=_optional_int(os.getenv("MONGO_MAX_IDLE_TIME_MS")),
+            compressors=tuple(
+                c.strip()
+                for c in os.getenv("MONGO_COMPRESSORS", "").split(",")
+                if c.strip()
+            ),
+            zlib_compression_level=int(os.getenv("MONGO_ZLIB_COMPRESSION_LEVEL", "-1")),
+            read_concern_level=os.getenv("MONGO_READ_CONCERN") or None,
+            write_concern_w=int(w) if w is not None and w.isdigit() else w,
+            write_concern_journal=(
+                journal.lower() in ("1", "true", "yes") if journal is not None else None
+            ),
+        )
+
+    def as_client_kwargs(self) -> dict[str, Any]:
+        """Keyword arguments for AsyncIOMotorClient"""
+        kwargs: dict[str, Any] = {
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "timeoutMS": self.timeout_ms,
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+        }
+        if self.max_idle_time_ms is not None:
+            kwargs["maxIdleTimeMS"] = self.max_idle_time_ms
+        if self.compressors:
+            kwargs["compressors"] = ",".join(self.compressors)
+            if "zlib" in self.compressors:
+                kwargs["zlibCompressionLevel"] = self.zlib_compression_level
+        if self.read_concern_level is not None:
+            kwargs["readConcernLevel"] = self.read_concern_level
+        if self.write_concern_w is not None:
+            kwargs["w"] = self.write_concern_w
+        if self.write_concern_journal is not None:
+            kwargs["journal"] = self.write_concern_journal
+        return kwargs
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from functools import wraps
+from typing import Literal, NoReturn
+
+from loguru import logger
+from pymongo.errors import (
+    AutoReconnect,
+    BulkWriteError,
+    ExecutionTimeout,
+    OperationFailure,
+    PyMongoError,
+    WaitQueueTimeoutError,
+    WTimeoutError,
+)
+
+# Error labels attached by the server/driver to errors that are safe to retry
+TRANSIENT_ERROR_LABELS = frozenset(
+    {"RetryableWriteError", "TransientTransactionError", "ResetPool"}
+)
+
+# Server error codes seen during elections, shutdowns and network blips
+TRANSIENT_ERROR_CODES = frozenset(
+    {
+        6,  # HostUnreachable
+        7,  # HostNotFound
+        50,  # MaxTimeMSExpired
+        89,  # NetworkTimeout
+        91,  # ShutdownInProgress
+        189,  # PrimarySteppedDown
+        262,  # ExceededTimeLimit
+        9001,  # SocketException
+        10107,  # NotWritablePrimary
+        11600,  # InterruptedAtShutdown
+        11602,  # InterruptedDueToReplStateChange
+        13435,  # NotPrimaryNoSecondaryOk
+        13436,  # NotPrimaryOrSecondary
+    }
+)
+
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How TracOSAdapter retries failed MongoDB operations"""
+
+    max_attempts: int = 8
+    base_delay: float = 0.2  # seconds
+    max_delay: float = 10.0  # seconds
+    deadline: float = 120.0  # seconds, per operation, including pauses
+    breaker_threshold: int = 5  # consecutive failures before the circuit opens
+    breaker_cooldown: float = 15.0  # seconds the pipeline is paused once open
+    transient_labels: frozenset[str] = TRANSIENT_ERROR_LABELS
+    transient_codes: frozenset[int] = TRANSIENT_ERROR_CODES
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if self.base_delay < 0 or self.max_delay < self.base_delay:
+            raise ValueError("delays must satisfy 0 <= base_delay <= max_delay")
+        if self.deadline <= 0:
+            raise ValueError("deadline must be positive")
+        if self.breaker_threshold < 1 or self.breaker_cooldown < 0:
+            raise ValueError("invalid circuit breaker settings")
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Reads MONGO_RETRY_* / MONGO_BREAKER_* environment variables"""
+        return cls(
+            max_attempts=int(os.getenv("MONGO_RETRY_MAX_ATTEMPTS", "8")),
+            base_delay=float(os.getenv("MONGO_RETRY_BASE_DELAY", "0.2")),
+            max_delay=float(os.getenv("MONGO_RETRY_MAX_DELAY", "10")),
+            deadline=float(os.getenv("MONGO_RETRY_DEADLINE", "120")),
+            breaker_threshold=int(os.getenv("MONGO_BREAKER_THRESHOLD", "5")),
+            breaker_cooldown=float(os.getenv("MONGO_BREAKER_COOLDOWN", "15")),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the n-th (1-based) failed attempt"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def is_transient_code(self, code: int | None) -> bool:
+        return code in self.transient_codes
+
+    def is_transient(self, error: PyMongoError) -> bool:
+        """Whether retrying the operation that raised error can succeed"""
+        if any(error.has_error_label(label) for label in self.transient_labels):
+            return True
+        # network errors, elections (NotPrimaryError) and server selection timeouts
+        if isinstance(error, (AutoReconnect, WaitQueueTimeoutError)):
+            return True
+        if isinstance(error, (ExecutionTimeout, WTimeoutError)) or error.timeout:
+            return True
+        if isinstance(error, OperationFailure):
+            return self.is_transient_code(error.code)
+        return False
+
+
+class CircuitBreaker:
+    """Pauses every MongoDB caller after repeated consecutive failures"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.failures = 0  # failed attempts since the breaker was created
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> CircuitState:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    async def wait_until_closed(self) -> None:
+        """Sleeps while the circuit is open, letting a trial call through afterwards"""
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if remaining > 0:
+            logger.warning(f"MongoDB circuit open, pausing for {remaining:.1f}s")
+            await asyncio.sleep(remaining)
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("MongoDB circuit closed, resuming")
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    f"MongoDB circuit opened after {self.consecutive_failures} consecutive failures"
+                )
+            self.opened_at = time.monotonic()
+
+
+class MongoDBUnavailable(Exception):
+    """A MongoDB operation was given up on: its retries ran out, or its error
+    cannot be retried. The cycle that ran it cannot go on; the entry point
+    decides whether the process exits."""
+
+    def __init__(self, operation: str):
+        super().__init__(f"Gave up on {operation} after MongoDB errors")
+        self.operation = operation
+
+
+def give_up(operation: str, error: Exception) -> NoReturn:
+    logger.critical(f"Giving up on {operation} due to MongoDB errors")
+    raise MongoDBUnavailable(operation) from error
+
+
+def retry_on_mongodb_error(func):
+    """Decorator for TracOSAdapter methods retrying transient MongoDB errors.
+
+    Uses the adapter's retry_policy and circuit_breaker. BulkWriteError is left to
+    the caller, which knows which operations of the batch have to be retried.
+    """
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        policy: RetryPolicy = self.retry_policy
+        breaker: CircuitBreaker = self.circuit_breaker
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await breaker.wait_until_closed()
+            attempt += 1
+            try:
+                result = await func(self, *args, **kwargs)
+            except BulkWriteError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"MongoDB error in {func.__name__}: {e}")
+                # an error the policy does not know as transient is retried once
+                max_attempts = (
+                    policy.max_attempts
+                    if policy.is_transient(e)
+                    else min(2, policy.max_attempts)
+                )
+                breaker.record_failure()
+                delay = policy.backoff(attempt)
+                elapsed = time.monotonic() - started
+                if attempt >= max_attempts or elapsed + delay > policy.deadline:
+                    give_up(func.__name__, e)
+                logger.info(
+                    f"Retrying {func.__name__} in {delay:.2f}s (attempt {attempt + 1}/{policy.max_attempts})..."
+                )
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+
+    return wrapper
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+BUNDLE_FORMATS = ("tar.gz", "zip")
+MANIFEST_NAME = "manifest.json"
+
+
+class OutboundBundler:
+    """Packs exported workorder files into compressed bundles for the client.
+
+    Every bundle holds up to max_files exports plus a manifest.json listing them
+    with their size and sha256. A bundle is written under a temporary dotfile name
+    and renamed into bundle_dir once complete, so the client never picks up a
+    partial archive. Exports are deleted only after their bundle is in place: a
+    crash in between bundles them again in the next run, which is harmless since
+    the client imports workorders by orderNo.
+    """
+
+    def __init__(
+        self,
+        outbound_dir: Path,
+        bundle_dir: Path,
+        format: str = "tar.gz",
+        max_files: int = 1000,
+    ):
+        if format not in BUNDLE_FORMATS:
+            raise ValueError(
+                f"Unsupported bundle format {format!r}, expected one of {BUNDLE_FORMATS}"
+            )
+        if max_files < 1:
+            raise ValueError("max_files must be at least 1")
+        self.outbound_dir = outbound_dir
+        self.bundle_dir = bundle_dir
+        self.format = format
+        self.max_files = max_files
+
+    def completed_exports(self) -> list[Path]:
+        """Exported files of the outbound directory and its layout subdirectories"""
+        exports = [
+            path
+            for path in self.outbound_dir.rglob("*.json")
+            if not path.name.startswith(".") and self.bundle_dir not in path.parents
+        ]
+        return sorted(exports)
+
+    def bundle(self) -> list[Path]:
+        """Bundles every completed export, returning the bundles written"""
+        exports = self.completed_exports()
+        if not exports:
+            return []
+        self.bundle_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        bundles = []
+        for i in range(0, len(exports), self.max_files):
+            name = f"workorders-{stamp}-{i // self.max_files:04d}.{self.format}"
+            bundle = self._write_bundle(name, exports[i : i + self.max_files])
+            if bundle is None:
+                break
+            bundles.append(bundle)
+        return bundles
+
+    @staticmethod
+    def _version(path: Path) -> tuple[int, int]:
+        """Changes when an export is rewritten (written files are renamed into place)"""
+        stat = path.stat()
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _add(self, archive: Any, name: str, content: bytes) -> None:
+        if self.format == "zip":
+            archive.writestr(name, content)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = int(datetime.now(timezone.utc).timestamp())
+            archive.addfile(info, io.BytesIO(content))
+
+    def _write_bundle(self, name: str, exports: list[Path]) -> Path | None:
+        target = self.bundle_dir / name
+        partial = self.bundle_dir / f".{name}.tmp"
+        try:
+            # read each export once: the bundle and its manifest hold the same version
+            contents = {}
+            versions = {}
+            for path in exports:
+                versions[path] = self._version(path)
+                contents[
+                    path.relative_to(self.outbound_dir).as_posix()
+                ] = path.read_bytes()
+            manifest = {
+                "bundle": name,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "count": len(contents),
+                "files": [
+                    {
+                        "name": member,
+                        "size": len(content),
+                        "sha256": hashlib.sha256(content).hexdigest(),
+                    }
+                    for member, content in contents.items()
+                ],
+            }
+            if self.format == "zip":
+                archive = zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED)
+            else:
+                archive = tarfile.open(partial, "w:gz")
+            with archive:
+                self._add(
+                    archive, MANIFEST_NAME, json.dumps(manifest, indent=2).encode()
+                )
+                for member, content in contents.items():
+                    self._add(archive, member, content)
+            os.replace(partial, target)
+        except OSError as e:
+            logger.error(f"Could not write bundle {target}: {e}")
+            partial.unlink(missing_ok=True)
+            return None
+
+        for path, version in versions.items():
+            try:
+                # an export rewritten since it was read goes into the next bundle
+                if self._version(path) == version:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        logger.success(f"Bundled {len(exports)} workorders into {target}")
+        return target
@@ -0,0 +1,32 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ScanOptions:
+    """How ClientERP.scan_json_files walks the inbound directory.
+
+    A run takes at most max_files files and max_bytes bytes (0 means no limit),
+    so a large backlog drains over several bounded runs. With sharded, files in
+    subdirectories (e.g. inbound/2025-06-01/) are scanned too, shard by shard in
+    name order, which is oldest first for date-named shards.
+    """
+
+    oldest_first: bool = True
+    max_files: int = 0
+    max_bytes: int = 0
+    sharded: bool = False
+
+    def __post_init__(self):
+        if self.max_files < 0 or self.max_bytes < 0:
+            raise ValueError("max_files and max_bytes must not be negative")
+
+    @classmethod
+    def from_env(cls) -> "ScanOptions":
+        return cls(
+            oldest_first=os.getenv("INBOUND_ORDER", "oldest").lower() == "oldest",
+            max_files=int(os.getenv("INBOUND_MAX_FILES", "0")),
+            max_bytes=int(os.getenv("INBOUND_MAX_BYTES", "0")),
+            sharded=os.getenv("INBOUND_SHARDED", "false").lower()
+            in ("1", "true", "yes"),
+        )
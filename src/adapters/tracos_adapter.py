@@ -1,53 +1,506 @@
-import os
-import sys
-from functools import wraps
-from datetime import datetime, timezone
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, NamedTuple
+from uuid import uuid4
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import PyMongoError
+from pymongo import UpdateOne
+from pymongo.results import BulkWriteResult
+from pymongo.errors import BulkWriteError, PyMongoError
 from loguru import logger
 
 from pydantic_core import ValidationError
 
+from adapters.mongo_options import MongoClientOptions
+from adapters.mongo_retry import (
+    CircuitBreaker,
+    RetryPolicy,
+    give_up,
+    retry_on_mongodb_error,
+)
+from adapters.version_cache import VersionCache
 from models.tracOS_models import TracOSWorkorder
+from services.bloom_filter import BloomFilter
+from services.delta import document_delta, encoded_size
+from services.fingerprint import workorder_fingerprint
+from services.translator import TRACOS_TO_CLIENT_PROJECTION
 
-# MongoDB constants
-CONNECTTIMEOUTMS = 5000
-SOCKETTIMEOUTMS = 5000
-TIMEOUTMS = 5000
+DUPLICATE_KEY_ERROR = 11000
 
+# Bookkeeping fields of a workorder document that are not part of TracOSWorkorder
+LEASE_FIELDS = ("leaseOwner", "leaseId", "leaseExpiresAt")
+WORKORDER_PROJECTION = {field: 0 for field in LEASE_FIELDS}
 
-def retry_on_mongodb_error(func):
-    """Decorator for MongoDB error handling with one extra retry"""
+# Pages of the outbound scan are range queries in (updatedAt, number) order over
+# this partial index, which only holds unsynced workorders
+OUTBOUND_SCAN_INDEX = [("updatedAt", 1), ("number", 1)]
+WATERMARK_COLLECTION = "sync_watermarks"
+
+# The existence filter is sized for twice the collection, and at least this many
+EXISTENCE_FILTER_MIN_CAPACITY = 100_000
+# Documents inserted shortly before a snapshot may carry an _id from a skewed clock
+SNAPSHOT_CATCH_UP_MARGIN = timedelta(minutes=5)
+
+# full: $set the whole document; delta: $set/$unset only the fields that changed
+UPDATE_MODES = ("full", "delta")
+
+
+def motor_client(
+    uri: str, options: MongoClientOptions | None = None
+) -> AsyncIOMotorClient:
+    """Motor client returning UTC-aware datetimes, as TracOSWorkorder requires"""
+    options = options or MongoClientOptions()
+    return AsyncIOMotorClient(
+        uri, tz_aware=True, tzinfo=timezone.utc, **options.as_client_kwargs()
+    )
+
+
+@dataclass(frozen=True)
+class Watermark:
+    """Position of the outbound scan: the last workorder visited, in (updatedAt, number) order"""
+
+    updated_at: datetime
+    number: int
+
+    def after(self) -> dict[str, Any]:
+        """Range filter for the workorders that come after this position"""
+        return {
+            "$or": [
+                {"updatedAt": {"$gt": self.updated_at}},
+                {"updatedAt": self.updated_at, "number": {"$gt": self.number}},
+            ]
+        }
+
+
+@dataclass(frozen=True)
+class NumberRange:
+    """Workorder numbers from low (inclusive) to high (exclusive), None: unbounded"""
+
+    low: int | None = None
+    high: int | None = None
+
+    def filter(self) -> dict[str, Any]:
+        bounds = {}
+        if self.low is not None:
+            bounds["$gte"] = self.low
+        if self.high is not None:
+            bounds["$lt"] = self.high
+        return {"number": bounds} if bounds else {}
+
+    @classmethod
+    def split(cls, boundaries: list[int]) -> list["NumberRange"]:
+        """Consecutive ranges covering every number, split at the sorted boundaries"""
+        edges = [None, *boundaries, None]
+        return [cls(low, high) for low, high in zip(edges, edges[1:])]
+
+    def __str__(self) -> str:
+        low = "" if self.low is None else self.low
+        high = "" if self.high is None else self.high
+        return f"[{low}, {high})"
+
+
+@dataclass
+class WriteResult:
+    """Outcome of write_workorders"""
+
+    written: int = 0  # documents inserted or modified
+    # workorders that failed with an error that is not retried, by number
+    failed: dict[int, str] = field(default_factory=dict)
+
+
+class WorkorderVersion(NamedTuple):
+    """The stored version of a workorder an export was made from"""
+
+    number: int
+    updatedAt: datetime
+
+
+@dataclass(frozen=True)
+class WorkorderLease:
+    """A batch of unsynced workorders claimed by one exporter until expires_at"""
+
+    owner: str
+    lease_id: str
+    expires_at: datetime
+    workorders: list[TracOSWorkorder]
+    claimed: int  # documents leased, including invalid ones that were skipped
+    # last workorder of the scanned page, None once the scan reached the end
+    watermark: Watermark | None = None
+    # with server-side translation: the leased workorders in client shape
+    # (TRACOS_TO_CLIENT_PROJECTION), and workorders is empty
+    client_documents: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def versions(self) -> list[WorkorderVersion]:
+        """(number, updatedAt) of every leased workorder, to acknowledge exports"""
+        if self.client_documents:
+            return [
+                WorkorderVersion(doc["orderNo"], doc["lastUpdateDate"])
+                for doc in self.client_documents
+            ]
+        return [WorkorderVersion(o.number, o.updatedAt) for o in self.workorders]
 
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        try:
-            return await func(*args, **kwargs)
-        except PyMongoError as e:
-            logger.error(f"MongoDB error in {func.__name__}: {e}")
-            logger.info(f"Retrying {func.__name__}...")
-            try:
-                return await func(*args, **kwargs)
-            except PyMongoError as retry_error:
-                logger.error(f"Retry failed: {retry_error}")
-                logger.critical("Shutting down due to MongoDB errors")
-                sys.exit(1)
 
-    return wrapper
+class WorkorderWriter:
+    """The write path of workorders, over the unordered bulk write of _bulk_write.
 
+    Shared by TracOSAdapter and InMemoryTracOSAdapter, which provide _bulk_write
+    and the attributes it relies on: update_mode, delta_bytes_saved,
+    version_cache, existence_filter, retry_policy and circuit_breaker.
+    """
 
-class TracOSAdapter:
-    def __init__(self, uri: str, db: str, collection: str):
-        self.client = AsyncIOMotorClient(
-            uri,
-            tz_aware=True,
-            tzinfo=timezone.utc,
-            connectTimeoutMS=CONNECTTIMEOUTMS,
-            socketTimeoutMS=SOCKETTIMEOUTMS,
-            timeoutMS=TIMEOUTMS,
+    def _remember(
+        self, order: TracOSWorkorder, content_hash: str | None = None
+    ) -> None:
+        self.version_cache.put(
+            order.number, order.updatedAt, content_hash or order.contentHash
         )
+
+    @staticmethod
+    def _synced_document(order: TracOSWorkorder) -> dict[str, Any]:
+        """Dumps TracOSWorkorder as a MongoDB document flagged as synced, with its content hash"""
+        synced_order = order.model_copy(
+            update={
+                "isSynced": True,
+                "syncedAt": datetime.now(timezone.utc),
+                "contentHash": workorder_fingerprint(order),
+            }
+        )
+        return synced_order.model_dump(
+            by_alias=True, exclude_none=True, exclude={"_id"}
+        )
+
+    @staticmethod
+    def _changed_content_filter(order: TracOSWorkorder) -> dict[str, Any]:
+        """Matches documents whose content differs from order.
+
+        A document is considered unchanged when its stored contentHash equals the
+        fingerprint of order and it is synced (changes made in TracOS mark a
+        document as unsynced without refreshing its hash).
+        """
+        return {
+            "$or": [
+                {"contentHash": {"$ne": workorder_fingerprint(order)}},
+                {"isSynced": False},
+            ]
+        }
+
+    def _delta_update(
+        self, order: TracOSWorkorder, current: TracOSWorkorder
+    ) -> tuple[dict[str, Any], dict[str, Any], int]:
+        """Filter and update that only touch the fields of current that order changes,
+        and the bytes the update saves over a full one.
+
+        The delta is only valid against the version it was computed from, so the
+        filter requires the stored updatedAt to still be current.updatedAt: if the
+        document changed since it was read, nothing is written.
+        """
+        document = self._synced_document(order)
+        delta = document_delta(
+            current.model_dump(by_alias=True, exclude_none=True, exclude={"_id"}),
+            document,
+        )
+        unset = {field: "" for field in delta.unset + LEASE_FIELDS}
+        update = {"$set": delta.set, "$unset": unset}
+        full_update = {"$set": document, "$unset": unset}
+        saved = encoded_size(full_update) - encoded_size(update)
+        return {"number": order.number, "updatedAt": current.updatedAt}, update, saved
+
+    def _insert_request(self, order: TracOSWorkorder) -> UpdateOne:
+        """Idempotent insert: replaying it after a lost acknowledgement is harmless"""
+        return UpdateOne(
+            {"number": order.number},
+            {"$setOnInsert": self._synced_document(order)},
+            upsert=True,
+        )
+
+    def _update_request(
+        self, order: TracOSWorkorder, current: TracOSWorkorder | None = None
+    ) -> tuple[UpdateOne, int]:
+        """Conditional update: never overwrites a document with a newer updatedAt,
+        and skips the write when the content did not change.
+
+        Returns the request and the bytes it saves over a full update (0 unless
+        update_mode is "delta").
+        """
+        if self.update_mode == "delta" and current is not None:
+            filter, update, saved = self._delta_update(order, current)
+            return UpdateOne(filter, update), saved
+        request = UpdateOne(
+            {
+                "number": order.number,
+                "updatedAt": {"$lt": order.updatedAt},
+                **self._changed_content_filter(order),
+            },
+            {
+                "$set": self._synced_document(order),
+                # an export in flight for the overwritten version must not be acknowledged
+                "$unset": {field: "" for field in LEASE_FIELDS},
+            },
+        )
+        return request, 0
+
+    async def _bulk_write(self, requests: list[UpdateOne]) -> BulkWriteResult:
+        """collection.bulk_write(requests, ordered=False), retried like it"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _existing_inserts(
+        pending: list[tuple[TracOSWorkorder, bool]],
+        upserted: set[int],
+        failed: set[int],
+    ) -> list[tuple[TracOSWorkorder, bool]]:
+        """Inserts that matched a stored document, as updates: $setOnInsert wrote nothing"""
+        return [
+            (order, False)
+            for index, (order, is_insert) in enumerate(pending)
+            if is_insert and index not in upserted and index not in failed
+        ]
+
+    def _remember_bulk_write(
+        self,
+        pending: list[tuple[TracOSWorkorder, bool]],
+        upserted: set[int],
+        failed: set[int],
+        matched: int,
+    ) -> None:
+        """Caches the versions written by a bulk write, by operation index.
+
+        Upserted inserts are known to be stored. Updates are only cached when every
+        operation that did not fail matched a document: the result does not tell
+        which update was skipped, and a skipped one may leave an older version
+        stored, which the cache must never overstate.
+        """
+        all_matched = matched + len(upserted) == len(pending) - len(failed)
+        for index, (order, is_insert) in enumerate(pending):
+            if index in upserted and self.existence_filter is not None:
+                self.existence_filter.add(order.number)
+            if index in upserted or (
+                all_matched and not is_insert and index not in failed
+            ):
+                self._remember(order, workorder_fingerprint(order))
+            else:
+                self.version_cache.invalidate(order.number)
+
+    def _stale_deltas(
+        self,
+        pending: list[tuple[TracOSWorkorder, bool]],
+        current: dict[int, TracOSWorkorder],
+        upserted: set[int],
+        failed: set[int],
+        matched: int,
+    ) -> list[tuple[TracOSWorkorder, bool]]:
+        """Delta updates to retry as full ones, after a bulk write in which some
+        operation matched nothing.
+
+        A delta update matches nothing when the document changed since its current
+        version was read, and the result does not tell which operation it was. So
+        every delta update is retried as a full update, whose own filter skips the
+        documents already written and never overwrites a newer one.
+        """
+        if matched + len(upserted) == len(pending) - len(failed):
+            return []
+        return [
+            (order, False)
+            for index, (order, is_insert) in enumerate(pending)
+            if not is_insert
+            and index not in failed
+            and self.update_mode == "delta"
+            and order.number in current
+        ]
+
+    def _count_delta_savings(
+        self,
+        pending: list[tuple[TracOSWorkorder, bool]],
+        savings: list[int],
+        failed: set[int],
+        modified: int,
+    ) -> None:
+        """Adds the bytes saved by the delta updates of a bulk write to delta_bytes_saved.
+
+        The result only counts modified documents, without telling which updates
+        they came from, so the smallest savings are counted: at least modified
+        minus the number of full updates sent were delta updates that modified
+        their document. When every update was modified, that is all of them.
+        """
+        deltas = []
+        full_updates = 0
+        for index, (_, is_insert) in enumerate(pending):
+            if is_insert or index in failed:
+                continue
+            if savings[index]:
+                deltas.append(savings[index])
+            else:
+                full_updates += 1
+        modified_deltas = max(0, modified - full_updates)
+        self.delta_bytes_saved += sum(sorted(deltas)[:modified_deltas])
+
+    async def write_workorders(
+        self,
+        inserts: list[TracOSWorkorder],
+        updates: list[TracOSWorkorder],
+        current: dict[int, TracOSWorkorder] | None = None,
+    ) -> WriteResult:
+        """Writes a batch of new and updated workorders with a single unordered bulk write.
+
+        current maps workorder numbers to their stored version, used to build delta
+        updates when update_mode is "delta".
+
+        When the bulk write partially fails, only the operations that failed with a
+        transient error are retried. An insert that loses a race against another
+        worker (duplicate key), or that finds the document already stored (inserts
+        classified as new by the existence filter), is retried as a conditional
+        update. The workorders of the other failed operations are reported in the
+        result, next to the number of documents written.
+        """
+        current = dict(current or {})  # stale versions are dropped from it
+        pending = [(o, True) for o in inserts] + [(o, False) for o in updates]
+        written = 0
+        failed_orders: dict[int, str] = {}
+        attempt = 0
+        started = time.monotonic()
+
+        while pending:
+            built = [
+                (
+                    (self._insert_request(order), 0)
+                    if is_insert
+                    else self._update_request(order, current.get(order.number))
+                )
+                for order, is_insert in pending
+            ]
+            requests = [request for request, _ in built]
+            savings = [saved for _, saved in built]
+            try:
+                result = await self._bulk_write(requests)
+                written += result.upserted_count + result.modified_count
+                self._count_delta_savings(
+                    pending, savings, set(), result.modified_count
+                )
+                upserted = set(result.upserted_ids)
+                self._remember_bulk_write(
+                    pending, upserted, set(), result.matched_count
+                )
+                stale = self._stale_deltas(
+                    pending, current, upserted, set(), result.matched_count
+                )
+                for order, _ in stale:
+                    del current[order.number]
+                pending = self._existing_inserts(pending, upserted, set()) + stale
+            except BulkWriteError as e:
+                details = e.details
+                written += details.get("nUpserted", 0) + details.get("nModified", 0)
+                upserted = {upsert["index"] for upsert in details.get("upserted", [])}
+                failed = {error["index"] for error in details.get("writeErrors", [])}
+                self._count_delta_savings(
+                    pending, savings, failed, details.get("nModified", 0)
+                )
+                self._remember_bulk_write(
+                    pending, upserted, failed, details.get("nMatched", 0)
+                )
+                stale = self._stale_deltas(
+                    pending, current, upserted, failed, details.get("nMatched", 0)
+                )
+                retryable = self._existing_inserts(pending, upserted, failed) + stale
+                transient_failures = 0
+                for error in details.get("writeErrors", []):
+                    order, is_insert = pending[error["index"]]
+                    if is_insert and error.get("code") == DUPLICATE_KEY_ERROR:
+                        # stored version unknown: falls back to a full update
+                        retryable.append((order, False))
+                    elif self.retry_policy.is_transient_code(error.get("code")):
+                        retryable.append((order, is_insert))
+                        transient_failures += 1
+                    else:
+                        logger.warning(f"Bulk operation failed: {error.get('errmsg')}")
+                        failed_orders[order.number] = error.get("errmsg", "")
+                for error in details.get("writeConcernErrors", []):
+                    logger.warning(f"Write concern error: {error.get('errmsg')}")
+                if not retryable:
+                    break
+                for order, _ in stale:
+                    del current[order.number]
+
+                if transient_failures:
+                    attempt += 1
+                    self.circuit_breaker.record_failure()
+                    delay = self.retry_policy.backoff(attempt)
+                    elapsed = time.monotonic() - started
+                    if (
+                        attempt >= self.retry_policy.max_attempts
+                        or elapsed + delay > self.retry_policy.deadline
+                    ):
+                        give_up("write_workorders", e)
+                    logger.info(
+                        f"Retrying {len(retryable)} of {len(pending)} bulk operations in {delay:.2f}s..."
+                    )
+                    await asyncio.sleep(delay)
+                    await self.circuit_breaker.wait_until_closed()
+                pending = retryable
+
+        logger.success(f"Wrote {written} workorders in bulk")
+        return WriteResult(written, failed_orders)
+
+
+class TracOSAdapter(WorkorderWriter):
+    def __init__(
+        self,
+        uri: str,
+        db: str,
+        collection: str,
+        options: MongoClientOptions | None = None,
+        retry_policy: RetryPolicy | None = None,
+        update_mode: str = "full",
+        version_cache: VersionCache | None = None,
+        client: AsyncIOMotorClient | None = None,
+    ):
+        """client: a Motor client shared with other adapters (see motor_client),
+        whose pool and options are then used instead of uri and options"""
+        if update_mode not in UPDATE_MODES:
+            raise ValueError(
+                f"Unsupported update mode {update_mode!r}, expected one of {UPDATE_MODES}"
+            )
+        self.options = options or MongoClientOptions()
+        self.client = client or motor_client(uri, self.options)
         self.db = self.client[db]
         self.collection = self.db[collection]
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = CircuitBreaker(
+            self.retry_policy.breaker_threshold, self.retry_policy.breaker_cooldown
+        )
+        self.update_mode = update_mode
+        # update bytes not sent thanks to delta updates, since the adapter was made
+        self.delta_bytes_saved = 0
+        # stored versions seen by this process, disabled unless one is given
+        self.version_cache = (
+            version_cache if version_cache is not None else VersionCache(max_entries=0)
+        )
+        # numbers of stored workorders, None until load_existence_filter
+        self.existence_filter: BloomFilter | None = None
+        self.existence_scanned_at: datetime | None = None
+
+    @retry_on_mongodb_error
+    async def ensure_indexes(self) -> None:
+        """Creates the unique index on number that keeps concurrent workers from inserting duplicates"""
+        try:
+            await self.collection.create_index("number", unique=True)
+        except PyMongoError as e:
+            if self.retry_policy.is_transient(e):
+                raise
+            logger.warning(f"Could not create unique index on number: {e}")
+        try:
+            await self.collection.create_index(
+                OUTBOUND_SCAN_INDEX,
+                name="unsynced_updatedAt_number",
+                partialFilterExpression={"isSynced": False},
+            )
+        except PyMongoError as e:
+            if self.retry_policy.is_transient(e):
+                raise
+            logger.warning(f"Could not create outbound scan index: {e}")
 
     @retry_on_mongodb_error
     async def check_connection(self):
@@ -63,7 +516,9 @@ class TracOSAdapter:
         logger.info(
             f"Querying {self.collection.name} collection for workorder #{orderNo}"
         )
-        doc = await self.collection.find_one({"number": orderNo})
+        doc = await self.collection.find_one(
+            {"number": orderNo}, projection=WORKORDER_PROJECTION
+        )
 
         if doc is None:
             logger.info(
@@ -80,71 +535,280 @@ class TracOSAdapter:
             logger.error(f"Errors:{e.errors()}")
             return None
 
+        self._remember(workorder)
+        if self.existence_filter is not None:
+            self.existence_filter.add(orderNo)
         return workorder
 
     @retry_on_mongodb_error
-    async def insert_workorder(self, order: TracOSWorkorder) -> None:
-        """Transforms TracOSWorkorder and adds it do MongoDB instance"""
-        synced_order = order.model_copy(
-            update={"isSynced": True, "syncedAt": datetime.now(timezone.utc)}
+    async def _bulk_write(self, requests: list[UpdateOne]) -> BulkWriteResult:
+        return await self.collection.bulk_write(requests, ordered=False)
+
+    @retry_on_mongodb_error
+    async def _scan_numbers(
+        self, bloom: BloomFilter, query: dict[str, Any], hint: Any = None
+    ) -> int:
+        """Adds the numbers of the documents matching query to bloom"""
+        cursor = self.collection.find(query, projection={"number": 1, "_id": 0})
+        if hint is not None:
+            cursor = cursor.hint(hint)
+        scanned = 0
+        async for doc in cursor:
+            if isinstance(doc.get("number"), int):
+                bloom.add(doc["number"])
+            scanned += 1
+        return scanned
+
+    @retry_on_mongodb_error
+    async def _number_index_stats(self) -> tuple[int, bool]:
+        """Estimated document count, and whether the number index exists"""
+        estimate = await self.collection.estimated_document_count()
+        indexes = await self.collection.index_information()
+        return estimate, "number_1" in indexes
+
+    async def build_existence_filter(self, error_rate: float = 0.01) -> BloomFilter:
+        """Builds the existence filter from a covered scan of the number index"""
+        estimate, indexed = await self._number_index_stats()
+        bloom = BloomFilter(
+            max(2 * estimate, EXISTENCE_FILTER_MIN_CAPACITY), error_rate
+        )
+        scanned_at = datetime.now(timezone.utc)
+        # without the index (ensure_indexes failed), a collection scan does the job
+        hint = [("number", 1)] if indexed else None
+        scanned = await self._scan_numbers(bloom, {}, hint=hint)
+        self.existence_filter, self.existence_scanned_at = bloom, scanned_at
+        logger.info(
+            f"Built existence filter of {scanned} workorders ({bloom.memory_bytes} bytes)"
         )
+        return bloom
+
+    async def load_existence_filter(
+        self, snapshot: Path, error_rate: float = 0.01
+    ) -> BloomFilter:
+        """Loads the existence filter from a snapshot, or builds it when there is none.
 
-        document = synced_order.model_dump(by_alias=True, exclude_none=True)
+        The snapshot is brought up to date by scanning the documents inserted since
+        it was taken. A number missing from the filter anyway (e.g. a restored
+        backup with old _ids) only costs a retry: its insert matches the stored
+        document and is retried as an update.
+        """
         try:
-            result = await self.collection.insert_one(document)
-            logger.success(
-                f"Added workorder #{order.number} to MongoDB instance: _id: {result.inserted_id}"
-            )
-        except Exception as e:
-            logger.warning(f"Exception: {e}")
+            bloom, header = BloomFilter.load(snapshot)
+            scanned_at = datetime.fromisoformat(header["scannedAt"])
+            if header.get("collection") != self.collection.full_name:
+                raise ValueError("snapshot of another collection")
+        except FileNotFoundError:
+            return await self.build_existence_filter(error_rate)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring existence filter snapshot {snapshot}: {e}")
+            return await self.build_existence_filter(error_rate)
+        if bloom.is_full or bloom.error_rate != error_rate:
+            return await self.build_existence_filter(error_rate)
+
+        self.existence_filter, self.existence_scanned_at = bloom, scanned_at
+        await self.refresh_existence_filter()
+        logger.info(f"Loaded existence filter of {bloom.count} workorders")
+        return bloom
+
+    async def refresh_existence_filter(self) -> None:
+        """Adds the documents inserted since the last scan, by other workers included"""
+        if self.existence_filter is None:
+            return
+        if self.existence_filter.is_full:
+            await self.build_existence_filter(self.existence_filter.error_rate)
+            return
+        scanned_at = datetime.now(timezone.utc)
+        since = ObjectId.from_datetime(
+            self.existence_scanned_at - SNAPSHOT_CATCH_UP_MARGIN
+        )
+        await self._scan_numbers(self.existence_filter, {"_id": {"$gte": since}})
+        self.existence_scanned_at = scanned_at
+
+    def save_existence_filter(self, snapshot: Path) -> None:
+        if self.existence_filter is None:
+            return
+        self.existence_filter.save(
+            snapshot,
+            collection=self.collection.full_name,
+            scannedAt=self.existence_scanned_at.isoformat(),
+        )
 
     @retry_on_mongodb_error
-    async def update_workorder(self, order: TracOSWorkorder) -> None:
-        """Transforms TracOSWorkorder and updates corresponding MongoDB document"""
-        synced_order = order.model_copy(
-            update={"isSynced": True, "syncedAt": datetime.now(timezone.utc)}
+    async def unsynced_number_ranges(self, partitions: int) -> list[NumberRange]:
+        """Splits the unsynced workorders into up to partitions number ranges of
+        about the same size ($bucketAuto). The ranges are unbounded at both ends,
+        so workorders that become unsynced later still fall in one of them"""
+        if partitions <= 1:
+            return [NumberRange()]
+        buckets = self.collection.aggregate(
+            [
+                {"$match": {"isSynced": False}},
+                {"$project": {"_id": 0, "number": 1}},
+                {"$bucketAuto": {"groupBy": "$number", "buckets": partitions}},
+            ]
         )
+        # a bucket holds numbers from its min up to the next bucket's min
+        lows = sorted([bucket["_id"]["min"] async for bucket in buckets])
+        return NumberRange.split(lows[1:])
 
-        document = synced_order.model_dump(
-            by_alias=True, exclude_none=True, exclude={"_id"}
+    @retry_on_mongodb_error
+    async def claim_unsynced_workorders(
+        self,
+        owner: str,
+        batch_size: int,
+        lease_seconds: float,
+        after: Watermark | None = None,
+        client_shape: bool = False,
+        numbers: NumberRange | None = None,
+    ) -> WorkorderLease:
+        """Atomically leases up to batch_size unsynced workorders to owner.
+
+        Workorders leased by another exporter are skipped until their lease expires,
+        so several exporters can drain the backlog without exporting an order twice.
+        Lease expiry is computed with the server clock ($$NOW), which makes it
+        independent of clock skew between exporter hosts.
+
+        Workorders are scanned in (updatedAt, number) order starting after the
+        given watermark; the returned lease carries the watermark of the page.
+
+        With numbers, only workorders of that number range are scanned, so several
+        coroutines can drain disjoint partitions of the backlog concurrently.
+
+        With client_shape, the leased documents are read back through
+        TRACOS_TO_CLIENT_PROJECTION into lease.client_documents, translated by the
+        server instead of validated as TracOSWorkorder.
+        """
+        lease_id = uuid4().hex
+        claimable = {
+            "isSynced": False,
+            # missing/null leaseExpiresAt sorts before any date
+            "$expr": {"$lte": ["$leaseExpiresAt", "$$NOW"]},
+        }
+        page = {**claimable, **(numbers.filter() if numbers is not None else {})}
+        if after is not None:
+            page.update(after.after())
+        candidates = (
+            self.collection.find(page, projection={"updatedAt": 1, "number": 1})
+            .sort(OUTBOUND_SCAN_INDEX)
+            .limit(batch_size)
+        )
+        candidate_docs = [doc async for doc in candidates]
+        candidate_ids = [doc["_id"] for doc in candidate_docs]
+        watermark = (
+            Watermark(candidate_docs[-1]["updatedAt"], candidate_docs[-1]["number"])
+            if candidate_docs
+            else None
         )
+        expires_at = datetime.now(timezone.utc)
 
-        try:
-            result = await self.collection.update_one(
-                {"number": order.number}, {"$set": document}
+        if candidate_ids:
+            await self.collection.update_many(
+                {"_id": {"$in": candidate_ids}, **claimable},
+                [
+                    {
+                        "$set": {
+                            "leaseOwner": owner,
+                            "leaseId": lease_id,
+                            "leaseExpiresAt": {
+                                "$add": ["$$NOW", int(lease_seconds * 1000)]
+                            },
+                        }
+                    }
+                ],
             )
-            if result.modified_count == 1:
-                logger.success(f"Updated workorder #{order.number} in MongoDB")
 
-        except Exception as e:
-            logger.warning(f"Exception: {e}")
-
-    # TODO tests and exceptions
-    @retry_on_mongodb_error
-    async def capture_unsynced_workorders(self) -> list[TracOSWorkorder]:
-        """Query DB for unsynced workorders, captures documents, transforms them and return a list of TracOSWorkorder"""
-        unsynced_orders = []
-        logger.info("Querying TracOS database for all unsynced workorders")
-        cursor = self.collection.find({"isSynced": False})
+        workorders = []
+        claimed = 0
+        leased = {"_id": {"$in": candidate_ids}, "leaseId": lease_id}
+        if client_shape:
+            client_documents = []
+            projection = {**TRACOS_TO_CLIENT_PROJECTION, "leaseExpiresAt": 1}
+            async for doc in self.collection.aggregate(
+                [{"$match": leased}, {"$project": projection}]
+            ):
+                claimed += 1
+                expires_at = doc.pop("leaseExpiresAt")
+                client_documents.append(doc)
+            logger.info(f"{owner} leased {claimed} unsynced workorders")
+            return WorkorderLease(
+                owner, lease_id, expires_at, [], claimed, watermark, client_documents
+            )
 
-        async for doc in cursor:
+        async for doc in self.collection.find(leased):
+            claimed += 1
+            expires_at = doc.pop("leaseExpiresAt")
+            for field in LEASE_FIELDS:
+                doc.pop(field, None)
             try:
-                workorder = TracOSWorkorder.model_validate(doc)
-                logger.info(f"Unsynced workorder #{doc['number']} captured")
-                unsynced_orders.append(workorder)
+                workorders.append(TracOSWorkorder.model_validate(doc))
             except ValidationError as e:
                 logger.warning(f"Invalid workorder document skipped: {e}")
 
-        return unsynced_orders
+        logger.info(f"{owner} leased {len(workorders)} unsynced workorders")
+        return WorkorderLease(
+            owner, lease_id, expires_at, workorders, claimed, watermark
+        )
 
     @retry_on_mongodb_error
-    async def mark_workorder_as_synced(self, orderNo: int) -> None:
+    async def load_watermark(self, owner: str) -> Watermark | None:
+        """Where the outbound scan of owner stopped, None to start from the beginning"""
+        doc = await self.db[WATERMARK_COLLECTION].find_one({"_id": owner})
+        if doc is None or doc.get("updatedAt") is None:
+            return None
+        return Watermark(doc["updatedAt"], doc["number"])
+
+    @retry_on_mongodb_error
+    async def save_watermark(self, owner: str, watermark: Watermark | None) -> None:
+        await self.db[WATERMARK_COLLECTION].update_one(
+            {"_id": owner},
+            {
+                "$set": {
+                    "updatedAt": watermark.updated_at if watermark else None,
+                    "number": watermark.number if watermark else None,
+                    "savedAt": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+
+    @retry_on_mongodb_error
+    async def acknowledge_workorders(
+        self,
+        lease: WorkorderLease,
+        exported: list[TracOSWorkorder] | list[WorkorderVersion],
+    ) -> int:
+        """Marks exported workorders of a lease as synced and releases them.
+
+        A workorder is only acknowledged if the lease is still ours and the document
+        has not changed since it was claimed. Returns the number acknowledged.
+        """
+        if not exported:
+            return 0
+        synced_at = datetime.now(timezone.utc)
+        requests = [
+            UpdateOne(
+                {
+                    "number": order.number,
+                    "leaseId": lease.lease_id,
+                    "updatedAt": order.updatedAt,
+                },
+                {
+                    "$set": {"isSynced": True, "syncedAt": synced_at},
+                    "$unset": {field: "" for field in LEASE_FIELDS},
+                },
+            )
+            for order in exported
+        ]
         try:
-            logger.info(f"Marking order #{orderNo} as synced in MongoDB")
-            await self.collection.update_one(
-                {"_id": orderNo},
-                {"$set": {"isSynced": True, "syncedAt": datetime.now(timezone.utc)}},
+            result = await self.collection.bulk_write(requests, ordered=False)
+            acknowledged = result.modified_count
+        except BulkWriteError as e:
+            # unacknowledged workorders are exported again once the lease expires
+            acknowledged = e.details.get("nModified", 0)
+            logger.warning(f"Acknowledgement partially failed: {e}")
+        if acknowledged < len(exported):
+            logger.warning(
+                f"{len(exported) - acknowledged} workorders changed or lost their lease before acknowledgement"
             )
-            logger.success(f"Successfully marked order #{orderNo} as synced in MongoDB")
-        except Exception as e:
-            logger.warning(f"Exception: {e}")
+        logger.success(f"Marked {acknowledged} workorders as synced in MongoDB")
+        return acknowledged
@@ -0,0 +1,85 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+if TYPE_CHECKING:
+    from adapters.mongo_retry import CircuitBreaker
+    from adapters.tracos_adapter import (
+        NumberRange,
+        Watermark,
+        WorkorderLease,
+        WorkorderVersion,
+        WriteResult,
+    )
+    from adapters.version_cache import VersionCache
+    from models.tracOS_models import TracOSWorkorder
+    from services.bloom_filter import BloomFilter
+
+
+class TracOS(Protocol):
+    """What the sync flows of main.py need from TracOS.
+
+    Implemented by TracOSAdapter (MongoDB) and InMemoryTracOSAdapter (tests and
+    benchmarks without a database). See TracOSAdapter for the semantics of each
+    operation.
+    """
+
+    update_mode: str
+    circuit_breaker: "CircuitBreaker"
+    delta_bytes_saved: int
+    version_cache: "VersionCache"
+    existence_filter: "BloomFilter | None"
+
+    async def check_connection(self) -> None:
+        ...
+
+    async def ensure_indexes(self) -> None:
+        ...
+
+    async def capture_workorder(self, orderNo: int) -> "TracOSWorkorder | None":
+        ...
+
+    async def write_workorders(
+        self,
+        inserts: "list[TracOSWorkorder]",
+        updates: "list[TracOSWorkorder]",
+        current: "dict[int, TracOSWorkorder] | None" = None,
+    ) -> "WriteResult":
+        ...
+
+    async def load_existence_filter(
+        self, snapshot: Path, error_rate: float = 0.01
+    ) -> "BloomFilter":
+        ...
+
+    async def refresh_existence_filter(self) -> None:
+        ...
+
+    def save_existence_filter(self, snapshot: Path) -> None:
+        ...
+
+    async def unsynced_number_ranges(self, partitions: int) -> "list[NumberRange]":
+        ...
+
+    async def claim_unsynced_workorders(
+        self,
+        owner: str,
+        batch_size: int,
+        lease_seconds: float,
+        after: "Watermark | None" = None,
+        client_shape: bool = False,
+        numbers: "NumberRange | None" = None,
+    ) -> "WorkorderLease":
+        ...
+
+    async def load_watermark(self, owner: str) -> "Watermark | None":
+        ...
+
+    async def save_watermark(self, owner: str, watermark: "Watermark | None") -> None:
+        ...
+
+    async def acknowledge_workorders(
+        self,
+        lease: "WorkorderLease",
+        exported: "list[TracOSWorkorder] | list[WorkorderVersion]",
+    ) -> int:
+        ...
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class CachedVersion:
+    """Stored version of a workorder as last seen by this process"""
+
+    updated_at: datetime
+    content_hash: str | None
+    cached_at: float
+
+
+class VersionCache:
+    """Bounded LRU cache of the stored updatedAt and contentHash per workorder number.
+
+    Entries come from reads and from this process's own writes, and expire after
+    ttl seconds so changes made by other writers are eventually seen. A stored
+    updatedAt never decreases (writes are conditional on a newer updatedAt), so an
+    entry that is older than the document is still a lower bound: an inbound
+    record that is not newer than the cached updatedAt is stale for sure.
+
+    max_entries=0 disables the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries < 0:
+            raise ValueError("max_entries must not be negative")
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict[int, CachedVersion] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, number: int) -> CachedVersion | None:
+        if not self.enabled:
+            return None
+        entry = self.entries.get(number)
+        if entry is not None and self.clock() - entry.cached_at > self.ttl:
+            del self.entries[number]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(number)
+        self.hits += 1
+        return entry
+
+    def put(self, number: int, updated_at: datetime, content_hash: str | None) -> None:
+        if not self.enabled:
+            return
+        previous = self.entries.get(number)
+        # a concurrent read may return an older version than one already cached
+        if previous is not None and previous.updated_at > updated_at:
+            updated_at, content_hash = previous.updated_at, previous.content_hash
+        self.entries[number] = CachedVersion(updated_at, content_hash, self.clock())
+        self.entries.move_to_end(number)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, number: int) -> None:
+        if self.entries.pop(number, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -1,145 +1,1049 @@
-"""Entrypoint for the application."""
+"""Entrypoint for the application.
+
+Importing this module is cheap: configuration is read by main() (see settings.py)
+and the heavy dependencies (motor/pymongo, pydantic models, jsonschema) are
+imported by the functions that first use them.
+"""
+from __future__ import annotations
+
 import asyncio
-import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from functools import partial
 from pathlib import Path
-from typing import Any
-from jsonschema import ValidationError, validate
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterator
 from loguru import logger
-from dotenv import load_dotenv
 
-from adapters.client_erp_adapter import ClientERP
-from adapters.tracos_adapter import TracOSAdapter
-from services.translator import client_to_tracos, tracos_to_client
+from services.batch_sizing import AdaptiveBatchSize
+from services.deduplication import keep_latest
+from services.memory_budget import FOOTPRINT_SAMPLE, MemoryBudget
+from services.metrics import RunMetrics
+from services.pipeline import Pipeline, Stage, merge
+from services.tracing import RecordTrace, Tracer, datetime_ns
+from settings import Settings
+
+if TYPE_CHECKING:
+    from adapters.checkpoint_journal import CheckpointJournal
+    from adapters.client_erp_adapter import ClientERP
+    from adapters.tracos_adapter import (
+        NumberRange,
+        TracOSAdapter,
+        WorkorderLease,
+        WorkorderVersion,
+    )
+    from adapters.tracos_protocol import TracOS
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from models.customer_system_models import CustomerSystemWorkorder
+    from models.tracOS_models import TracOSWorkorder
+
+
+# id of a schema -> (schema, its validator)
+_SCHEMA_VALIDATORS: dict[int, tuple[dict[str, Any], Any]] = {}
 
-from models.customer_system_models import CustomerSystemWorkorder
-from models.tracOS_models import TracOSWorkorder
-from schemas.client_erp_schema import CLIENT_WORKORDER_SCHEMA
 
-# ----- CONFIG -----
-load_dotenv()
-DATA_INBOUND_DIR = Path(os.getenv("DATA_INBOUND_DIR", "data/inbound"))
-DATA_OUTBOUND_DIR = Path(os.getenv("DATA_OUTBOUND_DIR", "data/outbound"))
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-MONGO_DATABASE = os.getenv("MONGO_DATABASE", "tractian")
-MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "workorders")
+def schema_validator(objectschema: dict[str, Any]) -> Any:
+    """The validator of a json schema, checked against its metaschema once.
 
-logger.info(f"VARIABLE VALUE FOR CONFERENCE -> DATA_INBOUND_DIR: {DATA_INBOUND_DIR}")
-logger.info(f"VARIABLE VALUE FOR CONFERENCE -> DATA_OUTBOUND_DIR: {DATA_OUTBOUND_DIR}")
-logger.info(f"VARIABLE VALUE FOR CONFERENCE -> MONGO_URI: {MONGO_URI}")
-logger.info(f"VARIABLE VALUE FOR CONFERENCE -> MONGO_DATABASE: {MONGO_DATABASE}")
-logger.info(f"VARIABLE VALUE FOR CONFERENCE -> MONGO_COLLECTION: {MONGO_COLLECTION}")
-# ------------------
+    jsonschema.validate() checks the schema again on every call, which costs far
+    more than validating a workorder."""
+    from jsonschema.validators import validator_for
 
-# create outbound directory if it does not exist
-if not os.path.exists(DATA_OUTBOUND_DIR):
-    logger.info(f"Creating outbound directory {DATA_OUTBOUND_DIR}")
-    os.makedirs(DATA_OUTBOUND_DIR)
+    cached = _SCHEMA_VALIDATORS.get(id(objectschema))
+    if cached is not None and cached[0] is objectschema:
+        return cached[1]
+    cls = validator_for(objectschema)
+    cls.check_schema(objectschema)
+    validator = cls(objectschema)
+    _SCHEMA_VALIDATORS[id(objectschema)] = (objectschema, validator)
+    return validator
 
 
 def validate_schema(
     json_object: dict[str, Any], pathname: Path, objectschema: dict[str, Any]
-) -> bool:
-    """Validates an object against a provided json schema. pathname is the name of json file that generated such object"""
+) -> str | None:
+    """Validates an object against a provided json schema. pathname is the name of json file that generated such object.
+    Returns the validation error message, or None if the object is compliant"""
+    from jsonschema.exceptions import best_match
+
+    e = best_match(schema_validator(objectschema).iter_errors(json_object))
+    if e is None:
+        return None
+    logger.warning(f"{pathname} is non compliant with client ERP schema")
+    logger.warning(f"Error: {e.message}")
+    logger.warning(f"Error: {e.relative_schema_path}")
+    return e.message
+
+
+class InboundFile:
+    """An inbound file whose records are moving through the inbound pipeline.
+
+    A JSON Lines file yields many records. The file is archived once every record
+    read from it is synced (or knowingly skipped), and quarantined if none is.
+    Records are settled from pipeline threads, hence the lock.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        key: str = "",
+        mtime_ns: int = 0,
+        journal: CheckpointJournal | None = None,
+    ):
+        self.path = path
+        self.key = key  # identifies this version of the file in the checkpoint journal
+        self.mtime_ns = mtime_ns  # when the file landed, origin of the sync lag
+        self.journal = journal
+        self.records = 0  # read so far
+        self.synced = 0
+        self.settled = 0
+        self.reading = True
+        self.multi_record = False  # JSON Lines or top-level array
+        self.error: tuple[str, str] | None = None  # file-level (reason, message)
+        self.rejected: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _done(self) -> bool:
+        return not self.reading and self.settled == self.records
+
+    def add_record(self) -> None:
+        with self._lock:
+            self.records += 1
+
+    def checkpoint_key(self, position: int | None) -> str:
+        return f"{self.key}#{position or 0}"
+
+    def forget_checkpoints(self) -> None:
+        """Once the file is moved out of the inbound directory, no run reads it
+        again: the checkpoints of its records are not needed anymore"""
+        if self.journal is not None:
+            self.journal.forget_group("inbound", self.key)
+
+    def reject_record(self, position: int | None, reason: str, error: str) -> None:
+        with self._lock:
+            self.rejected.append(
+                {"position": position, "reason": reason, "error": error}
+            )
+
+    def finish_reading(self) -> bool:
+        """Whether the file is done with, i.e. all its records were settled"""
+        with self._lock:
+            self.reading = False
+            return self._done()
+
+    def settle(self, synced: bool) -> bool:
+        """Records the outcome of one record and tells whether the file is done with"""
+        with self._lock:
+            self.settled += 1
+            self.synced += synced
+            return self._done()
+
+
+@dataclass
+class InboundRecord:
+    """A client workorder moving through the inbound pipeline"""
+
+    path: Path
+    payload: dict[str, Any]
+    client_workorder: CustomerSystemWorkorder | None = None
+    tracos_workorder: TracOSWorkorder | None = None
+    source: InboundFile | None = None
+    # line of a JSON Lines file, or index (from 1) in a top-level json array
+    position: int | None = None
+    trace: RecordTrace | None = None  # when sampled by the Tracer
+
+    @property
+    def checkpoint_key(self) -> str:
+        return self.source.checkpoint_key(self.position)
+
+    @property
+    def traces(self) -> list[RecordTrace]:
+        return [self.trace] if self.trace is not None else []
+
+
+@dataclass
+class OutboundBatch:
+    """A leased batch of TracOS workorders moving through the outbound pipeline"""
+
+    lease: WorkorderLease
+    # client workorders, serialized (CustomerSystemWorkorder.model_dump(mode="json"))
+    client_documents: list[dict[str, Any]] = field(default_factory=list)
+    exported: set[int] = field(default_factory=set)
+    claimed: tuple[int, int] = (0, 0)  # start and end of the claim, ns since the epoch
+    traces: list[RecordTrace] = field(default_factory=list)
+
+
+@dataclass
+class BatchSizers:
+    """Batch sizes of the bulk TracOS operations. Kept across the runs of a process,
+    so sizes tuned to the cluster carry over from one run to the next"""
+
+    inbound_write: AdaptiveBatchSize
+    outbound_claim: AdaptiveBatchSize
+    outbound_ack: AdaptiveBatchSize
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "BatchSizers":
+        """Configured sizes (INBOUND_SYNC_BATCH_SIZE, OUTBOUND_BATCH_SIZE), fixed
+        unless ADAPTIVE_BATCHING, in which case they are where tuning starts"""
+
+        def sizer(configured: int) -> AdaptiveBatchSize:
+            if not settings.adaptive_batching:
+                return AdaptiveBatchSize.fixed(configured)
+            return AdaptiveBatchSize(
+                configured,
+                settings.batch_size_min,
+                settings.batch_size_max,
+                settings.batch_target_seconds,
+            )
+
+        return cls(
+            sizer(settings.inbound_sync_batch_size),
+            sizer(settings.outbound_batch_size),
+            sizer(settings.outbound_batch_size),
+        )
+
+    def report(self, metrics: RunMetrics) -> None:
+        for name, sizer in vars(self).items():
+            if sizer.adaptive:
+                sizer.report(metrics, name)
+
+
+async def observe_bulk(
+    sizer: AdaptiveBatchSize,
+    tracos: TracOS,
+    operation: Awaitable[Any],
+    items: int | Callable[[Any], int],
+) -> Any:
+    """Awaits a bulk TracOS operation and has sizer observe how long it took and
+    how many attempts failed meanwhile. items is the size of the batch, or gets it
+    from the result"""
+    failures = tracos.circuit_breaker.failures
+    started = time.perf_counter()
+    result = await operation
+    sizer.observe(
+        items(result) if callable(items) else items,
+        time.perf_counter() - started,
+        tracos.circuit_breaker.failures - failures,
+    )
+    return result
+
+
+def finish_inbound_file(
+    settings: Settings, client: ClientERP, metrics: RunMetrics, source: InboundFile
+) -> None:
+    """Moves a file out of the inbound directory so it is not read again: to the
+    archive if any of its records was synced, to the dead-letter directory if not"""
+    if source.error is None and source.synced:
+        if client.archive_file(
+            source.path, settings.data_archive_dir, settings.archive_compress
+        ):
+            metrics.incr("inbound.archived")
+            source.forget_checkpoints()
+        if source.rejected:
+            client.write_error_report(
+                source.path,
+                settings.data_dead_letter_dir,
+                "records",
+                f"{len(source.rejected)} records rejected",
+                source.rejected,
+            )
+            metrics.incr("inbound.rejected_records", len(source.rejected))
+        return
+
+    if source.error is not None:
+        reason, error = source.error
+    elif source.rejected:
+        reason, error = source.rejected[0]["reason"], source.rejected[0]["error"]
+    else:
+        reason, error = "empty", "no records"
+    # the report of a single-document file needs no per-record detail
+    rejected = source.rejected if source.multi_record else None
+    if client.quarantine_file(
+        source.path, settings.data_dead_letter_dir, reason, error, rejected
+    ):
+        metrics.incr("inbound.quarantined")
+        source.forget_checkpoints()
+
+
+def read_inbound_file(
+    settings: Settings,
+    client: ClientERP,
+    metrics: RunMetrics,
+    journal: CheckpointJournal,
+    path: Path,
+    tracer: Tracer | None = None,
+) -> Iterator[InboundRecord]:
+    """Yields the records of a json or JSON Lines file, decompressing it on the fly.
+
+    Records that an interrupted run already synced (see CheckpointJournal) are
+    counted as synced without going through the pipeline again.
+    """
+    from adapters.client_erp_adapter import DECODE_ERRORS
+
     try:
-        validate(instance=json_object, schema=objectschema)
+        stat = path.stat()
+    except FileNotFoundError:
+        logger.warning(f"{path} disappeared before it was read")
+        return
+    source = InboundFile(
+        path, f"{path}:{stat.st_size}:{stat.st_mtime_ns}", stat.st_mtime_ns, journal
+    )
+    read_ns = time.time_ns()
+
+    def pending(record: InboundRecord) -> bool:
+        source.add_record()
+        if journal.is_done("inbound", record.checkpoint_key):
+            metrics.incr("inbound.resumed")
+            source.settle(synced=True)
+            return False
+        if tracer is not None:
+            record.trace = tracer.start(
+                "inbound",
+                record.checkpoint_key,
+                source.mtime_ns,
+                file=str(path),
+                position=record.position or 0,
+            )
+            if record.trace is not None:
+                record.trace.span("landing", source.mtime_ns, read_ns)
+                record.trace.span("read", read_ns, time.time_ns())
         return True
-    except ValidationError as e:
-        logger.warning(f"{pathname} is non compliant with client ERP schema")
-        logger.warning(f"Error: {e.message}")
-        logger.warning(f"Error: {e.relative_schema_path}")
-        return False
 
+    try:
+        if client.is_json_lines(path):
+            source.multi_record = True
+            for line, payload, error in client.iter_json_lines(path):
+                if error is not None:
+                    logger.warning(f"{path}:{line} is a malformed JSON")
+                    source.reject_record(line, "malformed", error)
+                    continue
+                record = InboundRecord(path, payload, source=source, position=line)
+                if pending(record):
+                    yield record
+        else:
+            # a top-level array is parsed one workorder at a time
+            for index, payload in client.iter_json_file(path):
+                source.multi_record = index is not None
+                record = InboundRecord(path, payload, source=source, position=index)
+                if pending(record):
+                    yield record
+    except FileNotFoundError:
+        logger.warning(f"{path} disappeared before it was read")
+        return
+    except PermissionError as e:
+        logger.warning(f"No permission to read file {path}")
+        source.error = ("unreadable", str(e))
+    except DECODE_ERRORS as e:
+        logger.warning(f"{path} is a malformed JSON")
+        source.error = ("malformed", str(e))
+    except OSError as e:
+        # not the file's fault: it is read again by the next cycle
+        logger.warning(f"Could not read {path}, left in place: {e}")
+        return
+
+    if source.finish_reading():
+        finish_inbound_file(settings, client, metrics, source)
 
-def read_json_payloads(
+
+def validate_json_payload(
+    settings: Settings, client: ClientERP, metrics: RunMetrics, record: InboundRecord
+) -> InboundRecord | None:
+    """Drops records that are not compliant with the client ERP schema; a file
+    with no compliant record is quarantined"""
+    from schemas.client_erp_schema import CLIENT_WORKORDER_SCHEMA
+
+    error = validate_schema(record.payload, record.path, CLIENT_WORKORDER_SCHEMA)
+    if error is None:
+        return record
+    reject_record(settings, client, metrics, record, "schema", error)
+    return None
+
+
+def reject_record(
+    settings: Settings,
     client: ClientERP,
-) -> list[tuple[Path, dict[str, Any]]]:  # pyright: ignore[reportExplicitAny]
-    json_payloads: list[tuple[Path, dict[str, Any]]] = []
-    json_filenames = client.capture_json_filenames(DATA_INBOUND_DIR)
-    for filename in json_filenames:
-        candidate_json = client.read_json_file(filename)
-        if candidate_json:
-            json_payloads.append((filename, candidate_json))
-    return json_payloads
-
-
-def validate_json_payloads(
-    json_payloads: list[tuple[Path, dict[str, Any]]]
-) -> list[dict[str, Any]]:
-    """ "Given a list of objects, a new list with only that ones that are compliant to a schema"""
-    valid_json_payloads: list[dict[str, Any]] = []  # pyright: ignore[reportExplicitAny]
-
-    for payload in json_payloads:
-        if validate_schema(payload[1], payload[0], CLIENT_WORKORDER_SCHEMA) is True:
-            valid_json_payloads.append(payload[1])
-    return valid_json_payloads
-
-
-def prepare_domain_client_objects(
-    json_payloads: list[dict[str, Any]]
-) -> list[CustomerSystemWorkorder]:
-    """From a list of objects creates a list CustomerSystemWorkorder"""
-    client_objects: list[CustomerSystemWorkorder] = []
-    for doc in json_payloads:
-        workorder = CustomerSystemWorkorder.model_validate(doc)
-        client_objects.append(workorder)
-    return client_objects
+    metrics: RunMetrics,
+    record: InboundRecord,
+    reason: str,
+    error: str,
+) -> None:
+    """Settles a record that cannot be synced, quarantining its file once done"""
+    record.source.reject_record(record.position, reason, error)
+    if record.source.settle(synced=False):
+        finish_inbound_file(settings, client, metrics, record.source)
+
+
+def settle_record(
+    settings: Settings, client: ClientERP, metrics: RunMetrics, record: InboundRecord
+):
+    """Marks a record as synced (or knowingly skipped), archiving its file once done"""
+    if record.source.settle(synced=True):
+        finish_inbound_file(settings, client, metrics, record.source)
+
+
+def prepare_domain_client_object(
+    settings: Settings, client: ClientERP, metrics: RunMetrics, record: InboundRecord
+) -> InboundRecord | None:
+    """Drops records that are schema compliant but not valid workorders (e.g. a
+    date without a timezone)"""
+    from models.customer_system_models import CustomerSystemWorkorder
+
+    try:
+        record.client_workorder = CustomerSystemWorkorder.model_validate(record.payload)
+    except ValueError as e:  # pydantic's ValidationError included
+        logger.warning(f"{record.path} is not a valid workorder: {e}")
+        reject_record(settings, client, metrics, record, "invalid", str(e))
+        return None
+    return record
+
+
+def translate_client_object(
+    settings: Settings, client: ClientERP, metrics: RunMetrics, record: InboundRecord
+) -> InboundRecord | None:
+    """Drops records that cannot be translated to TracOS workorders"""
+    from services.translator import client_to_tracos
+
+    try:
+        record.tracos_workorder = client_to_tracos(record.client_workorder)
+    except ValueError as e:  # pydantic's ValidationError included
+        logger.warning(f"{record.path} cannot be translated: {e}")
+        reject_record(settings, client, metrics, record, "invalid", str(e))
+        return None
+    return record
+
+
+def deduplicate_records(
+    records: list[InboundRecord], metrics: RunMetrics
+) -> list[InboundRecord]:
+    """Keeps only the newest record (lastUpdateDate) of each orderNo in a batch"""
+    kept, superseded = keep_latest(
+        records,
+        key=lambda r: r.client_workorder.orderNo,
+        version=lambda r: r.client_workorder.lastUpdateDate,
+    )
+    for record in superseded:
+        logger.info(
+            f"{record.path} skipped: superseded by a newer record for workorder #{record.client_workorder.orderNo}"
+        )
+    metrics.incr("inbound.superseded", len(superseded))
+    # each superseded record would have cost one lookup of its workorder
+    metrics.incr("inbound.round_trips_saved", len(superseded))
+    return kept
 
 
 async def sync_to_tracos(
-    client_objs_translated_to_tracos: list[TracOSWorkorder], tracos: TracOSAdapter
-) -> None:
+    client_objs_translated_to_tracos: list[TracOSWorkorder],
+    tracos: TracOS,
+    metrics: RunMetrics | None = None,
+    sizer: AdaptiveBatchSize | None = None,
+) -> dict[int, str]:
+    """Writes new and updated workorders in one bulk write, observed by sizer.
+    Returns the workorders that could not be written, by number, with the error"""
+    from services.fingerprint import workorder_fingerprint
+
+    metrics = metrics or RunMetrics()
+    inserts: list[TracOSWorkorder] = []
+    updates: list[TracOSWorkorder] = []
+    current: dict[int, TracOSWorkorder] = {}
     for obj in client_objs_translated_to_tracos:
+        # stored updatedAt only grows: a cached one is enough to reject stale records
+        cached = tracos.version_cache.get(obj.number)
+        if cached is not None and cached.updated_at >= obj.updatedAt:
+            metrics.incr("inbound.stale")
+            metrics.incr("inbound.lookups_saved")
+            continue
+        # definitely not stored: insert without looking it up
+        existing = tracos.existence_filter
+        if existing is not None and obj.number not in existing:
+            inserts.append(obj)
+            metrics.incr("inbound.lookups_saved")
+            continue
         tracos_workorder = await tracos.capture_workorder(obj.number)
+        metrics.incr("inbound.lookups")
         if tracos_workorder is None:
-            await tracos.insert_workorder(obj)
-        # if data on DB is older (came before) than inbound data, then update
-        elif tracos_workorder.updatedAt < obj.updatedAt:
-            await tracos.update_workorder(obj)
+            if existing is not None:
+                metrics.incr("existence.false_positives")
+            inserts.append(obj)
+        # data on DB is as new as or newer than inbound data: keep it
+        elif tracos_workorder.updatedAt >= obj.updatedAt:
+            metrics.incr("inbound.stale")
+        # a re-export that only bumped the timestamp needs no write
+        elif (
+            tracos_workorder.isSynced
+            and tracos_workorder.contentHash == workorder_fingerprint(obj)
+        ):
+            metrics.incr("inbound.unchanged")
+        else:
+            updates.append(obj)
+            current[obj.number] = tracos_workorder
 
+    failed: dict[int, str] = {}
+    if inserts or updates:
+        write = tracos.write_workorders(inserts, updates, current)
+        if sizer is None:
+            result = await write
+        else:
+            result = await observe_bulk(
+                sizer, tracos, write, len(inserts) + len(updates)
+            )
+        failed = result.failed
+    metrics.incr("inbound.inserted", len(inserts))
+    metrics.incr("inbound.updated", len(updates))
+    metrics.incr("inbound.write_failures", len(failed))
+    return failed
 
-async def sync_to_client(
-    client_objs: list[CustomerSystemWorkorder], tracos: TracOSAdapter, client: ClientERP
-) -> None:
-    for obj in client_objs:
-        client_workoder_dict = obj.model_dump(mode="json")
+
+def sync_to_client(
+    client_docs: list[dict[str, Any]], client: ClientERP, settings: Settings
+) -> list[int]:
+    """Writes serialized client workorders to the outbound directory, returning the exported orderNos"""
+    from jsonschema import ValidationError
+
+    from schemas.client_erp_schema import CLIENT_WORKORDER_SCHEMA
+
+    validator = schema_validator(CLIENT_WORKORDER_SCHEMA)
+    exported: list[int] = []
+    for client_workoder_dict in client_docs:
         try:
-            validate(instance=client_workoder_dict, schema=CLIENT_WORKORDER_SCHEMA)
-            if client.write_json_file(DATA_OUTBOUND_DIR, client_workoder_dict):
-                await tracos.mark_workorder_as_synced(obj.orderNo)
+            validator.validate(client_workoder_dict)
+            if client.write_json_file(
+                settings.data_outbound_dir,
+                client_workoder_dict,
+                settings.outbound_layout,
+            ):
+                exported.append(client_workoder_dict["orderNo"])
         except ValidationError as e:
             logger.warning(
                 f"Translated object of workorder{client_workoder_dict['orderNo']} is non compliant with client ERP schema"
             )
             logger.warning(f"Error: {e.message}")
             logger.warning(f"Error: {e.relative_schema_path}")
-    return
+    return exported
 
 
-async def main():
-    tracos = TracOSAdapter(MONGO_URI, MONGO_DATABASE, MONGO_COLLECTION)
-    client = ClientERP()
+async def claim_partition_batches(
+    settings: Settings,
+    tracos: TracOS,
+    owner: str,
+    numbers: NumberRange | None = None,
+    budget: MemoryBudget | None = None,
+    sizer: AdaptiveBatchSize | None = None,
+) -> AsyncIterator[OutboundBatch]:
+    """Leases the unsynced workorders of one number range page by page, in
+    (updatedAt, number) order. Pages are of the size of sizer (OUTBOUND_BATCH_SIZE
+    unless tuned), fewer when budget says so.
 
-    await tracos.check_connection()
+    The watermark of the last page is persisted under owner, so a run that stops
+    early (crash, exhausted retries) resumes the scan where it stopped. Once the
+    scan reaches the end, the watermark is reset: workorders it passed while they
+    were leased by another exporter, or that were not acknowledged, are visited by
+    the next scan.
+    """
+    watermark = await tracos.load_watermark(owner)
+    if watermark is not None:
+        logger.info(
+            f"Resuming outbound scan after workorder #{watermark.number} ({watermark.updated_at})"
+        )
+    budget = budget or MemoryBudget()
+    sizer = sizer or AdaptiveBatchSize.fixed(settings.outbound_batch_size)
+    in_flight = outbound_batches_in_flight(settings)
+    while True:
+        started_ns = time.time_ns()
+        claim = tracos.claim_unsynced_workorders(
+            settings.exporter_id,
+            budget.batch_size("outbound", sizer.size, in_flight),
+            settings.outbound_lease_seconds,
+            after=watermark,
+            client_shape=settings.outbound_translation == "server",
+            numbers=numbers,
+        )
+        lease = await observe_bulk(sizer, tracos, claim, lambda lease: lease.claimed)
+        if lease.watermark is None:
+            await tracos.save_watermark(owner, None)
+            return
+        watermark = lease.watermark
+        await tracos.save_watermark(owner, watermark)
+        if lease.claimed:
+            yield OutboundBatch(lease, claimed=(started_ns, time.time_ns()))
 
-    # INBOUND FLOW
-    json_payloads = read_json_payloads(client)
-    valid_json_payloads = validate_json_payloads(json_payloads)
-    client_objects = prepare_domain_client_objects(valid_json_payloads)
 
-    client_obj_as_tracos_obj = []
-    for obj in client_objects:
-        client_obj_as_tracos_obj.append(client_to_tracos(obj))
+async def claim_outbound_batches(
+    settings: Settings,
+    tracos: TracOS,
+    budget: MemoryBudget | None = None,
+    sizer: AdaptiveBatchSize | None = None,
+) -> AsyncIterator[OutboundBatch]:
+    """Leases unsynced workorders batch by batch.
+
+    With OUTBOUND_PARTITIONS > 1 the unsynced workorders are split into number
+    ranges, scanned by as many concurrent cursors, each with its own watermark;
+    their leases are merged into one stream for the export and acknowledgement
+    stages. Ranges are recomputed every run: a resumed watermark may then skip
+    part of a range, which the next scan visits.
+    """
+    from services.translator import OUTBOUND_TRANSLATIONS
+
+    if settings.outbound_translation not in OUTBOUND_TRANSLATIONS:
+        raise ValueError(
+            f"Unsupported outbound translation {settings.outbound_translation!r}, "
+            f"expected one of {OUTBOUND_TRANSLATIONS}"
+        )
+    owner = settings.worker_owner
+    if settings.outbound_partitions <= 1:
+        async for batch in claim_partition_batches(
+            settings, tracos, owner, budget=budget, sizer=sizer
+        ):
+            yield batch
+        return
+
+    ranges = await tracos.unsynced_number_ranges(settings.outbound_partitions)
+    logger.info(
+        f"Outbound scan split into {len(ranges)} number ranges: "
+        + " ".join(map(str, ranges))
+    )
+    partitions = [
+        claim_partition_batches(
+            settings, tracos, f"{owner}:numbers-{i}", numbers, budget, sizer
+        )
+        for i, numbers in enumerate(ranges)
+    ]
+    async for batch in merge(partitions):
+        yield batch
+
+
+def translate_outbound_batch(batch: OutboundBatch) -> OutboundBatch:
+    from services.translator import client_json, tracos_to_client
+
+    # an invalid workorder is skipped alone: the rest of the batch is exported
+    lease = batch.lease
+    if not lease.client_documents:
+        for obj in lease.workorders:
+            try:
+                batch.client_documents.append(
+                    tracos_to_client(obj).model_dump(mode="json")
+                )
+            except ValueError as e:  # pydantic's ValidationError included
+                logger.warning(f"Invalid workorder document skipped: {e}")
+        return batch
+    # translated by MongoDB (OUTBOUND_TRANSLATION=server), only serialized here
+    for doc in lease.client_documents:
+        try:
+            batch.client_documents.append(client_json(doc))
+        except ValueError as e:
+            logger.warning(f"Invalid workorder document skipped: {e}")
+    return batch
+
+
+def inbound_pipeline(
+    settings: Settings,
+    client: ClientERP,
+    tracos: TracOS,
+    metrics: RunMetrics,
+    journal: CheckpointJournal | None = None,
+    tracer: Tracer | None = None,
+    budget: MemoryBudget | None = None,
+    sizers: BatchSizers | None = None,
+) -> Pipeline:
+    """read -> validate -> build -> translate -> sync -> archive
+
+    Sync batches are of the size of sizers.inbound_write. With a budget, the
+    queues and sync batches hold no more records than fit in it.
+    """
+    from adapters.mongo_retry import MongoDBUnavailable
+
+    if journal is None:
+        from adapters.checkpoint_journal import CheckpointJournal
+
+        journal = CheckpointJournal()
+    tracer = tracer or Tracer()
+    budget = budget or MemoryBudget()
+    sizers = sizers or BatchSizers.from_settings(settings)
+
+    async def sync(records: list[InboundRecord]) -> list[InboundRecord]:
+        sample = records[:FOOTPRINT_SAMPLE]
+        budget.measure("inbound", sample, len(sample))
+        kept = deduplicate_records(records, metrics)
+        failed = await sync_to_tracos(
+            [r.tracos_workorder for r in kept], tracos, metrics, sizers.inbound_write
+        )
+        written_ns = time.time_ns()
+        for record in kept:
+            if record.tracos_workorder.number not in failed:
+                tracer.observe_lag("inbound", record.source.mtime_ns, written_ns)
+        # superseded records are done with too, unless their workorder was not
+        # written; a failed sync archives nothing
+        done = []
+        for record in records:
+            error = failed.get(record.tracos_workorder.number)
+            if error is None:
+                done.append(record)
+            else:
+                reject_record(settings, client, metrics, record, "write", error)
+        await journal.record("inbound", [r.checkpoint_key for r in done])
+        return done
+
+    stages = [
+        Stage(
+            "read",
+            partial(
+                read_inbound_file, settings, client, metrics, journal, tracer=tracer
+            ),
+            concurrency=settings.inbound_read_concurrency,
+            blocking=True,
+            fan_out=True,
+        ),
+        Stage(
+            "validate",
+            tracer.stage(
+                "validate",
+                partial(validate_json_payload, settings, client, metrics),
+            ),
+        ),
+        Stage(
+            "build",
+            tracer.stage(
+                "build",
+                partial(prepare_domain_client_object, settings, client, metrics),
+            ),
+        ),
+        Stage(
+            "translate",
+            tracer.stage(
+                "translate",
+                partial(translate_client_object, settings, client, metrics),
+            ),
+        ),
+        Stage(
+            "sync",
+            tracer.stage("db_write", sync),
+            concurrency=settings.inbound_sync_concurrency,
+            batched=True,
+            batch_size=lambda: budget.batch_size(
+                "inbound",
+                sizers.inbound_write.size,
+                settings.inbound_sync_concurrency + 1,
+            ),
+            fan_out=True,
+        ),
+        Stage(
+            "archive",
+            tracer.stage(
+                "archive",
+                partial(settle_record, settings, client, metrics),
+                finish=True,
+            ),
+            concurrency=settings.inbound_read_concurrency,
+            blocking=True,
+        ),
+    ]
+    # each stage has a queue of records before it
+    queue_size = budget.batch_size("inbound", settings.pipeline_queue_size, len(stages))
+    # without MongoDB, the cycle cannot go on
+    return Pipeline(
+        "inbound", stages, queue_size=queue_size, fatal=(MongoDBUnavailable,)
+    )
+
+
+# outbound items are whole batches, keep only a few in flight
+OUTBOUND_QUEUE_SIZE = 2
+
+
+def outbound_batches_in_flight(settings: Settings) -> int:
+    """Most leased batches held at once: queued before each of the 3 outbound
+    stages, handled by their workers, and claimed (plus merged) per partition"""
+    partitions = max(settings.outbound_partitions, 1)
+    return (
+        3 * OUTBOUND_QUEUE_SIZE
+        + 2
+        + settings.outbound_export_concurrency
+        + (2 * partitions)
+    )
+
+
+def outbound_checkpoint_key(order: TracOSWorkorder | WorkorderVersion) -> str:
+    return f"{order.number}:{order.updatedAt.isoformat()}"
+
 
-    await sync_to_tracos(client_obj_as_tracos_obj, tracos)
+def outbound_pipeline(
+    settings: Settings,
+    client: ClientERP,
+    tracos: TracOS,
+    metrics: RunMetrics,
+    journal: CheckpointJournal | None = None,
+    tracer: Tracer | None = None,
+    budget: MemoryBudget | None = None,
+    sizers: BatchSizers | None = None,
+) -> Pipeline:
+    """(claim) -> translate -> export -> acknowledge, one leased batch per item.
+    Acknowledgements are sent in chunks of the size of sizers.outbound_ack"""
+    from adapters.mongo_retry import MongoDBUnavailable
+
+    if journal is None:
+        from adapters.checkpoint_journal import CheckpointJournal
+
+        journal = CheckpointJournal()
+    tracer = tracer or Tracer()
+    budget = budget or MemoryBudget()
+    sizers = sizers or BatchSizers.from_settings(settings)
+
+    def translate(batch: OutboundBatch) -> OutboundBatch:
+        for version in batch.lease.versions:
+            trace = tracer.start(
+                "outbound",
+                outbound_checkpoint_key(version),
+                datetime_ns(version.updatedAt),
+                number=version.number,
+            )
+            if trace is not None:
+                trace.span("claim", *batch.claimed)
+                batch.traces.append(trace)
+        translate_outbound_batch(batch)
+        # claimed and translated documents are both held until the batch is done
+        sample = batch.client_documents[:FOOTPRINT_SAMPLE]
+        budget.measure(
+            "outbound",
+            (
+                batch.lease.workorders[:FOOTPRINT_SAMPLE],
+                batch.lease.client_documents[:FOOTPRINT_SAMPLE],
+                sample,
+            ),
+            len(sample),
+        )
+        return batch
+
+    def export(batch: OutboundBatch) -> OutboundBatch:
+        # versions an interrupted run already exported only need acknowledging
+        resumed = {
+            version.number
+            for version in batch.lease.versions
+            if journal.is_done("outbound", outbound_checkpoint_key(version))
+        }
+        pending = [d for d in batch.client_documents if d["orderNo"] not in resumed]
+        batch.exported = set(sync_to_client(pending, client, settings))
+        exported_ns = time.time_ns()
+        for version in batch.lease.versions:
+            if version.number in batch.exported:
+                tracer.observe_lag(
+                    "outbound", datetime_ns(version.updatedAt), exported_ns
+                )
+        metrics.incr("outbound.exported", len(batch.exported))
+        metrics.incr("outbound.resumed", len(resumed))
+        batch.exported |= resumed
+        return batch
+
+    async def acknowledge(batch: OutboundBatch) -> None:
+        exported = [v for v in batch.lease.versions if v.number in batch.exported]
+        await journal.record("outbound", map(outbound_checkpoint_key, exported))
+        sizer = sizers.outbound_ack
+        while exported:
+            chunk, exported = exported[: sizer.size], exported[sizer.size :]
+            acknowledged = await observe_bulk(
+                sizer,
+                tracos,
+                tracos.acknowledge_workorders(batch.lease, chunk),
+                len(chunk),
+            )
+            metrics.incr("outbound.acknowledged", acknowledged)
+            # acknowledged orders are not claimed again: their keys are done with
+            journal.forget("outbound", map(outbound_checkpoint_key, chunk))
+
+    return Pipeline(
+        "outbound",
+        [
+            Stage("translate", tracer.stage("translate", translate)),
+            Stage(
+                "export",
+                tracer.stage("export", export),
+                concurrency=settings.outbound_export_concurrency,
+                blocking=True,
+            ),
+            Stage("ack", tracer.stage("ack", acknowledge, finish=True)),
+        ],
+        queue_size=OUTBOUND_QUEUE_SIZE,
+        fatal=(MongoDBUnavailable,),
+    )
+
+
+def open_checkpoint_journal(
+    settings: Settings, tracos: TracOSAdapter
+) -> CheckpointJournal:
+    """The journal backend of CHECKPOINT_JOURNAL. "mongo" needs a TracOSAdapter"""
+    from adapters.checkpoint_journal import (
+        JOURNAL_BACKENDS,
+        DisabledJournal,
+        FileJournal,
+        MongoJournal,
+    )
+
+    backend = settings.checkpoint_journal
+    if backend not in JOURNAL_BACKENDS:
+        raise ValueError(
+            f"Unsupported checkpoint journal {backend!r}, expected one of {JOURNAL_BACKENDS}"
+        )
+    if backend == "file":
+        return FileJournal(settings.checkpoint_path)
+    if backend == "mongo":
+        return MongoJournal(
+            tracos.db[settings.checkpoint_collection],
+            owner=settings.worker_owner,
+            retry_policy=tracos.retry_policy,
+        )
+    return DisabledJournal()
+
+
+async def run_cycle(
+    settings: Settings,
+    client: ClientERP,
+    tracos: TracOS,
+    journal: CheckpointJournal,
+    title: str = "Run summary",
+    sizers: BatchSizers | None = None,
+) -> RunMetrics:
+    """One inbound and one outbound pass, returning its metrics. Pass the same
+    sizers to every run of a process for tuned batch sizes to carry over"""
+    metrics = RunMetrics()
+    sizers = sizers or BatchSizers.from_settings(settings)
+    tracer = Tracer(settings.trace_path, settings.trace_sample_rate)
+    budget = MemoryBudget(settings.memory_budget_mb << 20)
+    # a lifetime total of the adapter: the run reports what it adds to it
+    delta_bytes_saved = tracos.delta_bytes_saved
+    await tracos.refresh_existence_filter()
+
+    # INBOUND FLOW
+    scan_options = settings.inbound_scan_options
+    if budget.scan_window(scan_options.max_files) != scan_options.max_files:
+        scan_options = replace(
+            scan_options, max_files=budget.scan_window(scan_options.max_files)
+        )
+        logger.info(f"Memory budget: at most {scan_options.max_files} files this run")
+    json_filenames = client.scan_json_files(
+        settings.data_inbound_dir,
+        scan_options,
+        include=settings.worker_partition.owns,
+    )
+    inbound_stats = await inbound_pipeline(
+        settings, client, tracos, metrics, journal, tracer, budget, sizers
+    ).run(json_filenames)
+    inbound_stats.log_summary()
 
     # OUTBOUND FLOW
-    unsynced_tracos_orders = await tracos.capture_unsynced_workorders()
-    tracos_obj_as_client_obj = []
-    for obj in unsynced_tracos_orders:
-        tracos_obj_as_client_obj.append(tracos_to_client(obj))
+    # leased batches: several exporters can run without exporting an order twice
+    outbound_stats = await outbound_pipeline(
+        settings, client, tracos, metrics, journal, tracer, budget, sizers
+    ).run(claim_outbound_batches(settings, tracos, budget, sizers.outbound_claim))
+    outbound_stats.log_summary()
+
+    # bundles are built by one worker only, so no export lands in two bundles
+    if settings.outbound_bundle_format and settings.worker_partition.is_leader:
+        from adapters.outbound_bundler import OutboundBundler
+
+        bundler = OutboundBundler(
+            settings.data_outbound_dir,
+            settings.outbound_bundle_dir,
+            settings.outbound_bundle_format,
+            settings.outbound_bundle_max_files,
+        )
+        bundles = await asyncio.to_thread(bundler.bundle)
+        metrics.incr("outbound.bundles", len(bundles))
+
+    # unfinished work keeps its checkpoints for the next run
+    if inbound_stats.failed == 0 and outbound_stats.failed == 0:
+        await journal.clear()
+    else:
+        await journal.compact()
+
+    if tracos.update_mode == "delta":
+        metrics.set(
+            "inbound.delta_bytes_saved", tracos.delta_bytes_saved - delta_bytes_saved
+        )
+    if tracos.existence_filter is not None:
+        await asyncio.to_thread(
+            tracos.save_existence_filter, settings.existence_filter_path
+        )
+        metrics.set("existence.count", tracos.existence_filter.count)
+        metrics.set("existence.memory_bytes", tracos.existence_filter.memory_bytes)
+        metrics.set(
+            "existence.expected_fp_rate",
+            tracos.existence_filter.false_positive_rate(),
+        )
+        # every lookup follows a positive of the filter
+        if metrics["inbound.lookups"]:
+            metrics.set(
+                "existence.observed_fp_rate",
+                metrics["existence.false_positives"] / metrics["inbound.lookups"],
+            )
+    if tracos.version_cache.enabled:
+        for name, value in tracos.version_cache.stats().items():
+            metrics.set(f"cache.{name}", value)
+    tracer.report(metrics)
+    budget.report(metrics)
+    sizers.report(metrics)
+    if tracer.path is not None:
+        metrics.incr("tracing.spans", await asyncio.to_thread(tracer.flush))
+    metrics.log_summary(title)
+    return metrics
+
+
+async def start(
+    settings: Settings, motor_client: AsyncIOMotorClient | None = None
+) -> tuple[ClientERP, TracOSAdapter, CheckpointJournal]:
+    """Connects to TracOS and loads what a run starts from (filters, journal)"""
+    from adapters.client_erp_adapter import ClientERP
+    from adapters.tracos_adapter import TracOSAdapter
+    from adapters.version_cache import VersionCache
+
+    if not settings.data_outbound_dir.exists():
+        logger.info(f"Creating outbound directory {settings.data_outbound_dir}")
+        settings.data_outbound_dir.mkdir(parents=True)
+
+    tracos = TracOSAdapter(
+        settings.mongo_uri,
+        settings.mongo_database,
+        settings.mongo_collection,
+        options=settings.mongo_client_options,
+        retry_policy=settings.mongo_retry_policy,
+        update_mode=settings.inbound_update_mode,
+        version_cache=VersionCache(
+            settings.tracos_cache_size, settings.tracos_cache_ttl
+        ),
+        client=motor_client,
+    )
+    client = ClientERP()
+
+    await tracos.check_connection()
+    await tracos.ensure_indexes()
+    if settings.existence_filter:
+        await tracos.load_existence_filter(
+            settings.existence_filter_path, settings.existence_filter_error_rate
+        )
+    journal = open_checkpoint_journal(settings, tracos)
+    await journal.open()
+    return client, tracos, journal
+
+
+async def main(settings: Settings | None = None) -> int:
+    """Runs the sync, returning the exit code of the process: 1 once MongoDB is
+    given up on"""
+    from adapters.mongo_retry import MongoDBUnavailable
+
+    settings = settings or Settings.from_env()
+    settings.log()
+    try:
+        client, tracos, journal = await start(settings)
+        sizers = BatchSizers.from_settings(settings)
 
-    await sync_to_client(tracos_obj_as_client_obj, tracos, client)
+        # with an interval, the process keeps running and its caches stay warm
+        while True:
+            await run_cycle(settings, client, tracos, journal, sizers=sizers)
+            if settings.sync_interval_seconds <= 0:
+                return 0
+            await asyncio.sleep(settings.sync_interval_seconds)
+    except MongoDBUnavailable as e:
+        logger.critical(f"Shutting down: {e}")
+        return 1
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
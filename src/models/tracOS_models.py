@@ -18,6 +18,7 @@ class TracOSWorkorder(BaseModel):
     deletedAt: datetime | None = None
     isSynced: bool
     syncedAt: datetime | None = None
+    contentHash: str | None = None  # see services/fingerprint.py
 
     @field_validator("updatedAt", "createdAt", "syncedAt", "deletedAt", mode="after")
     @classmethod
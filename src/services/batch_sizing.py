@@ -0,0 +1,68 @@
+from dataclasses import dataclass, field
+
+from services.metrics import RunMetrics
+
+
+@dataclass
+class AdaptiveBatchSize:
+    """Size of the batches of one bulk MongoDB operation, tuned from how they went.
+
+    Additive increase, multiplicative decrease (as in TCP congestion control): a
+    full batch that took at most target_seconds without failures grows the size by
+    step; a slower one, or one that failed and was retried, halves it. Sizes stay
+    within [minimum, maximum]; with minimum == maximum the size is fixed.
+
+    Small batches waste round trips on a distant cluster, large ones run into
+    timeoutMS: the size settles where a batch takes about target_seconds.
+    """
+
+    size: int
+    minimum: int
+    maximum: int
+    target_seconds: float = 1.0
+    step: int = 0  # 0: a 32th of [minimum, maximum], at least 1
+    decrease: float = 0.5
+    batches: int = 0
+    items: int = 0
+    decreases: int = 0
+    smallest: int = field(init=False)
+    largest: int = field(init=False)
+
+    def __post_init__(self):
+        if not 1 <= self.minimum <= self.maximum:
+            raise ValueError("batch size bounds must satisfy 1 <= minimum <= maximum")
+        if self.target_seconds <= 0 or not 0 < self.decrease < 1:
+            raise ValueError("target_seconds must be positive, decrease in (0, 1)")
+        self.size = min(max(self.size, self.minimum), self.maximum)
+        self.step = self.step or max(1, (self.maximum - self.minimum) // 32)
+        self.smallest = self.largest = self.size
+
+    @classmethod
+    def fixed(cls, size: int) -> "AdaptiveBatchSize":
+        return cls(size, size, size)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.minimum < self.maximum
+
+    def observe(self, items: int, seconds: float, failures: int = 0) -> None:
+        """Adjusts the size after a batch of items took seconds, retries included"""
+        self.batches += 1
+        self.items += items
+        if failures or seconds > self.target_seconds:
+            self.size = max(self.minimum, int(self.size * self.decrease))
+            self.decreases += 1
+        # a partial batch says nothing about a larger size
+        elif items >= self.size:
+            self.size = min(self.maximum, self.size + self.step)
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+
+    def report(self, metrics: RunMetrics, name: str) -> None:
+        """Sets the chosen sizes as gauges of metrics, under batching.<name>"""
+        metrics.set(f"batching.{name}.size", self.size)
+        metrics.set(f"batching.{name}.smallest", self.smallest)
+        metrics.set(f"batching.{name}.largest", self.largest)
+        if self.batches:
+            metrics.set(f"batching.{name}.mean", self.items / self.batches)
+        metrics.set(f"batching.{name}.decreases", self.decreases)
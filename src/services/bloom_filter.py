@@ -0,0 +1,98 @@
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+from typing import Iterable
+
+
+class BloomFilter:
+    """Compact set of workorder numbers with no false negatives.
+
+    A number that was added is always reported as present; a number that was not
+    added is reported as present with probability false_positive_rate(). Numbers
+    cannot be removed, so deleted documents only cost false positives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, number: int) -> Iterable[int]:
+        # double hashing: k positions out of one 128-bit digest
+        digest = hashlib.blake2b(
+            number.to_bytes(8, "big", signed=True), digest_size=16
+        ).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, number: int) -> None:
+        added = False
+        for position in self._positions(number):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        # numbers added twice are counted once, colliding ones may be missed
+        if added:
+            self.count += 1
+
+    def update(self, numbers: Iterable[int]) -> None:
+        for number in numbers:
+            self.add(number)
+
+    def __contains__(self, number: int) -> bool:
+        return all(
+            self.bits[position // 8] & (1 << position % 8)
+            for position in self._positions(number)
+        )
+
+    @property
+    def is_full(self) -> bool:
+        return self.count > self.capacity
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate for the numbers added so far"""
+        filled = 1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        return filled**self.num_hashes
+
+    def save(self, path: Path, **metadata) -> None:
+        """Writes a snapshot (JSON header line followed by the bits), atomically"""
+        header = {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "count": self.count,
+            **metadata,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.tmp")
+        with open(partial, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(self.bits)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["BloomFilter", dict]:
+        """Reads a snapshot, returning the filter and the header metadata"""
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            bloom = cls(header["capacity"], header["error_rate"])
+            bits = f.read()
+        if len(bits) != len(bloom.bits):
+            raise ValueError(f"Truncated bloom filter snapshot {path}")
+        bloom.bits[:] = bits
+        bloom.count = header["count"]
+        return bloom, header
@@ -0,0 +1,28 @@
+from typing import Any, Callable, Hashable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+def keep_latest(
+    items: Iterable[T],
+    key: Callable[[T], Hashable],
+    version: Callable[[T], Any],
+) -> tuple[list[T], list[T]]:
+    """Keeps only the item with the highest version for each key.
+
+    Returns (kept, superseded). Kept items are in order of first appearance of their
+    key; on equal versions the item seen last wins.
+    """
+    latest: dict[Hashable, T] = {}
+    superseded: list[T] = []
+    for item in items:
+        k = key(item)
+        current = latest.get(k)
+        if current is None:
+            latest[k] = item
+        elif version(item) >= version(current):
+            superseded.append(current)
+            latest[k] = item
+        else:
+            superseded.append(item)
+    return list(latest.values()), superseded
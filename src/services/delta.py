@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Any
+
+import bson
+
+from services.fingerprint import canonical_value
+
+
+@dataclass(frozen=True)
+class DocumentDelta:
+    """The paths that differ between a stored document and its new version"""
+
+    set: dict[str, Any]
+    unset: tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.set or self.unset)
+
+
+def document_delta(current: dict[str, Any], target: dict[str, Any]) -> DocumentDelta:
+    """Fields of target that are new or differ from current, and fields of current
+    that target no longer has. Dates are compared at MongoDB millisecond precision."""
+    changed = {
+        name: value
+        for name, value in target.items()
+        if name not in current
+        or canonical_value(current[name]) != canonical_value(value)
+    }
+    removed = tuple(name for name in current if name not in target)
+    return DocumentDelta(changed, removed)
+
+
+def encoded_size(document: dict[str, Any]) -> int:
+    """Size in bytes of document on the wire and in the oplog"""
+    return len(bson.encode(document))
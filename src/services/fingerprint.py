@@ -0,0 +1,36 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+from models.tracOS_models import TracOSWorkorder
+
+# What a workorder says, as opposed to when it was said or synced
+CONTENT_FIELDS = (
+    "number",
+    "status",
+    "title",
+    "description",
+    "createdAt",
+    "deleted",
+    "deletedAt",
+)
+
+
+def canonical_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # MongoDB keeps milliseconds: hash stored and inbound dates the same way
+        value = value.astimezone(timezone.utc)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000).isoformat()
+    return value
+
+
+def workorder_fingerprint(order: TracOSWorkorder) -> str:
+    """Stable hash of the content of a workorder.
+
+    updatedAt and the sync bookkeeping are left out, so an ERP re-export that only
+    bumps the timestamp has the same fingerprint as the stored document.
+    """
+    content = {name: canonical_value(getattr(order, name)) for name in CONTENT_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
@@ -0,0 +1,146 @@
+import gc
+import os
+import resource
+import sys
+import time
+import types
+from typing import Any
+
+from loguru import logger
+
+from services.metrics import RunMetrics
+
+# footprint assumed for a record until one is measured
+DEFAULT_RECORD_BYTES = 16 * 1024
+# an inbound directory entry held while listing files oldest first (os.DirEntry,
+# its name and stat), measured with tracemalloc
+SCAN_ENTRY_BYTES = 1024
+# share of the budget the oldest-first listing may take
+SCAN_SHARE = 0.1
+# records deep-sized to measure the footprint of a batch
+FOOTPRINT_SAMPLE = 10
+# above this share of the limit, batches shrink to one record
+HIGH_WATER = 0.9
+# seconds between garbage collections forced by memory pressure
+GC_INTERVAL = 1.0
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process, in bytes"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def current_rss() -> int:
+    """Resident memory of this process, in bytes (the peak where /proc is missing)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Approximate bytes held by obj and everything it references (containers and
+    object attributes, pydantic models included), each object counted once"""
+    seen: set[int] = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, (type, types.ModuleType)):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return size
+
+
+class MemoryBudget:
+    """A limit on the resident memory (RSS) of the process during a run.
+
+    Batch and queue sizes are derived from it: the memory left below the limit,
+    divided by the measured footprint of a record and by how many records of that
+    kind are held at once. Sizes are recomputed for every batch, so they shrink as
+    RSS approaches the limit, down to one record at a time above HIGH_WATER.
+    A limit of 0 disables the budget: the configured sizes are used as they are.
+    """
+
+    def __init__(self, limit_bytes: int = 0):
+        if limit_bytes < 0:
+            raise ValueError("MEMORY_BUDGET_MB must not be negative")
+        self.limit = limit_bytes
+        # largest measured footprint of one record, by kind
+        self.record_bytes: dict[str, int] = {}
+        # smallest size chosen, by kind
+        self.smallest: dict[str, int] = {}
+        self.pressure = 0  # sizes chosen while RSS was above HIGH_WATER
+        self._collected = 0.0
+        if self.enabled and current_rss() >= self.limit * HIGH_WATER:
+            logger.warning(
+                f"RSS is already {current_rss() >> 20} MB, near the memory budget "
+                f"of {self.limit >> 20} MB: work is done one record at a time"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def measure(self, kind: str, held: Any, records: int) -> None:
+        """Updates the footprint of a record of kind from what records of them hold
+        (a sample of FOOTPRINT_SAMPLE records is enough)"""
+        if not self.enabled or records <= 0:
+            return
+        per_record = deep_sizeof(held) // records
+        # sizes must fit the largest records, not the average ones
+        self.record_bytes[kind] = max(self.record_bytes.get(kind, 0), per_record)
+
+    def headroom(self) -> int:
+        """Bytes left below the high-water mark of the limit"""
+        high_water = int(self.limit * HIGH_WATER)
+        rss = current_rss()
+        if rss < high_water:
+            return high_water - rss
+        self.pressure += 1
+        # unreachable cycles may be all that holds RSS above the mark
+        if time.monotonic() - self._collected > GC_INTERVAL:
+            gc.collect()
+            self._collected = time.monotonic()
+        return 0
+
+    def batch_size(self, kind: str, configured: int, in_flight: int = 1) -> int:
+        """How many records of kind a batch may hold when in_flight such batches are
+        held at once: at most configured, at least 1"""
+        if not self.enabled:
+            return configured
+        record_bytes = self.record_bytes.get(kind, DEFAULT_RECORD_BYTES)
+        allowed = self.headroom() // (record_bytes * max(in_flight, 1))
+        size = max(1, min(configured, allowed))
+        self.smallest[kind] = min(self.smallest.get(kind, size), size)
+        return size
+
+    def scan_window(self, configured: int) -> int:
+        """How many files a run may take (INBOUND_MAX_FILES): listing the inbound
+        directory oldest first holds an entry per file. A configured window is kept"""
+        if not self.enabled or configured:
+            return configured
+        return max(1, int(self.limit * SCAN_SHARE) // SCAN_ENTRY_BYTES)
+
+    def report(self, metrics: RunMetrics) -> None:
+        """Sets the peak RSS and the chosen sizes as gauges of metrics"""
+        if not self.enabled:
+            return
+        metrics.set("memory.limit_bytes", self.limit)
+        metrics.set("memory.peak_rss_bytes", peak_rss())
+        metrics.set("memory.pressure", self.pressure)
+        for kind, record_bytes in self.record_bytes.items():
+            metrics.set(f"memory.{kind}.record_bytes", record_bytes)
+        for kind, size in self.smallest.items():
+            metrics.set(f"memory.{kind}.smallest_batch", size)
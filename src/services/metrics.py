@@ -0,0 +1,34 @@
+from collections import Counter
+
+from loguru import logger
+
+
+class RunMetrics:
+    """Counters and gauges of a run, logged as a summary when the run ends"""
+
+    def __init__(self):
+        self.counters: Counter[str] = Counter()
+        self.gauges: dict[str, float] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def set(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def merge(self, other: "RunMetrics") -> None:
+        """Adds the counters of other; its gauges replace ours"""
+        self.counters.update(other.counters)
+        self.gauges.update(other.gauges)
+
+    def __getitem__(self, name: str) -> float:
+        if name in self.gauges:
+            return self.gauges[name]
+        return self.counters[name]
+
+    def log_summary(self, title: str = "Run summary") -> None:
+        logger.info(f"{title}:")
+        for name in sorted(self.counters):
+            logger.info(f"  {name}: {self.counters[name]}")
+        for name in sorted(self.gauges):
+            logger.info(f"  {name}: {self.gauges[name]:g}")
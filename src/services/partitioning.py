@@ -0,0 +1,47 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+
+def shard_of(key: str, shard_count: int) -> int:
+    """Stable shard for key. Unlike hash(), identical across processes and hosts"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+@dataclass(frozen=True)
+class WorkerPartition:
+    """Which part of the inbound directory a worker process owns.
+
+    Files are split by a hash of their name, so N workers on one or several hosts
+    sharing DATA_INBOUND_DIR process disjoint sets of files without coordination.
+    All workers must be started with the same count.
+    """
+
+    index: int = 0
+    count: int = 1
+
+    def __post_init__(self):
+        if self.count < 1:
+            raise ValueError("WORKER_COUNT must be at least 1")
+        if not 0 <= self.index < self.count:
+            raise ValueError("WORKER_INDEX must be between 0 and WORKER_COUNT - 1")
+
+    @classmethod
+    def from_env(cls) -> "WorkerPartition":
+        return cls(
+            index=int(os.getenv("WORKER_INDEX", "0")),
+            count=int(os.getenv("WORKER_COUNT", "1")),
+        )
+
+    @property
+    def is_leader(self) -> bool:
+        """The leader also runs flows that are not partitioned"""
+        return self.index == 0
+
+    def owns(self, path: Path) -> bool:
+        return self.count == 1 or shard_of(path.name, self.count) == self.index
+
+    def __str__(self) -> str:
+        return f"worker {self.index + 1}/{self.count}"
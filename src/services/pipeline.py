@@ -0,0 +1,314 @@
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+
+from loguru import logger
+
+# Marks the end of a stage's input. One is queued per worker of the next stage.
+_DONE = object()
+
+
+@dataclass
+class _SourceFailed:
+    error: Exception
+
+
+async def merge(
+    sources: list[AsyncIterable[Any]], queue_size: int = 1
+) -> AsyncIterator[Any]:
+    """Items of several async sources in the order they come, draining all the
+    sources concurrently (e.g. as the source of a Pipeline). The first source to
+    fail cancels and closes the others, and its exception is raised."""
+    queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+    async def drain(source: AsyncIterable[Any]) -> None:
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_SourceFailed(e))
+        else:
+            await queue.put(_DONE)
+        finally:
+            if inspect.isasyncgen(source):
+                await source.aclose()
+
+    tasks = [asyncio.create_task(drain(source)) for source in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, _SourceFailed):
+                raise item.error
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@dataclass
+class StageStats:
+    name: str
+    concurrency: int
+    received: int = 0
+    emitted: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0  # inside the handler
+    starved_seconds: float = 0.0  # waiting for input
+    blocked_seconds: float = 0.0  # waiting for room downstream (backpressure)
+
+    def utilization(self, elapsed: float) -> float:
+        """Share of the stage's worker time spent doing work"""
+        if elapsed <= 0:
+            return 0.0
+        return self.busy_seconds / (elapsed * self.concurrency)
+
+
+@dataclass
+class PipelineStats:
+    name: str
+    elapsed: float = 0.0
+    stages: list[StageStats] = field(default_factory=list)
+
+    @property
+    def failed(self) -> int:
+        return sum(s.failed for s in self.stages)
+
+    @property
+    def bottleneck(self) -> StageStats | None:
+        return max(self.stages, key=lambda s: s.utilization(self.elapsed), default=None)
+
+    def log_summary(self) -> None:
+        logger.info(f"{self.name} pipeline finished in {self.elapsed:.2f}s")
+        for s in self.stages:
+            logger.info(
+                f"  stage {s.name:<10} x{s.concurrency} in={s.received} out={s.emitted} "
+                f"dropped={s.dropped} failed={s.failed} "
+                f"utilization={s.utilization(self.elapsed):.0%} "
+                f"starved={s.starved_seconds:.2f}s blocked={s.blocked_seconds:.2f}s"
+            )
+        if self.bottleneck is not None and self.bottleneck.received:
+            logger.info(f"  bottleneck: {self.bottleneck.name}")
+
+
+@dataclass
+class Stage:
+    """A step of a Pipeline.
+
+    handler receives one item (or, when batched, a list of up to batch_size items)
+    and returns the item for the next stage, or None to drop it. With fan_out, it
+    returns an iterable of items instead. Blocking handlers (file I/O) run in a
+    thread so they overlap with the event loop; other sync handlers run inline.
+    A blocking fan_out handler may return a generator: it is advanced in a thread
+    one item at a time, so a large input streams through under backpressure.
+    batch_size may be a function, called for every batch, for sizes that change
+    while the pipeline runs (e.g. under a MemoryBudget).
+    """
+
+    name: str
+    handler: Callable[[Any], Any]
+    concurrency: int = 1
+    batched: bool = False
+    batch_size: int | Callable[[], int] = 1
+    batch_linger: float = 0.01  # seconds to wait once for a batch to fill up
+    blocking: bool = False
+    fan_out: bool = False
+
+    def __post_init__(self):
+        sized = callable(self.batch_size) or self.batch_size > 1
+        if self.concurrency < 1 or (
+            not callable(self.batch_size) and self.batch_size < 1
+        ):
+            raise ValueError(
+                f"stage {self.name}: concurrency and batch_size must be >= 1"
+            )
+        if sized and not self.batched:
+            raise ValueError(f"stage {self.name}: batch_size requires batched=True")
+
+    def next_batch_size(self) -> int:
+        if callable(self.batch_size):
+            return max(1, self.batch_size())
+        return self.batch_size
+
+
+class Pipeline:
+    """Stages connected by bounded asyncio.Queues.
+
+    Every stage runs `concurrency` workers. A full queue blocks the upstream stage,
+    so a slow consumer throttles the source instead of letting memory grow.
+
+    An item whose handler raises is counted as failed and the others go on, except
+    for the fatal exceptions, which stop the whole pipeline and are raised by run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stages: list[Stage],
+        queue_size: int = 100,
+        fatal: tuple[type[Exception], ...] = (),
+    ):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.fatal = fatal
+
+    async def run(self, source: Iterable[Any] | AsyncIterable[Any]) -> PipelineStats:
+        queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+        stats = PipelineStats(
+            self.name, stages=[StageStats(s.name, s.concurrency) for s in self.stages]
+        )
+        started = time.perf_counter()
+
+        async def feed():
+            if isinstance(source, AsyncIterable):
+                try:
+                    async for item in source:
+                        await queues[0].put(item)
+                finally:
+                    if inspect.isasyncgen(source):
+                        await source.aclose()
+            else:
+                for item in source:
+                    await queues[0].put(item)
+            for _ in range(self.stages[0].concurrency):
+                await queues[0].put(_DONE)
+
+        async def run_stage(index: int):
+            stage = self.stages[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            workers = [
+                self._worker(stage, queues[index], outbox, stats.stages[index])
+                for _ in range(stage.concurrency)
+            ]
+            await asyncio.gather(*workers)
+            if outbox is not None:
+                for _ in range(self.stages[index + 1].concurrency):
+                    await outbox.put(_DONE)
+
+        tasks = [asyncio.create_task(feed())]
+        tasks += [asyncio.create_task(run_stage(i)) for i in range(len(self.stages))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # a failed source (or stage) leaves the other workers waiting on their
+            # queues forever: cancel them, as merge() does
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    async def _next_batch(
+        self, stage: Stage, inbox: asyncio.Queue, stats: StageStats
+    ) -> tuple[list[Any], bool]:
+        """Up to batch_size items and whether the end of input was reached"""
+        waited = time.perf_counter()
+        item = await inbox.get()
+        stats.starved_seconds += time.perf_counter() - waited
+        if item is _DONE:
+            return [], True
+
+        batch = [item]
+        batch_size = stage.next_batch_size()
+        lingered = False
+        while len(batch) < batch_size:
+            try:
+                item = inbox.get_nowait()
+            except asyncio.QueueEmpty:
+                if lingered or stage.batch_linger <= 0:
+                    break
+                lingered = True
+                await asyncio.sleep(stage.batch_linger)
+                continue
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _worker(
+        self,
+        stage: Stage,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue | None,
+        stats: StageStats,
+    ):
+        is_async = inspect.iscoroutinefunction(stage.handler)
+        done = False
+        while not done:
+            batch, done = await self._next_batch(stage, inbox, stats)
+            if not batch:
+                continue
+            stats.received += len(batch)
+            arg = batch if stage.batched else batch[0]
+
+            busy = time.perf_counter()
+            try:
+                if is_async:
+                    result = await stage.handler(arg)
+                elif stage.blocking:
+                    result = await asyncio.to_thread(stage.handler, arg)
+                else:
+                    result = stage.handler(arg)
+            except Exception as e:
+                stats.busy_seconds += time.perf_counter() - busy
+                if isinstance(e, self.fatal):
+                    raise
+                stats.failed += len(batch)
+                logger.error(f"{self.name} pipeline, stage {stage.name}: {e!r}")
+                continue
+            stats.busy_seconds += time.perf_counter() - busy
+
+            if result is None:
+                if outbox is not None:
+                    stats.dropped += len(batch)
+                continue
+            if stage.fan_out and stage.blocking and isinstance(result, Iterator):
+                await self._emit_lazily(stage, result, outbox, stats)
+                continue
+            outputs = result if stage.fan_out else [result]
+            for output in outputs:
+                await self._emit(output, outbox, stats)
+
+    async def _emit(
+        self, output: Any, outbox: asyncio.Queue | None, stats: StageStats
+    ) -> None:
+        stats.emitted += 1
+        if outbox is not None:
+            blocked = time.perf_counter()
+            await outbox.put(output)
+            stats.blocked_seconds += time.perf_counter() - blocked
+
+    async def _emit_lazily(
+        self,
+        stage: Stage,
+        outputs: Iterator[Any],
+        outbox: asyncio.Queue | None,
+        stats: StageStats,
+    ) -> None:
+        while True:
+            busy = time.perf_counter()
+            try:
+                output = await asyncio.to_thread(next, outputs, _DONE)
+            except Exception as e:
+                if isinstance(e, self.fatal):
+                    raise
+                stats.failed += 1
+                logger.error(f"{self.name} pipeline, stage {stage.name}: {e!r}")
+                return
+            finally:
+                stats.busy_seconds += time.perf_counter() - busy
+            if output is _DONE:
+                return
+            await self._emit(output, outbox, stats)
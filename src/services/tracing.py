@@ -0,0 +1,253 @@
+import inspect
+import json
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable
+
+from loguru import logger
+
+from services.metrics import RunMetrics
+from services.partitioning import shard_of
+
+# OTLP enum values (opentelemetry/proto/trace/v1/trace.proto)
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+LAG_PERCENTILES = (50, 90, 99)
+# lags kept per flow for the percentiles; beyond that, a uniform sample of them
+LAG_SAMPLES = 100_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# resolution of the sampling decision
+_SAMPLING_SHARDS = 1_000_000
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of values, which must be sorted"""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def datetime_ns(value: datetime) -> int:
+    """ns since the epoch of an aware datetime, without float rounding"""
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+
+
+def _attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        # int64 values are strings in OTLP JSON
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@dataclass
+class RecordTrace:
+    """Spans of one sampled record crossing a pipeline, in ns since the epoch.
+
+    The trace starts at origin_ns, when the record came to exist outside this
+    process: the mtime of its inbound file, or the updatedAt of a TracOS workorder.
+    """
+
+    flow: str
+    key: str
+    origin_ns: int
+    attributes: dict[str, Any] = field(default_factory=dict)
+    spans: list[tuple[str, int, int]] = field(default_factory=list)
+    trace_id: str = field(default_factory=lambda: os.urandom(16).hex())
+
+    def span(self, name: str, start_ns: int, end_ns: int) -> None:
+        self.spans.append((name, start_ns, end_ns))
+
+    def to_otlp(self, end_ns: int, error: str | None = None) -> list[dict[str, Any]]:
+        """The root span of the record and one child span per step"""
+        root_id = os.urandom(8).hex()
+        root = {
+            "traceId": self.trace_id,
+            "spanId": root_id,
+            "parentSpanId": "",
+            "name": f"{self.flow}.workorder",
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.origin_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [
+                _attribute("sync.flow", self.flow),
+                _attribute("sync.key", self.key),
+                _attribute("sync.lag_seconds", (end_ns - self.origin_ns) / 1e9),
+                *(_attribute(k, v) for k, v in self.attributes.items()),
+            ],
+            "status": (
+                {"code": STATUS_CODE_ERROR, "message": error}
+                if error
+                else {"code": STATUS_CODE_OK}
+            ),
+        }
+        children = [
+            {
+                "traceId": self.trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": root_id,
+                "name": f"{self.flow}.{name}",
+                "kind": SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(end),
+                "status": {"code": STATUS_CODE_OK},
+            }
+            for name, start_ns, end in self.spans
+        ]
+        return [root, *children]
+
+
+class Tracer:
+    """Per-record trace spans and end-to-end lag of a run.
+
+    A sample_rate share of the records is traced (chosen by a hash of their key,
+    so a record is sampled the same way in every run); their spans are appended to
+    path as OpenTelemetry (OTLP/JSON) export requests, one per line, the format of
+    the collector's file exporter. No collector is needed to produce them.
+
+    The end-to-end lag is observed for every record, sampled or not, and reported
+    as percentiles in the run metrics (over a reservoir of LAG_SAMPLES lags per
+    flow, so a long run takes no more memory).
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        sample_rate: float = 0.0,
+        service_name: str = "tractian-sync",
+    ):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("TRACE_SAMPLE_RATE must be between 0 and 1")
+        self.path = path
+        # nothing to write spans to: sample nothing
+        self.sample_rate = sample_rate if path is not None else 0.0
+        self.service_name = service_name
+        self.lags: dict[str, list[float]] = {}
+        self._observed: dict[str, int] = {}
+        self._max_lag: dict[str, float] = {}
+        self._random = random.Random(0)
+        self._spans: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def start(
+        self, flow: str, key: str, origin_ns: int, **attributes: Any
+    ) -> RecordTrace | None:
+        """A trace for the record, or None if it is not sampled"""
+        if self.sample_rate <= 0:
+            return None
+        if shard_of(key, _SAMPLING_SHARDS) >= self.sample_rate * _SAMPLING_SHARDS:
+            return None
+        return RecordTrace(flow, key, origin_ns, attributes)
+
+    def finish(self, trace: RecordTrace | None, error: str | None = None) -> None:
+        if trace is None:
+            return
+        spans = trace.to_otlp(time.time_ns(), error)
+        with self._lock:
+            self._spans.extend(spans)
+
+    def observe_lag(self, flow: str, origin_ns: int, end_ns: int) -> None:
+        """Records the end-to-end lag of one record of flow"""
+        lag = (end_ns - origin_ns) / 1e9
+        with self._lock:
+            lags = self.lags.setdefault(flow, [])
+            observed = self._observed[flow] = self._observed.get(flow, 0) + 1
+            self._max_lag[flow] = max(self._max_lag.get(flow, lag), lag)
+            if len(lags) < LAG_SAMPLES:
+                lags.append(lag)
+                return
+            # reservoir sampling: every lag observed is kept with the same chance
+            slot = self._random.randrange(observed)
+            if slot < LAG_SAMPLES:
+                lags[slot] = lag
+
+    def stage(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        finish: bool = False,
+    ) -> Callable[[Any], Any]:
+        """Wraps a pipeline stage handler to add a span to the traces of the items
+        it handles (item.traces, or of every item of a batch). An item the handler
+        drops, or that reaches the last stage (finish), ends its traces."""
+        if self.sample_rate <= 0:
+            return handler
+
+        def record(arg: Any, result: Any, start_ns: int) -> None:
+            end_ns = time.time_ns()
+            for trace in _traces(result if result is not None else arg):
+                trace.span(name, start_ns, end_ns)
+                if finish or result is None:
+                    self.finish(trace, None if finish else f"dropped at {name}")
+
+        if inspect.iscoroutinefunction(handler):
+
+            @wraps(handler)
+            async def traced_async(arg: Any) -> Any:
+                start_ns = time.time_ns()
+                result = await handler(arg)
+                record(arg, result, start_ns)
+                return result
+
+            return traced_async
+
+        @wraps(handler)
+        def traced(arg: Any) -> Any:
+            start_ns = time.time_ns()
+            result = handler(arg)
+            record(arg, result, start_ns)
+            return result
+
+        return traced
+
+    def flush(self) -> int:
+        """Appends the finished spans to path, returning how many were written"""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans or self.path is None:
+            return 0
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [_attribute("service.name", self.service_name)]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "tractian.sync"}, "spans": spans}
+                    ],
+                }
+            ]
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request) + "\n")
+        logger.info(f"Wrote {len(spans)} trace spans to {self.path}")
+        return len(spans)
+
+    def report(self, metrics: RunMetrics) -> None:
+        """Sets the lag percentiles of every flow as gauges of metrics"""
+        for flow, lags in self.lags.items():
+            lags.sort()
+            for p in LAG_PERCENTILES:
+                metrics.set(f"{flow}.lag_p{p}_seconds", percentile(lags, p))
+            metrics.set(f"{flow}.lag_max_seconds", self._max_lag[flow])
+
+
+def _traces(item: Any) -> list[RecordTrace]:
+    if isinstance(item, list):
+        return [trace for i in item for trace in _traces(i)]
+    return item.traces
@@ -1,6 +1,38 @@
+from typing import Any
+
+from pydantic_core import to_jsonable_python
+
 from models.customer_system_models import CustomerSystemWorkorder
 from models.tracOS_models import TracOSWorkorder, TracOSStatus
 
+# tracos_to_client as an aggregation $project stage: MongoDB returns workorder
+# documents already in client shape (dates are still BSON dates, see client_json)
+TRACOS_TO_CLIENT_PROJECTION: dict[str, Any] = {
+    "_id": 0,
+    "orderNo": "$number",
+    "isActive": {"$eq": ["$status", "in_progress"]},
+    "isCanceled": {"$eq": ["$status", "cancelled"]},
+    "isDeleted": "$deleted",
+    "isDone": {"$eq": ["$status", "completed"]},
+    "isOnHold": {"$eq": ["$status", "on_hold"]},
+    "isPending": {"$eq": ["$status", "pending"]},
+    "isSynced": {"$literal": True},
+    "summary": "$description",
+    "creationDate": "$createdAt",
+    "lastUpdateDate": "$updatedAt",
+    "deletedDate": {"$ifNull": ["$deletedAt", None]},
+}
+# OUTBOUND_TRANSLATION: tracos_to_client in Python, or the projection in MongoDB
+OUTBOUND_TRANSLATIONS = ("python", "server")
+STATUS_FLAGS = (
+    "isActive",
+    "isCanceled",
+    "isDeleted",
+    "isDone",
+    "isOnHold",
+    "isPending",
+)
+
 
 def customer_bool_to_tracos_status(
     customer_obj: CustomerSystemWorkorder,
@@ -50,3 +82,24 @@ def tracos_to_client(left: TracOSWorkorder) -> CustomerSystemWorkorder:
         lastUpdateDate=left.updatedAt,
         deletedDate=left.deletedAt,
     )
+
+
+def client_json(projected: dict[str, Any]) -> dict[str, Any]:
+    """Serializes a document returned by TRACOS_TO_CLIENT_PROJECTION exactly as
+    tracos_to_client(...).model_dump(mode="json") would: same field order, same
+    date format. Raises ValueError where CustomerSystemWorkorder would not validate
+    """
+    if sum(bool(projected.get(flag)) for flag in STATUS_FLAGS) != 1:
+        raise ValueError(
+            f"Workorder {projected.get('orderNo')}: exactly one of "
+            f"{', '.join(STATUS_FLAGS)} must be True"
+        )
+    try:
+        return {
+            name: to_jsonable_python(projected[name])
+            for name in CustomerSystemWorkorder.model_fields
+        }
+    except KeyError as e:
+        raise ValueError(
+            f"Workorder {projected.get('orderNo')}: missing field {e}"
+        ) from None
@@ -0,0 +1,230 @@
+"""Configuration of a run, read from environment variables and the .env file."""
+import os
+import socket
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from adapters.mongo_options import MongoClientOptions
+from adapters.scan_options import ScanOptions
+from services.partitioning import WorkerPartition
+
+if TYPE_CHECKING:
+    from adapters.mongo_retry import RetryPolicy
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Everything main.py needs to know about its environment.
+
+    Built once per process by main() (Settings.from_env()), or directly by tests
+    and embedding code. Nothing is read from the environment at import time.
+    """
+
+    data_inbound_dir: Path = Path("data/inbound")
+    data_outbound_dir: Path = Path("data/outbound")
+    data_archive_dir: Path = Path("data/archive")
+    data_dead_letter_dir: Path = Path("data/dead_letter")
+    archive_compress: bool = False
+    inbound_scan_options: ScanOptions = field(default_factory=ScanOptions)
+    outbound_layout: str = "flat"
+    outbound_bundle_format: str | None = None
+    outbound_bundle_dir: Path = Path("data/outbound/bundles")
+    outbound_bundle_max_files: int = 1000
+    mongo_uri: str = "mongodb://localhost:27017"
+    mongo_database: str = "tractian"
+    mongo_collection: str = "workorders"
+    mongo_client_options: MongoClientOptions = field(default_factory=MongoClientOptions)
+    # None: RetryPolicy defaults (the module imports pymongo)
+    mongo_retry_policy: "RetryPolicy | None" = None
+    inbound_update_mode: str = "full"
+    tracos_cache_size: int = 10000
+    tracos_cache_ttl: float = 300.0
+    sync_interval_seconds: float = 0.0
+    existence_filter: bool = True
+    existence_filter_error_rate: float = 0.01
+    existence_filter_path: Path = Path("data/checkpoints/existing-numbers-0.bloom")
+    worker_partition: WorkerPartition = field(default_factory=WorkerPartition)
+    exporter_id: str = field(
+        default_factory=lambda: f"{socket.gethostname()}:{os.getpid()}"
+    )
+    outbound_batch_size: int = 500
+    outbound_lease_seconds: float = 300.0
+    outbound_translation: str = "python"
+    outbound_partitions: int = 1
+    checkpoint_journal: str = "file"
+    checkpoint_path: Path = Path("data/checkpoints/worker-0.jsonl")
+    checkpoint_collection: str = "sync_checkpoints"
+    pipeline_queue_size: int = 100
+    inbound_read_concurrency: int = 8
+    inbound_sync_concurrency: int = 2
+    inbound_sync_batch_size: int = 100
+    outbound_export_concurrency: int = 2
+    # None: no trace spans are written (lag percentiles are always reported)
+    trace_path: Path | None = None
+    trace_sample_rate: float = 0.01
+    # 0: no budget, batch and queue sizes are used as configured
+    memory_budget_mb: int = 0
+    # batches of bulk TracOS operations: configured sizes, or tuned within [min, max]
+    adaptive_batching: bool = False
+    batch_size_min: int = 10
+    batch_size_max: int = 5000
+    batch_target_seconds: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Reads the settings from environment variables, after loading .env"""
+        from adapters.mongo_retry import RetryPolicy
+
+        load_dotenv()
+        data_outbound_dir = Path(os.getenv("DATA_OUTBOUND_DIR", "data/outbound"))
+        worker_partition = WorkerPartition.from_env()
+        return cls(
+            data_inbound_dir=Path(os.getenv("DATA_INBOUND_DIR", "data/inbound")),
+            data_outbound_dir=data_outbound_dir,
+            data_archive_dir=Path(os.getenv("DATA_ARCHIVE_DIR", "data/archive")),
+            data_dead_letter_dir=Path(
+                os.getenv("DATA_DEAD_LETTER_DIR", "data/dead_letter")
+            ),
+            archive_compress=_env_flag("ARCHIVE_COMPRESS"),
+            inbound_scan_options=ScanOptions.from_env(),
+            outbound_layout=os.getenv("OUTBOUND_LAYOUT", "flat"),
+            outbound_bundle_format=os.getenv("OUTBOUND_BUNDLE_FORMAT") or None,
+            outbound_bundle_dir=Path(
+                os.getenv("OUTBOUND_BUNDLE_DIR", str(data_outbound_dir / "bundles"))
+            ),
+            outbound_bundle_max_files=int(
+                os.getenv("OUTBOUND_BUNDLE_MAX_FILES", "1000")
+            ),
+            mongo_uri=os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+            mongo_database=os.getenv("MONGO_DATABASE", "tractian"),
+            mongo_collection=os.getenv("MONGO_COLLECTION", "workorders"),
+            mongo_client_options=MongoClientOptions.from_env(),
+            mongo_retry_policy=RetryPolicy.from_env(),
+            inbound_update_mode=os.getenv("INBOUND_UPDATE_MODE", "full"),
+            tracos_cache_size=int(os.getenv("TRACOS_CACHE_SIZE", "10000")),
+            tracos_cache_ttl=float(os.getenv("TRACOS_CACHE_TTL", "300")),
+            sync_interval_seconds=float(os.getenv("SYNC_INTERVAL_SECONDS", "0")),
+            existence_filter=_env_flag("EXISTENCE_FILTER", "true"),
+            existence_filter_error_rate=float(
+                os.getenv("EXISTENCE_FILTER_ERROR_RATE", "0.01")
+            ),
+            existence_filter_path=Path(
+                os.getenv(
+                    "EXISTENCE_FILTER_PATH",
+                    f"data/checkpoints/existing-numbers-{worker_partition.index}.bloom",
+                )
+            ),
+            worker_partition=worker_partition,
+            exporter_id=os.getenv(
+                "EXPORTER_ID", f"{socket.gethostname()}:{os.getpid()}"
+            ),
+            outbound_batch_size=int(os.getenv("OUTBOUND_BATCH_SIZE", "500")),
+            outbound_lease_seconds=float(os.getenv("OUTBOUND_LEASE_SECONDS", "300")),
+            outbound_translation=os.getenv("OUTBOUND_TRANSLATION", "python"),
+            outbound_partitions=int(os.getenv("OUTBOUND_PARTITIONS", "1")),
+            checkpoint_journal=os.getenv("CHECKPOINT_JOURNAL", "file"),
+            checkpoint_path=Path(
+                os.getenv(
+                    "CHECKPOINT_PATH",
+                    f"data/checkpoints/worker-{worker_partition.index}.jsonl",
+                )
+            ),
+            checkpoint_collection=os.getenv(
+                "CHECKPOINT_COLLECTION", "sync_checkpoints"
+            ),
+            pipeline_queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "100")),
+            inbound_read_concurrency=int(os.getenv("INBOUND_READ_CONCURRENCY", "8")),
+            inbound_sync_concurrency=int(os.getenv("INBOUND_SYNC_CONCURRENCY", "2")),
+            inbound_sync_batch_size=int(os.getenv("INBOUND_SYNC_BATCH_SIZE", "100")),
+            outbound_export_concurrency=int(
+                os.getenv("OUTBOUND_EXPORT_CONCURRENCY", "2")
+            ),
+            trace_path=Path(os.environ["TRACE_PATH"])
+            if os.getenv("TRACE_PATH")
+            else None,
+            trace_sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")),
+            memory_budget_mb=int(os.getenv("MEMORY_BUDGET_MB", "0")),
+            adaptive_batching=_env_flag("ADAPTIVE_BATCHING", "false"),
+            batch_size_min=int(os.getenv("BATCH_SIZE_MIN", "10")),
+            batch_size_max=int(os.getenv("BATCH_SIZE_MAX", "5000")),
+            batch_target_seconds=float(os.getenv("BATCH_TARGET_SECONDS", "1")),
+        )
+
+    @property
+    def worker_owner(self) -> str:
+        """Owner of this worker's watermark and MongoDB checkpoints. Includes the
+        collection, as tenants may share a database"""
+        return f"{self.mongo_collection}:worker-{self.worker_partition.index}"
+
+    def log(self) -> None:
+        """Logs the effective settings, for conference at startup"""
+        for name, value in (
+            ("DATA_INBOUND_DIR", self.data_inbound_dir),
+            ("DATA_OUTBOUND_DIR", self.data_outbound_dir),
+            ("DATA_ARCHIVE_DIR", self.data_archive_dir),
+            ("DATA_DEAD_LETTER_DIR", self.data_dead_letter_dir),
+            ("ARCHIVE_COMPRESS", self.archive_compress),
+            ("INBOUND_SCAN_OPTIONS", self.inbound_scan_options),
+            ("OUTBOUND_LAYOUT", self.outbound_layout),
+            (
+                "OUTBOUND_BUNDLE",
+                f"format={self.outbound_bundle_format} "
+                f"dir={self.outbound_bundle_dir} "
+                f"max_files={self.outbound_bundle_max_files}",
+            ),
+            ("MONGO_URI", self.mongo_uri),
+            ("MONGO_DATABASE", self.mongo_database),
+            ("MONGO_COLLECTION", self.mongo_collection),
+            ("MONGO_CLIENT_OPTIONS", self.mongo_client_options),
+            ("MONGO_RETRY_POLICY", self.mongo_retry_policy),
+            ("INBOUND_UPDATE_MODE", self.inbound_update_mode),
+            (
+                "TRACOS_CACHE",
+                f"size={self.tracos_cache_size} ttl={self.tracos_cache_ttl}",
+            ),
+            ("SYNC_INTERVAL_SECONDS", self.sync_interval_seconds),
+            (
+                "EXISTENCE_FILTER",
+                f"enabled={self.existence_filter} "
+                f"error_rate={self.existence_filter_error_rate} "
+                f"path={self.existence_filter_path}",
+            ),
+            ("WORKER_PARTITION", self.worker_partition),
+            ("EXPORTER_ID", self.exporter_id),
+            ("OUTBOUND_BATCH_SIZE", self.outbound_batch_size),
+            ("OUTBOUND_LEASE_SECONDS", self.outbound_lease_seconds),
+            ("OUTBOUND_TRANSLATION", self.outbound_translation),
+            ("OUTBOUND_PARTITIONS", self.outbound_partitions),
+            (
+                "CHECKPOINT",
+                f"journal={self.checkpoint_journal} path={self.checkpoint_path} "
+                f"collection={self.checkpoint_collection}",
+            ),
+            (
+                "PIPELINE",
+                f"queue_size={self.pipeline_queue_size} "
+                f"read={self.inbound_read_concurrency} "
+                f"sync={self.inbound_sync_concurrency}x{self.inbound_sync_batch_size} "
+                f"export={self.outbound_export_concurrency}",
+            ),
+            (
+                "TRACE",
+                f"path={self.trace_path} sample_rate={self.trace_sample_rate}",
+            ),
+            ("MEMORY_BUDGET_MB", self.memory_budget_mb),
+            (
+                "ADAPTIVE_BATCHING",
+                f"enabled={self.adaptive_batching} "
+                f"min={self.batch_size_min} max={self.batch_size_max} "
+                f"target_seconds={self.batch_target_seconds}",
+            ),
+        ):
+            logger.info(f"VARIABLE VALUE FOR CONFERENCE -> {name}: {value}")
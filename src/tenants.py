@@ -0,0 +1,235 @@
+"""Syncs many customers (tenants) concurrently in one process.
+
+Usage: python src/tenants.py tenants.json
+
+The config file lists the tenants and what sets them apart from the environment
+settings (see settings.py), by Settings field name:
+
+    {
+      "max_active": 4,
+      "tenants": [
+        {
+          "name": "acme",
+          "mongo_collection": "acme_workorders",
+          "data_inbound_dir": "data/acme/inbound",
+          "data_outbound_dir": "data/acme/outbound",
+          "data_archive_dir": "data/acme/archive",
+          "data_dead_letter_dir": "data/acme/dead_letter",
+          "inbound_read_concurrency": 2,
+          "inbound_scan_options": {"max_files": 500}
+        }
+      ]
+    }
+
+Every tenant needs its own MongoDB collection and data directories.
+
+All tenants share one Motor client (one connection pool). Tenants run one cycle
+at a time, at most max_active of them at once, and take turns in a round-robin
+queue; scan limits bound each cycle, so a tenant with a large backlog cannot hold
+a slot for long. With SYNC_INTERVAL_SECONDS set, every tenant is queued again
+that long after its cycle ends.
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+from services.metrics import RunMetrics
+from settings import Settings
+
+# per-tenant files that would collide if every tenant used the default path
+TENANT_PATHS = {
+    "checkpoint_path": "worker-{index}.jsonl",
+    "existence_filter_path": "existing-numbers-{index}.bloom",
+    "trace_path": "traces-{index}.jsonl",
+}
+# directories a tenant reads from or moves files into, never shared by two tenants
+TENANT_DIRS = (
+    "data_inbound_dir",
+    "data_outbound_dir",
+    "data_archive_dir",
+    "data_dead_letter_dir",
+)
+
+
+@dataclass
+class Tenant:
+    """A customer deployment and the totals of its cycles"""
+
+    name: str
+    settings: Settings
+    cycles: int = 0
+    failures: int = 0
+    metrics: RunMetrics = field(default_factory=RunMetrics)
+
+
+def _override(setting: str, value: Any, override: Any) -> Any:
+    """Converts a config file value to the type of the Settings field it replaces"""
+    if dataclasses.is_dataclass(value) and isinstance(override, dict):
+        return dataclasses.replace(value, **override)
+    if isinstance(value, Path) or (setting in TENANT_PATHS and override is not None):
+        return Path(override)
+    return override
+
+
+def tenant_settings(base: Settings, name: str, overrides: dict[str, Any]) -> Settings:
+    fields = {f.name for f in dataclasses.fields(Settings)}
+    unknown = set(overrides) - fields
+    if unknown:
+        raise ValueError(f"Tenant {name}: unknown settings {sorted(unknown)}")
+    # one client for all tenants: its settings cannot differ between tenants
+    shared = {"mongo_uri", "mongo_client_options"} & set(overrides)
+    if shared:
+        raise ValueError(f"Tenant {name}: {sorted(shared)} are shared by all tenants")
+
+    index = base.worker_partition.index
+    for setting, filename in TENANT_PATHS.items():
+        # a feature that is off (no path) stays off
+        if getattr(base, setting) is None:
+            continue
+        overrides.setdefault(
+            setting, Path("data/checkpoints") / name / filename.format(index=index)
+        )
+    return dataclasses.replace(
+        base,
+        **{
+            setting: _override(setting, getattr(base, setting), value)
+            for setting, value in overrides.items()
+        },
+    )
+
+
+def load_tenants(path: Path, base: Settings) -> tuple[list[Tenant], int]:
+    """Reads the tenants config file, returning the tenants and max_active"""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    tenants = []
+    for entry in config["tenants"]:
+        overrides = dict(entry)
+        name = overrides.pop("name")
+        tenants.append(Tenant(name, tenant_settings(base, name, overrides)))
+
+    names = [tenant.name for tenant in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError("Tenant names must be unique")
+    collections = {
+        (t.settings.mongo_database, t.settings.mongo_collection) for t in tenants
+    }
+    if len(collections) != len(tenants):
+        raise ValueError("Every tenant needs its own MongoDB collection")
+    owners: dict[Path, str] = {}
+    for tenant in tenants:
+        settings = tenant.settings
+        dirs = [(setting, getattr(settings, setting)) for setting in TENANT_DIRS]
+        if settings.outbound_bundle_format:
+            dirs.append(("outbound_bundle_dir", settings.outbound_bundle_dir))
+        for setting, directory in dirs:
+            owner = owners.setdefault(directory.resolve(), tenant.name)
+            if owner != tenant.name:
+                raise ValueError(
+                    f"Tenants {owner} and {tenant.name} share the directory {directory} ({setting})"
+                )
+    max_active = int(config.get("max_active", os.getenv("TENANTS_MAX_ACTIVE", "4")))
+    if max_active < 1:
+        raise ValueError("max_active must be at least 1")
+    return tenants, max_active
+
+
+class TenantScheduler:
+    """Runs the cycles of many tenants, at most max_active at once, round-robin.
+
+    A tenant whose cycle fails (including a MongoDB give-up, which exits a
+    single-tenant process with code 1) is logged and queued again like the others.
+    """
+
+    def __init__(
+        self,
+        tenants: list[Tenant],
+        cycle: Callable[[Tenant], Awaitable[RunMetrics]],
+        max_active: int,
+        interval: float = 0.0,
+    ):
+        self.tenants = tenants
+        self.cycle = cycle
+        self.max_active = max_active
+        self.interval = interval
+        self.queue: asyncio.Queue[Tenant] = asyncio.Queue()
+
+    async def _run_one(self, tenant: Tenant) -> None:
+        try:
+            tenant.metrics.merge(await self.cycle(tenant))
+        except Exception as e:
+            tenant.failures += 1
+            logger.error(f"Tenant {tenant.name}: cycle failed: {e!r}")
+        tenant.cycles += 1
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.interval <= 0 and self.queue.empty():
+                return
+            tenant = await self.queue.get()
+            await self._run_one(tenant)
+            if self.interval > 0:
+                loop.call_later(self.interval, self.queue.put_nowait, tenant)
+
+    async def run(self) -> None:
+        for tenant in self.tenants:
+            self.queue.put_nowait(tenant)
+        workers = min(self.max_active, len(self.tenants))
+        await asyncio.gather(*(self._worker() for _ in range(workers)))
+
+    def log_summary(self) -> None:
+        for tenant in self.tenants:
+            tenant.metrics.log_summary(
+                f"Tenant {tenant.name} ({tenant.cycles} cycles, {tenant.failures} failed)"
+            )
+
+
+async def run_tenants(config: Path) -> int:
+    """Runs every tenant of the config file, returning the number of failed cycles"""
+    import main
+    from adapters.tracos_adapter import motor_client
+
+    base = Settings.from_env()
+    base.log()
+    tenants, max_active = load_tenants(config, base)
+    logger.info(f"Running {len(tenants)} tenants, {max_active} at a time")
+    shared = motor_client(base.mongo_uri, base.mongo_client_options)
+    started = {}
+
+    async def cycle(tenant: Tenant) -> RunMetrics:
+        if tenant.name not in started:
+            started[tenant.name] = (
+                *await main.start(tenant.settings, shared),
+                main.BatchSizers.from_settings(tenant.settings),
+            )
+        client, tracos, journal, sizers = started[tenant.name]
+        return await main.run_cycle(
+            tenant.settings,
+            client,
+            tracos,
+            journal,
+            f"Tenant {tenant.name} cycle",
+            sizers,
+        )
+
+    scheduler = TenantScheduler(tenants, cycle, max_active, base.sync_interval_seconds)
+    try:
+        await scheduler.run()
+    finally:
+        scheduler.log_summary()
+        shared.close()
+    return sum(tenant.failures for tenant in tenants)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python src/tenants.py tenants.json")
+    sys.exit(1 if asyncio.run(run_tenants(Path(sys.argv[1]))) else 0)
@@ -0,0 +1,42 @@
+"""Runs N partitioned copies of main.py on this host.
+
+Usage: python src/workers.py N
+
+Every worker gets WORKER_INDEX/WORKER_COUNT, so together they split the inbound
+directory (see services/partitioning.py). Workers on other hosts can join by
+running main.py with the same WORKER_COUNT and their own WORKER_INDEX.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from loguru import logger
+
+MAIN = Path(__file__).resolve().parent / "main.py"
+
+
+def run_workers(count: int) -> int:
+    """Starts count workers, waits for all of them and returns the exit code of the
+    first one that failed: its own, or 1 if a signal killed it (e.g. OOM kill)"""
+    processes = []
+    for index in range(count):
+        env = {**os.environ, "WORKER_INDEX": str(index), "WORKER_COUNT": str(count)}
+        processes.append(subprocess.Popen([sys.executable, str(MAIN)], env=env))
+    logger.info(f"Started {count} workers")
+
+    exit_codes = [process.wait() for process in processes]
+    for index, code in enumerate(exit_codes):
+        if code < 0:
+            logger.error(f"Worker {index + 1}/{count} was killed by signal {-code}")
+        elif code != 0:
+            logger.error(f"Worker {index + 1}/{count} exited with code {code}")
+    # Popen reports a worker killed by a signal with a negative code
+    failed = next((code for code in exit_codes if code != 0), 0)
+    return 1 if failed < 0 else failed
+
+
+if __name__ == "__main__":
+    sys.exit(
+        run_workers(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
+    )
@@ -0,0 +1,71 @@
+import pytest
+
+from services.batch_sizing import AdaptiveBatchSize
+from services.metrics import RunMetrics
+
+
+class TestAdaptiveBatchSize:
+    """Tests for AdaptiveBatchSize"""
+
+    def test_full_fast_batches_grow_by_step(self):
+        sizer = AdaptiveBatchSize(100, 10, 1000, target_seconds=1.0, step=50)
+        sizer.observe(100, 0.1)
+        sizer.observe(150, 0.1)
+        assert sizer.size == 200
+        assert sizer.largest == 200
+
+    def test_partial_batches_do_not_grow(self):
+        sizer = AdaptiveBatchSize(100, 10, 1000, step=50)
+        sizer.observe(30, 0.1)
+        assert sizer.size == 100
+
+    def test_slow_or_failed_batches_halve(self):
+        sizer = AdaptiveBatchSize(400, 10, 1000, target_seconds=1.0)
+        sizer.observe(400, 1.5)
+        assert sizer.size == 200
+        sizer.observe(200, 0.1, failures=1)
+        assert sizer.size == 100
+        assert sizer.decreases == 2
+        assert sizer.smallest == 100
+
+    def test_sizes_stay_within_bounds(self):
+        sizer = AdaptiveBatchSize(5000, 10, 100, step=1000)
+        assert sizer.size == 100
+        sizer.observe(100, 0.1)
+        assert sizer.size == 100
+        for _ in range(10):
+            sizer.observe(sizer.size, 5.0)
+        assert sizer.size == 10
+
+    def test_settles_where_batches_take_about_the_target(self):
+        # a batch takes 10 ms per item: 100 items fit in target_seconds
+        sizer = AdaptiveBatchSize(10, 1, 1000, target_seconds=1.0, step=10)
+        for _ in range(200):
+            sizer.observe(sizer.size, sizer.size * 0.01)
+        assert 50 <= sizer.size <= 110
+
+    def test_fixed_size_never_changes(self):
+        sizer = AdaptiveBatchSize.fixed(500)
+        sizer.observe(500, 60.0, failures=3)
+        sizer.observe(500, 0.0)
+        assert sizer.size == 500
+        assert not sizer.adaptive
+
+    def test_report_sets_gauges(self):
+        sizer = AdaptiveBatchSize(100, 10, 1000, step=100)
+        sizer.observe(100, 0.1)
+        sizer.observe(200, 2.0)
+        metrics = RunMetrics()
+
+        sizer.report(metrics, "inbound_write")
+
+        assert metrics["batching.inbound_write.size"] == 100
+        assert metrics["batching.inbound_write.largest"] == 200
+        assert metrics["batching.inbound_write.mean"] == 150
+        assert metrics["batching.inbound_write.decreases"] == 1
+
+    def test_invalid_bounds_rejected(self):
+        with pytest.raises(ValueError):
+            AdaptiveBatchSize(10, 100, 10)
+        with pytest.raises(ValueError):
+            AdaptiveBatchSize(10, 1, 100, decrease=1)
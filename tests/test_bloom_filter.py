@@ -0,0 +1,51 @@
+import pytest
+
+from services.bloom_filter import BloomFilter
+
+
+class TestBloomFilter:
+    """Tests for BloomFilter"""
+
+    def test_added_numbers_are_always_found(self):
+        bloom = BloomFilter(capacity=10_000)
+        bloom.update(range(0, 20_000, 2))
+        assert all(number in bloom for number in range(0, 20_000, 2))
+
+    def test_false_positive_rate_stays_near_target(self):
+        bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+        bloom.update(range(10_000))
+
+        false_positives = sum(n in bloom for n in range(10_000, 60_000))
+
+        assert false_positives / 50_000 < 0.02
+        assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+    def test_memory_is_about_ten_bits_per_number(self):
+        bloom = BloomFilter(capacity=100_000, error_rate=0.01)
+        assert bloom.memory_bytes < 100_000 * 10 / 8 * 1.1
+
+    def test_snapshot_round_trip(self, tmp_path):
+        bloom = BloomFilter(capacity=1000)
+        bloom.update([3, 5, 8])
+        snapshot = tmp_path / "numbers.bloom"
+
+        bloom.save(snapshot, scannedAt="2025-06-01T00:00:00+00:00")
+        loaded, header = BloomFilter.load(snapshot)
+
+        assert loaded.bits == bloom.bits
+        assert loaded.count == 3
+        assert header["scannedAt"] == "2025-06-01T00:00:00+00:00"
+        assert not list(tmp_path.glob(".*"))
+
+    def test_truncated_snapshot_is_rejected(self, tmp_path):
+        snapshot = tmp_path / "numbers.bloom"
+        BloomFilter(capacity=1000).save(snapshot)
+        snapshot.write_bytes(snapshot.read_bytes()[:-10])
+
+        with pytest.raises(ValueError):
+            BloomFilter.load(snapshot)
+
+    def test_filter_is_full_past_capacity(self):
+        bloom = BloomFilter(capacity=10)
+        bloom.update(range(11))
+        assert bloom.is_full
@@ -0,0 +1,152 @@
+import pytest
+
+from adapters.checkpoint_journal import (
+    CheckpointJournal,
+    CompletedKeys,
+    DisabledJournal,
+    FileJournal,
+    PositionRanges,
+)
+
+
+class TestFileJournal:
+    """Tests for FileJournal"""
+
+    @pytest.mark.asyncio
+    async def test_recorded_keys_survive_a_restart(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.open()
+        await journal.record("inbound", ["a#1", "a#2"])
+        await journal.record("outbound", ["7:2025-01-01T00:00:00+00:00"])
+
+        restarted = FileJournal(path)
+        await restarted.open()
+
+        assert restarted.is_done("inbound", "a#2")
+        assert not restarted.is_done("inbound", "a#3")
+        assert restarted.is_done("outbound", "7:2025-01-01T00:00:00+00:00")
+
+    @pytest.mark.asyncio
+    async def test_truncated_last_entry_is_ignored(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.record("inbound", ["a#1"])
+        with open(path, "a") as f:
+            f.write('{"phase": "inbound", "ke')
+
+        restarted = FileJournal(path)
+        await restarted.open()
+
+        assert restarted.is_done("inbound", "a#1")
+
+    @pytest.mark.asyncio
+    async def test_clear_forgets_everything(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.record("inbound", ["a#1"])
+
+        await journal.clear()
+        restarted = FileJournal(path)
+        await restarted.open()
+
+        assert not path.exists()
+        assert not restarted.is_done("inbound", "a#1")
+
+    @pytest.mark.asyncio
+    async def test_forgotten_keys_are_compacted_out(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.record("inbound", ["a#1", "b#1"])
+        await journal.record("inbound", ["a#2"])
+
+        journal.forget("inbound", ["a#1", "a#2"])
+        assert not journal.is_done("inbound", "a#1")
+        await journal.compact()
+        restarted = FileJournal(path)
+        await restarted.open()
+
+        assert list(restarted.completed) == ["inbound"]
+        assert set(restarted.completed["inbound"]) == {"b#1"}
+        assert len(path.read_text().splitlines()) == 1
+
+    @pytest.mark.asyncio
+    async def test_forgotten_group_is_compacted_out(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.record("inbound", ["a#1", "a#2", "b#1"])
+
+        journal.forget_group("inbound", "a")
+        await journal.compact()
+        restarted = FileJournal(path)
+        await restarted.open()
+
+        assert set(restarted.completed["inbound"]) == {"b#1"}
+
+    @pytest.mark.asyncio
+    async def test_known_keys_are_not_appended_again(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = FileJournal(path)
+        await journal.record("inbound", ["a#1"])
+        await journal.record("inbound", ["a#1"])
+
+        assert len(path.read_text().splitlines()) == 1
+
+
+class TestCheckpointJournal:
+    """Tests for the in-memory CheckpointJournal"""
+
+    @pytest.mark.asyncio
+    async def test_in_memory_journal(self):
+        journal = CheckpointJournal()
+        await journal.open()
+        await journal.record("inbound", ["a#1"])
+
+        assert journal.is_done("inbound", "a#1")
+
+    @pytest.mark.asyncio
+    async def test_disabled_journal_keeps_nothing(self):
+        journal = DisabledJournal()
+        await journal.open()
+        await journal.record("inbound", ["a#1"])
+
+        assert not journal.is_done("inbound", "a#1")
+
+
+class TestCompletedKeys:
+    """Tests for CompletedKeys and PositionRanges"""
+
+    def test_contiguous_positions_take_one_range(self):
+        positions = PositionRanges()
+        for position in [3, 1, 2, 5, 4, 4]:
+            positions.add(position)
+
+        assert (positions.starts, positions.ends) == ([1], [5])
+        assert list(positions) == [1, 2, 3, 4, 5] and len(positions) == 5
+        assert 0 not in positions and 6 not in positions
+
+    def test_discard_splits_a_range(self):
+        positions = PositionRanges()
+        for position in range(1, 6):
+            positions.add(position)
+
+        positions.discard(3)
+        positions.discard(1)
+        positions.discard(9)
+
+        assert (positions.starts, positions.ends) == ([2, 4], [2, 5])
+
+    def test_keys_of_a_group_are_held_as_ranges(self):
+        keys = CompletedKeys()
+        keys.update(f"file.jsonl:10:1#{n}" for n in range(1, 10_001))
+        keys.update(["12:2025-06-01T00:00:00+00:00", "x#y"])
+
+        assert len(keys) == 10_002 and keys.entries == 3
+        assert "file.jsonl:10:1#10000" in keys
+        assert "file.jsonl:10:1#10001" not in keys
+        assert "x#y" in keys and "12:2025-06-01T00:00:00+00:00" in keys
+
+        keys.difference_update(["file.jsonl:10:1#5000", "x#y"])
+        assert "file.jsonl:10:1#5000" not in keys and keys.entries == 3
+        assert keys.discard_group("file.jsonl:10:1")
+        assert list(keys) == ["12:2025-06-01T00:00:00+00:00"]
@@ -1,8 +1,17 @@
+import bz2
+import gzip
 import json
+import lzma
+import os
+import random
+import time
+import tracemalloc
 import pytest
 from pathlib import Path
 from unittest.mock import mock_open, patch
-from adapters.client_erp_adapter import ClientERP
+from adapters import client_erp_adapter
+from adapters.client_erp_adapter import DECODE_ERRORS, ClientERP
+from adapters.scan_options import ScanOptions
 
 
 @pytest.fixture
@@ -11,104 +20,62 @@ def client_erp():
     return ClientERP()
 
 
-@pytest.fixture
-def temp_json_dir(tmp_path):
-    """Fixture to create a temporary directory with JSON files"""
-    json_dir = tmp_path / "json_files"
-    json_dir.mkdir()
-
-    # Create some test JSON files
-    (json_dir / "file1.json").write_text('{"key": "value1"}')
-    (json_dir / "file2.json").write_text('{"key": "value2"}')
-    (json_dir / "file3.json").write_text('{"key": "value3"}')
-
-    # Create a non-JSON file
-    (json_dir / "file.txt").write_text("not a json file")
-
-    return json_dir
-
-
-class TestCaptureJsonFilenames:
-    """Tests for capture_json_filenames method"""
-
-    def test_capture_json_filenames_success(self, client_erp, temp_json_dir):
-        """Test successful capture of JSON filenames"""
-        result = client_erp.capture_json_filenames(temp_json_dir)
-
-        assert len(result) == 3
-        assert all(isinstance(path, Path) for path in result)
-        assert all(path.suffix == ".json" for path in result)
-        assert all(
-            path.name in ["file1.json", "file2.json", "file3.json"] for path in result
-        )
+def write_aged(path: Path, content: str, age: int) -> None:
+    """Writes path with an mtime age seconds in the past"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
 
-    def test_capture_json_filenames_not_a_directory(self, client_erp, tmp_path):
-        """Test when path is not a directory"""
-        file_path = tmp_path / "not_a_dir.txt"
-        file_path.write_text("test")
 
-        result = client_erp.capture_json_filenames(file_path)
+class TestScanJsonFiles:
+    """Tests for scan_json_files method"""
 
-        assert result == []
+    def test_oldest_first(self, client_erp, tmp_path):
+        for name, age in [("new.json", 10), ("old.json", 30), ("mid.json", 20)]:
+            write_aged(tmp_path / name, "{}", age)
+        (tmp_path / ".partial.json").write_text("{")
+        (tmp_path / "file.txt").write_text("not a json file")
 
-    def test_capture_json_filenames_empty_directory(self, client_erp, tmp_path):
-        """Test when directory is empty"""
-        empty_dir = tmp_path / "empty"
-        empty_dir.mkdir()
+        result = list(client_erp.scan_json_files(tmp_path))
 
-        result = client_erp.capture_json_filenames(empty_dir)
+        assert [p.name for p in result] == ["old.json", "mid.json", "new.json"]
 
-        assert result == []
+    def test_run_window_limits_files_and_bytes(self, client_erp, tmp_path):
+        for i in range(5):
+            write_aged(tmp_path / f"{i}.json", "x" * 10, 50 - i)
 
-    def test_capture_json_filenames_no_json_files(self, client_erp, tmp_path):
-        """Test when directory has no JSON files"""
-        no_json_dir = tmp_path / "no_json"
-        no_json_dir.mkdir()
-        (no_json_dir / "file.txt").write_text("test")
-        (no_json_dir / "file.xml").write_text("<xml/>")
+        by_files = client_erp.scan_json_files(tmp_path, ScanOptions(max_files=2))
+        by_bytes = client_erp.scan_json_files(tmp_path, ScanOptions(max_bytes=35))
 
-        result = client_erp.capture_json_filenames(no_json_dir)
+        assert [p.name for p in by_files] == ["0.json", "1.json"]
+        assert [p.name for p in by_bytes] == ["0.json", "1.json", "2.json"]
 
-        assert result == []
+    def test_window_counts_only_included_files(self, client_erp, tmp_path):
+        for i in range(4):
+            write_aged(tmp_path / f"{i}.json", "{}", 50 - i)
 
+        result = client_erp.scan_json_files(
+            tmp_path,
+            ScanOptions(max_files=2),
+            include=lambda p: p.name != "0.json",
+        )
 
-class TestReadJsonFile:
-    """Tests for read_json_file method"""
-
-    def test_read_json_file_success(self, client_erp, tmp_path):
-        """Test successful JSON file reading"""
-        json_file = tmp_path / "test.json"
-        test_data = {"orderNo": "12345", "amount": 100.50}
-        json_file.write_text(json.dumps(test_data))
-
-        result = client_erp.read_json_file(json_file)
-
-        assert result == test_data
-
-    def test_read_json_file_malformed_json(self, client_erp, tmp_path):
-        """Test reading malformed JSON"""
-        json_file = tmp_path / "malformed.json"
-        json_file.write_text('{"key": "value"')  # Missing closing brace
-
-        result = client_erp.read_json_file(json_file)
-
-        assert result is None
-
-    def test_read_json_file_empty_file(self, client_erp, tmp_path):
-        """Test reading empty JSON file"""
-        json_file = tmp_path / "empty.json"
-        json_file.write_text("")
+        assert [p.name for p in result] == ["1.json", "2.json"]
 
-        result = client_erp.read_json_file(json_file)
+    def test_sharded_subdirectories_in_name_order(self, client_erp, tmp_path):
+        write_aged(tmp_path / "2025-06-02" / "b.json", "{}", 10)
+        write_aged(tmp_path / "2025-06-01" / "a.json", "{}", 5)
+        write_aged(tmp_path / "loose.json", "{}", 1)
 
-        assert result is None
+        flat = list(client_erp.scan_json_files(tmp_path))
+        sharded = list(client_erp.scan_json_files(tmp_path, ScanOptions(sharded=True)))
 
-    def test_read_json_file_non_existent(self, client_erp, tmp_path):
-        """Test reading non-existent file"""
-        json_file = tmp_path / "non_existent.json"
+        assert [p.name for p in flat] == ["loose.json"]
+        assert [p.name for p in sharded] == ["loose.json", "a.json", "b.json"]
 
-        with pytest.raises(FileNotFoundError):
-            client_erp.read_json_file(json_file)
+    def test_not_a_directory(self, client_erp, tmp_path):
+        assert list(client_erp.scan_json_files(tmp_path / "missing")) == []
 
 
 class TestWriteJsonFile:
@@ -160,3 +127,193 @@ class TestWriteJsonFile:
         result = client_erp.write_json_file(tmp_path, content)
 
         assert result is False
+
+
+class TestFileLifecycle:
+    """Tests for archive_file and quarantine_file methods"""
+
+    def test_archive_file_moves_to_dated_directory(self, client_erp, tmp_path):
+        source = tmp_path / "100.json"
+        source.write_text('{"orderNo": 100}')
+
+        target = client_erp.archive_file(source, tmp_path / "archive")
+
+        assert not source.exists()
+        assert target.parent.parent == tmp_path / "archive"
+        assert json.loads(target.read_text()) == {"orderNo": 100}
+
+    def test_archive_file_compressed_keeps_earlier_copies(self, client_erp, tmp_path):
+        targets = []
+        for _ in range(2):
+            source = tmp_path / "100.json"
+            source.write_text('{"orderNo": 100}')
+            targets.append(
+                client_erp.archive_file(source, tmp_path / "archive", compress=True)
+            )
+
+        assert targets[0] != targets[1]
+        for target in targets:
+            with gzip.open(target, "rt") as f:
+                assert json.load(f) == {"orderNo": 100}
+
+    def test_quarantine_file_writes_error_report(self, client_erp, tmp_path):
+        source = tmp_path / "bad.json"
+        source.write_text("{not json")
+
+        target = client_erp.quarantine_file(
+            source, tmp_path / "dead_letter", "malformed", "Expecting value"
+        )
+
+        assert not source.exists()
+        assert target.read_text() == "{not json"
+        report = json.loads(
+            (tmp_path / "dead_letter" / "bad.json.error.json").read_text()
+        )
+        assert report["reason"] == "malformed"
+        assert report["error"] == "Expecting value"
+
+
+class TestCompressedInbound:
+    """Tests for compressed and JSON Lines inbound files"""
+
+    @pytest.mark.parametrize("opener", [gzip.open, bz2.open, lzma.open])
+    def test_load_compressed_json(self, client_erp, tmp_path, opener):
+        suffix = {gzip.open: ".gz", bz2.open: ".bz2", lzma.open: ".xz"}[opener]
+        path = tmp_path / f"100.json{suffix}"
+        with opener(path, "wt", encoding="utf-8") as f:
+            json.dump({"orderNo": 100}, f)
+
+        assert client_erp.is_inbound_file(path)
+        assert client_erp.load_json_file(path) == {"orderNo": 100}
+
+    def test_iter_json_lines_reports_bad_lines(self, client_erp, tmp_path):
+        path = tmp_path / "batch.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write('{"orderNo": 1}\n{broken\n\n{"orderNo": 2}\n')
+
+        lines = list(client_erp.iter_json_lines(path))
+
+        assert client_erp.is_json_lines(path)
+        assert [(line, doc) for line, doc, _ in lines] == [
+            (1, {"orderNo": 1}),
+            (2, None),
+            (4, {"orderNo": 2}),
+        ]
+        assert lines[1][2] is not None
+
+    def test_corrupt_archive_is_a_decode_error(self, client_erp, tmp_path):
+        path = tmp_path / "corrupt.json.gz"
+        path.write_bytes(b"\x1f\x8b\x08\x00garbage")
+
+        with pytest.raises(DECODE_ERRORS):
+            client_erp.load_json_file(path)
+
+    def test_corrupt_bz2_archive_is_a_decode_error(self, client_erp, tmp_path):
+        path = tmp_path / "corrupt.json.bz2"
+        path.write_bytes(b"BZh91AY&SYgarbagegarbage")
+
+        with pytest.raises(DECODE_ERRORS):
+            client_erp.load_json_file(path)
+
+    def test_read_failure_is_not_a_decode_error(self, client_erp, tmp_path):
+        path = tmp_path / "unreadable.json.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write('{"orderNo": 1}')
+
+        with patch.object(
+            gzip.GzipFile, "read", side_effect=OSError(5, "Input/output error")
+        ):
+            with pytest.raises(OSError) as e:
+                client_erp.load_json_file(path)
+
+        assert not isinstance(e.value, DECODE_ERRORS)
+
+    def test_scan_picks_compressed_and_json_lines(self, client_erp, tmp_path):
+        for name in ["a.json", "b.json.gz", "c.jsonl", "d.ndjson.xz", "e.txt.gz"]:
+            (tmp_path / name).write_text("")
+
+        names = {p.name for p in client_erp.scan_json_files(tmp_path)}
+
+        assert names == {"a.json", "b.json.gz", "c.jsonl", "d.ndjson.xz"}
+
+
+class TestJsonArrayInbound:
+    """Tests for iter_json_file on top-level arrays"""
+
+    def test_single_document(self, client_erp, tmp_path):
+        path = tmp_path / "1.json"
+        path.write_text(' {"orderNo": 1}')
+
+        assert list(client_erp.iter_json_file(path)) == [(None, {"orderNo": 1})]
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+    def test_array_elements_across_chunks(
+        self, client_erp, tmp_path, monkeypatch, chunk_size
+    ):
+        monkeypatch.setattr(client_erp_adapter, "JSON_CHUNK_SIZE", chunk_size)
+        elements = [{"orderNo": i, "summary": "x" * i} for i in range(20)] + [
+            12345,
+            "text, with ] brackets",
+            [1, 2],
+            None,
+        ]
+        path = tmp_path / "batch.json"
+        path.write_text("\n[ " + " ,\n ".join(json.dumps(e) for e in elements) + " ]\n")
+
+        result = list(client_erp.iter_json_file(path))
+
+        assert result == list(enumerate(elements, start=1))
+
+    @pytest.mark.parametrize("content", ["[]", " [ ] "])
+    def test_empty_array(self, client_erp, tmp_path, content):
+        path = tmp_path / "empty.json"
+        path.write_text(content)
+
+        assert list(client_erp.iter_json_file(path)) == []
+
+    def test_values_split_at_every_chunk_boundary(
+        self, client_erp, tmp_path, monkeypatch
+    ):
+        elements = [1.5, -12e3, 123456789, 0.25e-2, 7, True, None, "1.5", [10, -0.5]]
+        rng = random.Random(0)
+        for trial in range(20):
+            rng.shuffle(elements)
+            spaces = [" " * rng.randint(0, 2) for _ in elements]
+            text = "[" + ",".join(s + json.dumps(e) for s, e in zip(spaces, elements))
+            text += "]" + " " * rng.randint(0, 2)
+            path = tmp_path / f"numbers{trial}.json"
+            path.write_text(text)
+            for chunk_size in range(1, len(text) + 1):
+                monkeypatch.setattr(client_erp_adapter, "JSON_CHUNK_SIZE", chunk_size)
+
+                result = list(client_erp.iter_json_file(path))
+
+                assert result == list(enumerate(elements, start=1)), (text, chunk_size)
+
+    @pytest.mark.parametrize(
+        "content",
+        ['[{"a": 1} {"b": 2}]', '[{"a": 1},', "[1, 2", "[]x", "[1]]", "[1] 2", "[1x]"],
+    )
+    def test_malformed_array(self, client_erp, tmp_path, content):
+        path = tmp_path / "bad.json"
+        path.write_text(content)
+
+        with pytest.raises(json.JSONDecodeError):
+            list(client_erp.iter_json_file(path))
+
+    def test_large_array_uses_constant_memory(self, client_erp, tmp_path):
+        path = tmp_path / "large.json.gz"
+        element = json.dumps({"orderNo": 1, "summary": "x" * 200})
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write("[")
+            f.write(",".join(element for _ in range(50_000)))
+            f.write("]")
+
+        tracemalloc.start()
+        count = sum(1 for _ in client_erp.iter_json_file(path))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert count == 50_000
+        # the file holds over 10 MB of json
+        assert peak < 2 * 1024 * 1024
@@ -0,0 +1,33 @@
+from services.deduplication import keep_latest
+
+
+class TestKeepLatest:
+    """Tests for keep_latest"""
+
+    def test_keeps_newest_version_per_key(self):
+        items = [("a", 1), ("b", 5), ("a", 3), ("a", 2)]
+
+        kept, superseded = keep_latest(
+            items, key=lambda i: i[0], version=lambda i: i[1]
+        )
+
+        assert kept == [("a", 3), ("b", 5)]
+        assert sorted(superseded) == [("a", 1), ("a", 2)]
+
+    def test_last_seen_wins_on_equal_versions(self):
+        items = [("a", 1, "first"), ("a", 1, "second")]
+
+        kept, superseded = keep_latest(
+            items, key=lambda i: i[0], version=lambda i: i[1]
+        )
+
+        assert kept == [("a", 1, "second")]
+        assert superseded == [("a", 1, "first")]
+
+    def test_no_duplicates(self):
+        items = [1, 2, 3]
+
+        kept, superseded = keep_latest(items, key=lambda i: i, version=lambda i: 0)
+
+        assert kept == items
+        assert superseded == []
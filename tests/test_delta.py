@@ -0,0 +1,118 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from adapters.tracos_adapter import TracOSAdapter
+from models.tracOS_models import TracOSWorkorder
+from services.delta import document_delta, encoded_size
+
+
+NOW = datetime(2025, 6, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+def make_workorder(**changes) -> TracOSWorkorder:
+    fields = dict(
+        number=1,
+        status="pending",
+        title="Example workorder #1",
+        description="A long description " * 20,
+        createdAt=NOW,
+        updatedAt=NOW,
+        deleted=False,
+        isSynced=True,
+        syncedAt=NOW,
+    )
+    fields.update(changes)
+    return TracOSWorkorder(**fields)
+
+
+class TestDocumentDelta:
+    """Tests for document_delta"""
+
+    def test_only_changed_fields_are_set(self):
+        delta = document_delta(
+            {"status": "pending", "title": "a"}, {"status": "completed", "title": "a"}
+        )
+        assert delta.set == {"status": "completed"}
+        assert delta.unset == ()
+
+    def test_removed_fields_are_unset(self):
+        delta = document_delta({"deleted": True, "deletedAt": NOW}, {"deleted": False})
+        assert delta.set == {"deleted": False}
+        assert delta.unset == ("deletedAt",)
+
+    def test_sub_millisecond_date_changes_are_ignored(self):
+        delta = document_delta(
+            {"createdAt": NOW}, {"createdAt": NOW + timedelta(microseconds=500)}
+        )
+        assert not delta
+
+
+class TestDeltaUpdates:
+    """Tests for TracOSAdapter updates in delta mode"""
+
+    def make_adapter(self, update_mode: str) -> TracOSAdapter:
+        return TracOSAdapter(
+            "mongodb://localhost:27017", "db", "c", update_mode=update_mode
+        )
+
+    def test_delta_request_sets_only_changed_paths(self):
+        adapter = self.make_adapter("delta")
+        current = make_workorder()
+        order = make_workorder(
+            status="completed", updatedAt=NOW + timedelta(hours=1), isSynced=False
+        )
+
+        request, saved = adapter._update_request(order, current)
+
+        assert request._filter == {"number": 1, "updatedAt": current.updatedAt}
+        assert set(request._doc["$set"]) == {
+            "status",
+            "updatedAt",
+            "syncedAt",
+            "contentHash",
+        }
+        assert "description" not in request._doc["$set"]
+        assert saved > encoded_size({"description": order.description})
+        # nothing is counted until the update is written
+        assert adapter.delta_bytes_saved == 0
+
+    def test_full_mode_ignores_current(self):
+        adapter = self.make_adapter("full")
+        order = make_workorder(status="completed", updatedAt=NOW + timedelta(hours=1))
+
+        request, saved = adapter._update_request(order, make_workorder())
+
+        assert "description" in request._doc["$set"]
+        assert saved == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("modified", [0, 1, 2])
+    async def test_only_modified_updates_count_as_saved(self, modified):
+        adapter = self.make_adapter("delta")
+        current = {1: make_workorder(), 2: make_workorder(number=2)}
+        updates = [
+            make_workorder(
+                number=n, status="completed", updatedAt=NOW + timedelta(hours=1)
+            )
+            for n in current
+        ]
+        saved = [adapter._update_request(o, current[o.number])[1] for o in updates]
+
+        class Collection:
+            async def bulk_write(self, requests, ordered):
+                return SimpleNamespace(
+                    upserted_count=0,
+                    upserted_ids={},
+                    matched_count=modified,
+                    modified_count=modified,
+                )
+
+        adapter.collection = Collection()
+        await adapter.write_workorders([], updates, current)
+
+        assert adapter.delta_bytes_saved == sum(sorted(saved)[:modified])
+
+    def test_unknown_update_mode_rejected(self):
+        with pytest.raises(ValueError):
+            self.make_adapter("partial")
@@ -1,18 +1,25 @@
-from importlib import reload
-import sys
 import pytest
 import pytest_asyncio
 import asyncio
+import gzip
 import json
 import os
 import shutil
+import subprocess
+from dataclasses import replace
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from main import main
-from adapters.tracos_adapter import TracOSAdapter
+from adapters.tracos_adapter import (
+    WATERMARK_COLLECTION,
+    NumberRange,
+    TracOSAdapter,
+    Watermark,
+    WorkorderLease,
+)
 from adapters.client_erp_adapter import ClientERP
 from models.tracOS_models import TracOSWorkorder
 from models.customer_system_models import CustomerSystemWorkorder
@@ -24,6 +31,8 @@ TEST_MONGO_DATABASE = "tractian_test"
 TEST_MONGO_COLLECTION = "workorders_test"
 TEST_DATA_INBOUND_DIR = Path("test_data/inbound")
 TEST_DATA_OUTBOUND_DIR = Path("test_data/outbound")
+TEST_DATA_ARCHIVE_DIR = Path("test_data/archive")
+TEST_DATA_DEAD_LETTER_DIR = Path("test_data/dead_letter")
 
 
 @pytest_asyncio.fixture(scope="function")
@@ -35,11 +44,13 @@ async def mongo_setup():
 
     # Clean up before test
     await collection.delete_many({})
+    await db[WATERMARK_COLLECTION].delete_many({})
 
     yield collection
 
     # Clean up after test
     await collection.delete_many({})
+    await db[WATERMARK_COLLECTION].delete_many({})
     client.close()
 
 
@@ -72,6 +83,10 @@ def set_test_env_vars(filesystem_setup):
         "MONGO_COLLECTION": TEST_MONGO_COLLECTION,
         "DATA_INBOUND_DIR": str(TEST_DATA_INBOUND_DIR),
         "DATA_OUTBOUND_DIR": str(TEST_DATA_OUTBOUND_DIR),
+        "DATA_ARCHIVE_DIR": str(TEST_DATA_ARCHIVE_DIR),
+        "DATA_DEAD_LETTER_DIR": str(TEST_DATA_DEAD_LETTER_DIR),
+        "CHECKPOINT_PATH": "test_data/checkpoints/journal.jsonl",
+        "EXISTENCE_FILTER_PATH": "test_data/checkpoints/existing-numbers.bloom",
     }
 
     # Save original values and set test values
@@ -79,12 +94,7 @@ def set_test_env_vars(filesystem_setup):
         original_env[key] = os.environ.get(key)
         os.environ[key] = value
 
-    # CRITICAL: Reload main module so it picks up new environment variables
-    if "main" in sys.modules:
-        import main
-
-        reload(main)
-
+    # main() reads its settings from the environment when it runs
     yield
 
     # Restore original values
@@ -94,12 +104,6 @@ def set_test_env_vars(filesystem_setup):
         else:
             os.environ[key] = value
 
-    # Reload main again to restore original config
-    if "main" in sys.modules:
-        import main
-
-        reload(main)
-
 
 @pytest.mark.asyncio
 async def test_e2e_inbound_flow_new_workorder(mongo_setup, set_test_env_vars):
@@ -242,6 +246,56 @@ async def test_e2e_outbound_flow_new_workorder(mongo_setup, set_test_env_vars):
     assert customer_data["isSynced"] is True
 
 
+@pytest.mark.asyncio
+async def test_e2e_server_side_translation_is_byte_identical(
+    mongo_setup, set_test_env_vars
+):
+    """
+    Test that OUTBOUND_TRANSLATION=server writes the same bytes as the Python translator
+    """
+    collection = mongo_setup
+    base_time = datetime.now(timezone.utc)
+    statuses = ["pending", "in_progress", "completed", "on_hold", "cancelled"]
+    await collection.insert_many(
+        [
+            {
+                "_id": ObjectId(),
+                "number": 300 + i,
+                "status": status,
+                "title": f"Translation test {i}",
+                "description": f"Translated by both paths \u00e9 {i}",
+                "createdAt": base_time - timedelta(days=i),
+                "updatedAt": base_time,
+                "deleted": False,
+                "deletedAt": base_time if status == "cancelled" else None,
+                "isSynced": False,
+                "syncedAt": None,
+            }
+            for i, status in enumerate(statuses)
+        ]
+    )
+
+    async def export(translation: str) -> dict[str, bytes]:
+        os.environ["OUTBOUND_TRANSLATION"] = translation
+        try:
+            await main()
+        finally:
+            os.environ.pop("OUTBOUND_TRANSLATION")
+        files = {p.name: p.read_bytes() for p in TEST_DATA_OUTBOUND_DIR.glob("*.json")}
+        # export everything again: unsync, drop the files and the journal
+        await collection.update_many({}, {"$set": {"isSynced": False}})
+        for path in TEST_DATA_OUTBOUND_DIR.glob("*.json"):
+            path.unlink()
+        Path("test_data/checkpoints/journal.jsonl").unlink(missing_ok=True)
+        return files
+
+    python = await export("python")
+    server = await export("server")
+
+    assert len(python) == len(statuses)
+    assert server == python
+
+
 @pytest.mark.asyncio
 async def test_e2e_bidirectional_sync(mongo_setup, set_test_env_vars):
     """
@@ -348,6 +402,15 @@ async def test_e2e_malformed_json_handling(mongo_setup, set_test_env_vars):
     valid_doc = await collection.find_one({"number": 401})
     assert valid_doc is not None, "Valid workorder should be inserted"
 
+    # the malformed file is quarantined with a report, the valid one archived
+    assert list(TEST_DATA_INBOUND_DIR.glob("*.json")) == []
+    assert (TEST_DATA_DEAD_LETTER_DIR / "malformed.json").exists()
+    report = json.loads(
+        (TEST_DATA_DEAD_LETTER_DIR / "malformed.json.error.json").read_text()
+    )
+    assert report["reason"] == "malformed"
+    assert len(list(TEST_DATA_ARCHIVE_DIR.glob("*/401.json"))) == 1
+
 
 @pytest.mark.asyncio
 async def test_e2e_schema_validation(mongo_setup, set_test_env_vars):
@@ -371,6 +434,46 @@ async def test_e2e_schema_validation(mongo_setup, set_test_env_vars):
     # Verify invalid workorder was not inserted
     doc = await collection.find_one({"number": 500})
     assert doc is None, "Invalid workorder should not be inserted"
+    assert (TEST_DATA_DEAD_LETTER_DIR / "500.json.error.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_e2e_compressed_json_lines(mongo_setup, set_test_env_vars):
+    """
+    Test that a gzip-compressed JSON Lines file is synced record by record
+    """
+    collection = mongo_setup
+    base_time = datetime.now(timezone.utc).isoformat()
+    lines = [
+        {
+            "orderNo": number,
+            "isActive": True,
+            "isCanceled": False,
+            "isDeleted": False,
+            "isDone": False,
+            "isOnHold": False,
+            "isPending": False,
+            "isSynced": False,
+            "summary": f"Compressed workorder {number}",
+            "creationDate": base_time,
+            "lastUpdateDate": base_time,
+            "deletedDate": None,
+        }
+        for number in (510, 511)
+    ]
+    with gzip.open(TEST_DATA_INBOUND_DIR / "batch.jsonl.gz", "wt") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+        f.write("{not json\n")
+
+    await main()
+
+    assert await collection.count_documents({"number": {"$in": [510, 511]}}) == 2
+    assert len(list(TEST_DATA_ARCHIVE_DIR.glob("*/batch.jsonl.gz"))) == 1
+    report = json.loads(
+        (TEST_DATA_DEAD_LETTER_DIR / "batch.jsonl.gz.error.json").read_text()
+    )
+    assert report["rejectedRecords"][0]["position"] == 3
 
 
 @pytest.mark.asyncio
@@ -528,5 +631,243 @@ async def test_e2e_no_update_when_tracos_newer(mongo_setup, set_test_env_vars):
     assert doc["description"] == "This should not be overwritten"
 
 
+@pytest.mark.asyncio
+async def test_e2e_reexport_without_content_change_is_not_written(
+    mongo_setup, set_test_env_vars
+):
+    """
+    Test that an ERP re-export that only bumps lastUpdateDate does not rewrite the document
+    """
+    collection = mongo_setup
+    base_time = datetime.now(timezone.utc) - timedelta(hours=1)
+    customer_workorder = {
+        "orderNo": 850,
+        "isActive": False,
+        "isCanceled": False,
+        "isDeleted": False,
+        "isDone": True,
+        "isOnHold": False,
+        "isPending": False,
+        "isSynced": False,
+        "summary": "Unchanged content",
+        "creationDate": base_time.isoformat(),
+        "lastUpdateDate": base_time.isoformat(),
+        "deletedDate": None,
+    }
+    with open(TEST_DATA_INBOUND_DIR / "850.json", "w") as f:
+        json.dump(customer_workorder, f)
+    await main()
+    first = await collection.find_one({"number": 850})
+    assert first["contentHash"]
+
+    customer_workorder["lastUpdateDate"] = datetime.now(timezone.utc).isoformat()
+    with open(TEST_DATA_INBOUND_DIR / "850.json", "w") as f:
+        json.dump(customer_workorder, f)
+    await main()
+
+    second = await collection.find_one({"number": 850})
+    assert second["syncedAt"] == first["syncedAt"], "document should not be rewritten"
+    assert second["updatedAt"] == first["updatedAt"]
+
+
+async def insert_unsynced_workorders(collection, numbers, base_time):
+    await collection.insert_many(
+        [
+            {
+                "_id": ObjectId(),
+                "number": i,
+                "status": "pending",
+                "title": f"Lease test {i}",
+                "description": f"Lease workorder {i}",
+                "createdAt": base_time,
+                "updatedAt": base_time,
+                "deleted": False,
+                "deletedAt": None,
+                "isSynced": False,
+                "syncedAt": None,
+            }
+            for i in numbers
+        ]
+    )
+
+
+@pytest.mark.asyncio
+async def test_e2e_concurrent_exporters_claim_disjoint_batches(mongo_setup):
+    """
+    Test that two exporters leasing concurrently never claim the same workorder
+    """
+    collection = mongo_setup
+    await insert_unsynced_workorders(
+        collection, range(900, 960), datetime.now(timezone.utc)
+    )
+    first = TracOSAdapter(TEST_MONGO_URI, TEST_MONGO_DATABASE, TEST_MONGO_COLLECTION)
+    second = TracOSAdapter(TEST_MONGO_URI, TEST_MONGO_DATABASE, TEST_MONGO_COLLECTION)
+
+    async def drain(tracos: TracOSAdapter, owner: str) -> WorkorderLease:
+        """Pages through the whole backlog, as one lease for the assertions below"""
+        workorders, watermark, lease = [], None, None
+        while True:
+            page = await tracos.claim_unsynced_workorders(
+                owner, 20, 60, after=watermark
+            )
+            if page.watermark is None:
+                break
+            watermark, lease = page.watermark, page
+            workorders.extend(page.workorders)
+        return replace(lease, workorders=workorders, claimed=len(workorders))
+
+    leases = await asyncio.gather(
+        drain(first, "exporter-1"), drain(second, "exporter-2")
+    )
+
+    claimed = [[o.number for o in lease.workorders] for lease in leases]
+    assert not set(claimed[0]) & set(claimed[1])
+    assert set(claimed[0]) | set(claimed[1]) == set(range(900, 960))
+
+    # an acknowledgement with someone else's lease is ignored
+    assert await first.acknowledge_workorders(leases[1], leases[0].workorders) == 0
+    assert await first.acknowledge_workorders(leases[0], leases[0].workorders) == len(
+        claimed[0]
+    )
+    assert await collection.count_documents({"isSynced": False}) == len(claimed[1])
+
+
+@pytest.mark.asyncio
+async def test_e2e_outbound_pages_follow_watermark(mongo_setup):
+    """
+    Test that unsynced workorders are paged in (updatedAt, number) order from the watermark
+    """
+    collection = mongo_setup
+    base_time = datetime.now(timezone.utc).replace(microsecond=0)
+    await insert_unsynced_workorders(collection, [12, 10, 11], base_time)
+    await insert_unsynced_workorders(collection, [5], base_time + timedelta(minutes=1))
+    tracos = TracOSAdapter(TEST_MONGO_URI, TEST_MONGO_DATABASE, TEST_MONGO_COLLECTION)
+    await tracos.ensure_indexes()
+
+    first = await tracos.claim_unsynced_workorders("exporter", 2, 60)
+    assert [o.number for o in first.workorders] == [10, 11]
+    assert first.watermark == Watermark(base_time, 11)
+
+    # pages resume from a persisted watermark
+    await tracos.save_watermark("worker-0", first.watermark)
+    watermark = await tracos.load_watermark("worker-0")
+    second = await tracos.claim_unsynced_workorders("exporter", 2, 60, after=watermark)
+    assert [o.number for o in second.workorders] == [12, 5]
+
+    last = await tracos.claim_unsynced_workorders(
+        "exporter", 2, 60, after=second.watermark
+    )
+    assert last.claimed == 0
+    assert last.watermark is None
+
+    await tracos.save_watermark("worker-0", None)
+    assert await tracos.load_watermark("worker-0") is None
+
+
+@pytest.mark.asyncio
+async def test_e2e_outbound_partitions_cover_the_backlog(
+    mongo_setup, set_test_env_vars
+):
+    """
+    Test that number range partitions split the unsynced workorders and are all exported
+    """
+    collection = mongo_setup
+    numbers = list(range(1000, 1030))
+    await insert_unsynced_workorders(collection, numbers, datetime.now(timezone.utc))
+    tracos = TracOSAdapter(TEST_MONGO_URI, TEST_MONGO_DATABASE, TEST_MONGO_COLLECTION)
+
+    ranges = await tracos.unsynced_number_ranges(3)
+    assert len(ranges) == 3
+    assert ranges[0].low is None and ranges[-1].high is None
+    assert await tracos.unsynced_number_ranges(1) == [NumberRange()]
+
+    claimed = []
+    for numbers_range in ranges:
+        lease = await tracos.claim_unsynced_workorders(
+            "exporter", 100, 0.5, numbers=numbers_range
+        )
+        assert 0 < len(lease.workorders) < len(numbers)
+        claimed += [o.number for o in lease.workorders]
+    assert sorted(claimed) == numbers
+
+    await asyncio.sleep(1)  # let the leases expire
+    os.environ["OUTBOUND_PARTITIONS"] = "3"
+    try:
+        await main()
+    finally:
+        os.environ.pop("OUTBOUND_PARTITIONS")
+
+    assert await collection.count_documents({"isSynced": False}) == 0
+    assert len(list(TEST_DATA_OUTBOUND_DIR.glob("*.json"))) == len(numbers)
+
+
+@pytest.mark.asyncio
+async def test_e2e_expired_lease_is_reclaimed(mongo_setup):
+    """
+    Test that workorders leased by an exporter that died are claimed again after expiry
+    """
+    collection = mongo_setup
+    await insert_unsynced_workorders(collection, [970], datetime.now(timezone.utc))
+    tracos = TracOSAdapter(TEST_MONGO_URI, TEST_MONGO_DATABASE, TEST_MONGO_COLLECTION)
+
+    dead = await tracos.claim_unsynced_workorders("dead-exporter", 10, 0.5)
+    assert [o.number for o in dead.workorders] == [970]
+    blocked = await tracos.claim_unsynced_workorders("live-exporter", 10, 60)
+    assert blocked.claimed == 0
+
+    await asyncio.sleep(1)
+    reclaimed = await tracos.claim_unsynced_workorders("live-exporter", 10, 60)
+    assert [o.number for o in reclaimed.workorders] == [970]
+
+    # the dead exporter's late acknowledgement is rejected
+    assert await tracos.acknowledge_workorders(dead, dead.workorders) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not (os.getenv("MONGOD_STOP_CMD") and os.getenv("MONGOD_START_CMD")),
+    reason="set MONGOD_STOP_CMD and MONGOD_START_CMD to control a local mongod",
+)
+async def test_e2e_survives_mongod_restart(mongo_setup, set_test_env_vars):
+    """
+    Test that a run survives mongod being stopped and restarted mid-run,
+    e.g. MONGOD_STOP_CMD="docker stop tractian-mongo" and
+    MONGOD_START_CMD="docker start tractian-mongo"
+    """
+    collection = mongo_setup
+    base_time = datetime.now(timezone.utc)
+    count = int(os.getenv("DEGRADED_TEST_WORKORDERS", "2000"))
+
+    for i in range(1000, 1000 + count):
+        workorder = {
+            "orderNo": i,
+            "isActive": False,
+            "isCanceled": False,
+            "isDeleted": False,
+            "isDone": False,
+            "isOnHold": False,
+            "isPending": True,
+            "isSynced": False,
+            "summary": f"Degraded workorder {i}",
+            "creationDate": base_time.isoformat(),
+            "lastUpdateDate": base_time.isoformat(),
+            "deletedDate": None,
+        }
+        with open(TEST_DATA_INBOUND_DIR / f"{i}.json", "w") as f:
+            json.dump(workorder, f)
+
+    async def restart_mongod():
+        await asyncio.sleep(1)
+        subprocess.run(os.environ["MONGOD_STOP_CMD"], shell=True, check=True)
+        await asyncio.sleep(5)
+        subprocess.run(os.environ["MONGOD_START_CMD"], shell=True, check=True)
+
+    exit_code, _ = await asyncio.gather(main(), restart_mongod())
+
+    # retried through the restart instead of given up on
+    assert exit_code == 0
+    assert await collection.count_documents({"number": {"$gte": 1000}}) == count
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from models.tracOS_models import TracOSWorkorder
+from services.fingerprint import workorder_fingerprint
+
+
+def make_workorder(**overrides) -> TracOSWorkorder:
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    fields = {
+        "number": 1,
+        "status": "pending",
+        "title": "Example workorder #1",
+        "description": "Fingerprint test",
+        "createdAt": created,
+        "updatedAt": created,
+        "deleted": False,
+        "isSynced": False,
+    }
+    return TracOSWorkorder(**{**fields, **overrides})
+
+
+class TestWorkorderFingerprint:
+    """Tests for workorder_fingerprint"""
+
+    def test_timestamp_only_change_keeps_fingerprint(self):
+        original = make_workorder()
+        reexport = make_workorder(
+            updatedAt=original.updatedAt + timedelta(days=1),
+            isSynced=True,
+            syncedAt=datetime.now(timezone.utc),
+        )
+
+        assert workorder_fingerprint(original) == workorder_fingerprint(reexport)
+
+    def test_content_change_changes_fingerprint(self):
+        original = make_workorder()
+
+        assert workorder_fingerprint(original) != workorder_fingerprint(
+            make_workorder(status="completed")
+        )
+        assert workorder_fingerprint(original) != workorder_fingerprint(
+            make_workorder(description="Changed")
+        )
+
+    def test_sub_millisecond_precision_is_ignored(self):
+        created = datetime(2024, 1, 1, 0, 0, 0, 123456, tzinfo=timezone.utc)
+        stored = created.replace(microsecond=123000)
+
+        assert workorder_fingerprint(
+            make_workorder(createdAt=created)
+        ) == workorder_fingerprint(make_workorder(createdAt=stored))
+
+    def test_fingerprint_ignores_stored_hash(self):
+        order = make_workorder()
+        stored = order.model_copy(update={"contentHash": workorder_fingerprint(order)})
+
+        assert workorder_fingerprint(stored) == workorder_fingerprint(order)
@@ -0,0 +1,456 @@
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import FaultInjection, InMemoryTracOSAdapter
+from adapters.mongo_retry import MongoDBUnavailable, RetryPolicy
+from adapters.tracos_adapter import NumberRange
+from adapters.version_cache import VersionCache
+from models.tracOS_models import TracOSWorkorder
+from services.metrics import RunMetrics
+from settings import Settings
+
+BASE_TIME = datetime(2025, 6, 1, tzinfo=timezone.utc)
+NO_BACKOFF = RetryPolicy(base_delay=0, max_delay=0)
+
+
+def stored_document(number: int, **overrides: Any) -> dict[str, Any]:
+    doc = {
+        "number": number,
+        "status": "pending",
+        "title": f"Example workorder #{number}",
+        "description": f"Workorder {number}",
+        "createdAt": BASE_TIME,
+        "updatedAt": BASE_TIME,
+        "deleted": False,
+        "isSynced": False,
+    }
+    doc.update(overrides)
+    return doc
+
+
+def client_workorder(number: int, last_update: str | None = None) -> dict[str, Any]:
+    return {
+        "orderNo": number,
+        "isActive": False,
+        "isCanceled": False,
+        "isDeleted": False,
+        "isDone": True,
+        "isOnHold": False,
+        "isPending": False,
+        "isSynced": False,
+        "summary": f"Inbound {number}",
+        "creationDate": BASE_TIME.isoformat(),
+        "lastUpdateDate": last_update or BASE_TIME.isoformat(),
+        "deletedDate": None,
+    }
+
+
+def workorder(number: int, updated_at: datetime, **overrides: Any) -> TracOSWorkorder:
+    return TracOSWorkorder.model_validate(
+        stored_document(number, updatedAt=updated_at, **overrides)
+    )
+
+
+class TestInMemoryTracOSAdapter:
+    """Tests for InMemoryTracOSAdapter"""
+
+    @pytest.mark.asyncio
+    async def test_insert_then_conditional_updates(self):
+        tracos = InMemoryTracOSAdapter()
+        newer = BASE_TIME + timedelta(hours=1)
+
+        assert (
+            await tracos.write_workorders([workorder(1, BASE_TIME)], [])
+        ).written == 1
+        # an insert of a stored number is retried as an update
+        changed = workorder(1, newer, status="completed")
+        assert (await tracos.write_workorders([changed], [])).written == 1
+        # older, or same content with a newer timestamp: nothing written
+        assert (
+            await tracos.write_workorders([], [workorder(1, BASE_TIME)])
+        ).written == 0
+        later = newer + timedelta(hours=1)
+        unchanged = workorder(1, later, status="completed")
+        assert (await tracos.write_workorders([], [unchanged])).written == 0
+
+        stored = await tracos.capture_workorder(1)
+        assert stored.updatedAt == newer
+        assert stored.isSynced and stored.contentHash
+        assert await tracos.capture_workorder(2) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("update_mode", ["full", "delta"])
+    async def test_updates_keep_fields_they_do_not_set(self, update_mode):
+        tracos = InMemoryTracOSAdapter(update_mode=update_mode)
+        tracos.insert_documents(
+            [stored_document(1, site="Plant 1", leaseId="l", leaseOwner="a")]
+        )
+        current = workorder(1, BASE_TIME)
+        changed = workorder(1, BASE_TIME + timedelta(hours=1), status="completed")
+
+        result = await tracos.write_workorders([], [changed], {1: current})
+
+        assert result.written == 1
+        stored = tracos.documents[1]
+        assert stored["status"] == "completed" and stored["isSynced"]
+        # $set semantics: a field TracOSWorkorder does not know survives
+        assert stored["site"] == "Plant 1"
+        assert "leaseId" not in stored and "leaseOwner" not in stored
+        assert (tracos.delta_bytes_saved > 0) == (update_mode == "delta")
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("minutes, written", [(30, 1), (90, 0)])
+    async def test_delta_update_of_a_document_changed_meanwhile(self, minutes, written):
+        tracos = InMemoryTracOSAdapter(update_mode="delta")
+        tracos.insert_documents([stored_document(1)])
+        current = workorder(1, BASE_TIME)
+        # written in TracOS after current was read, before or after the change
+        tracos.documents[1]["updatedAt"] = BASE_TIME + timedelta(minutes=minutes)
+        changed = workorder(1, BASE_TIME + timedelta(hours=1), status="completed")
+
+        result = await tracos.write_workorders([], [changed], {1: current})
+
+        # the delta matches nothing: a full update is sent, and wins if newer
+        assert result.written == written
+        assert (tracos.documents[1]["status"] == "completed") == bool(written)
+
+        tracos = InMemoryTracOSAdapter(
+            FaultInjection(write_failure_rate=0.3, rejected_numbers=frozenset({5})),
+            retry_policy=NO_BACKOFF,
+        )
+
+        result = await tracos.write_workorders(
+            [workorder(n, BASE_TIME) for n in range(20)], []
+        )
+
+        # transient failures are retried alone, the rejected workorder is reported
+        assert tracos.injected_failures > 0
+        assert tracos.round_trips["write_workorders"] > 1
+        assert result.written == 19
+        assert list(result.failed) == [5]
+        assert sorted(tracos.documents) == [n for n in range(20) if n != 5]
+
+    @pytest.mark.asyncio
+    async def test_writes_fill_version_cache_and_existence_filter(self):
+        tracos = InMemoryTracOSAdapter(version_cache=VersionCache())
+        await tracos.load_existence_filter(Path("unused.bloom"))
+
+        await tracos.write_workorders([workorder(7, BASE_TIME)], [])
+
+        assert tracos.version_cache.get(7).updated_at == BASE_TIME
+        assert 7 in tracos.existence_filter
+
+    @pytest.mark.asyncio
+    async def test_claim_page_and_acknowledge(self):
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(n) for n in (3, 1, 2)])
+
+        first = await tracos.claim_unsynced_workorders("a", 2, 60)
+        assert [o.number for o in first.workorders] == [1, 2]
+        # leased workorders are skipped by other exporters
+        second = await tracos.claim_unsynced_workorders("b", 10, 60)
+        assert [o.number for o in second.workorders] == [3]
+        # the watermark pages past the end
+        rest = await tracos.claim_unsynced_workorders("a", 2, 60, after=first.watermark)
+        assert rest.claimed == 0
+
+        assert await tracos.acknowledge_workorders(first, first.workorders) == 2
+        assert await tracos.acknowledge_workorders(first, second.workorders) == 0
+        assert tracos.documents[1]["isSynced"]
+        assert "leaseId" not in tracos.documents[1]
+
+    @pytest.mark.asyncio
+    async def test_number_ranges_split_the_backlog(self):
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(n) for n in range(100, 130)])
+
+        ranges = await tracos.unsynced_number_ranges(3)
+
+        assert ranges == NumberRange.split([110, 120])
+        lease = await tracos.claim_unsynced_workorders("a", 100, 60, numbers=ranges[1])
+        assert [o.number for o in lease.workorders] == list(range(110, 120))
+
+    @pytest.mark.asyncio
+    async def test_injected_failures_are_retried_deterministically(self):
+        async def run(seed: int) -> InMemoryTracOSAdapter:
+            tracos = InMemoryTracOSAdapter(
+                FaultInjection(failure_rate=0.3, seed=seed), retry_policy=NO_BACKOFF
+            )
+            for n in range(20):
+                await tracos.write_workorders([workorder(n, BASE_TIME)], [])
+            return tracos
+
+        first, second = await run(seed=1), await run(seed=1)
+
+        assert len(first.documents) == 20
+        assert first.injected_failures > 0
+        assert first.injected_failures == second.injected_failures
+        assert first.round_trips["write_workorders"] == 20 + first.injected_failures
+
+    @pytest.mark.asyncio
+    async def test_bulk_operations_past_the_timeout_fail_and_retry(self):
+        policy = RetryPolicy(max_attempts=2, base_delay=0, max_delay=0)
+        tracos = InMemoryTracOSAdapter(
+            FaultInjection(item_latency=0.001, timeout=0.005), retry_policy=policy
+        )
+        await tracos.write_workorders([workorder(n, BASE_TIME) for n in range(3)], [])
+        assert tracos.injected_failures == 0
+
+        # ExecutionTimeout is transient: retried, then given up on
+        with pytest.raises(MongoDBUnavailable):
+            await tracos.write_workorders(
+                [workorder(n, BASE_TIME) for n in range(10, 20)], []
+            )
+        assert tracos.injected_failures == 2
+        assert tracos.circuit_breaker.failures == 2
+        assert len(tracos.documents) == 3
+
+    def test_invalid_faults_rejected(self):
+        with pytest.raises(ValueError):
+            FaultInjection(failure_rate=1)
+        with pytest.raises(ValueError):
+            FaultInjection(timeout=-1)
+        with pytest.raises(ValueError):
+            FaultInjection(write_failure_rate=1)
+
+
+class TestRunCycleInMemory:
+    """Tests for run_cycle against InMemoryTracOSAdapter, without MongoDB"""
+
+    @pytest.mark.asyncio
+    async def test_inbound_and_outbound_flows(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_journal="off",
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        for n in range(5):
+            (settings.data_inbound_dir / f"{n}.json").write_text(
+                json.dumps(
+                    {
+                        "orderNo": n,
+                        "isActive": False,
+                        "isCanceled": False,
+                        "isDeleted": False,
+                        "isDone": True,
+                        "isOnHold": False,
+                        "isPending": False,
+                        "isSynced": False,
+                        "summary": f"Inbound {n}",
+                        "creationDate": BASE_TIME.isoformat(),
+                        "lastUpdateDate": BASE_TIME.isoformat(),
+                        "deletedDate": None,
+                    }
+                )
+            )
+        tracos = InMemoryTracOSAdapter(FaultInjection(latency=0.001))
+        tracos.insert_documents([stored_document(n) for n in range(100, 103)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        assert metrics["inbound.inserted"] == 5
+        assert metrics["outbound.acknowledged"] == 3
+        assert sorted(p.name for p in settings.data_outbound_dir.glob("*.json")) == [
+            "100.json",
+            "101.json",
+            "102.json",
+        ]
+        assert all(doc["isSynced"] for doc in tracos.documents.values())
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("translation", ["python", "server"])
+    async def test_invalid_workorder_does_not_hold_back_its_batch(
+        self, tmp_path, translation
+    ):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_journal="off",
+            outbound_translation=translation,
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(n) for n in range(10)])
+        # isCanceled and isDeleted: not a valid client workorder
+        tracos.insert_documents([stored_document(10, status="cancelled", deleted=True)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        assert metrics["outbound.exported"] == 10
+        assert metrics["outbound.acknowledged"] == 10
+        assert not tracos.documents[10]["isSynced"]
+
+    @pytest.mark.asyncio
+    async def test_records_failing_validation_are_rejected(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_journal="off",
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+
+        # schema compliant, but a date without a timezone is not a valid workorder
+        naive = BASE_TIME.replace(tzinfo=None).isoformat()
+        (settings.data_inbound_dir / "mixed.jsonl").write_text(
+            json.dumps(client_workorder(1, BASE_TIME.isoformat()))
+            + "\n"
+            + json.dumps(client_workorder(2, naive))
+            + "\n"
+        )
+        (settings.data_inbound_dir / "naive.json").write_text(
+            json.dumps(client_workorder(3, naive))
+        )
+        tracos = InMemoryTracOSAdapter()
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        assert metrics["inbound.inserted"] == 1
+        assert metrics["inbound.archived"] == 1
+        assert metrics["inbound.rejected_records"] == 1
+        assert metrics["inbound.quarantined"] == 1
+        # neither file is read again by the next cycle
+        assert not list(settings.data_inbound_dir.iterdir())
+
+    @pytest.mark.asyncio
+    async def test_journal_keeps_only_unfinished_work(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_path=tmp_path / "journal.jsonl",
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        (settings.data_inbound_dir / "orders.jsonl").write_text(
+            json.dumps(client_workorder(1)) + "\n" + json.dumps(client_workorder(2))
+        )
+
+        class FlakyTracOS(InMemoryTracOSAdapter):
+            """Rejects workorder #2 for good, and loses every acknowledgement"""
+
+            async def write_workorders(self, inserts, updates, current=None):
+                result = await super().write_workorders(
+                    [o for o in inserts if o.number != 2], updates, current
+                )
+                result.failed[2] = "Document failed validation"
+                return result
+
+            async def acknowledge_workorders(self, lease, exported):
+                raise RuntimeError("acknowledgement lost")
+
+        tracos = FlakyTracOS()
+        tracos.insert_documents([stored_document(100)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+        await journal.open()
+        recorded = []
+        record = journal.record
+
+        async def spy(phase, keys):
+            keys = list(keys)
+            recorded.append((phase, keys))
+            await record(phase, keys)
+
+        journal.record = spy
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        # only the written record was checkpointed, the other one was rejected
+        inbound = [
+            key for phase, keys in recorded if phase == "inbound" for key in keys
+        ]
+        assert [key.rsplit("#", 1)[1] for key in inbound] == ["1"]
+        assert metrics["inbound.rejected_records"] == 1
+        # the file is archived, its checkpoints are compacted out of the journal;
+        # the export still waiting for its acknowledgement keeps its own
+        restarted = main.open_checkpoint_journal(settings, tracos)
+        await restarted.open()
+        assert not restarted.completed["inbound"]
+        assert len(restarted.completed["outbound"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_delta_bytes_saved_are_reported_per_run(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            checkpoint_journal="off",
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        tracos = InMemoryTracOSAdapter(update_mode="delta")
+        tracos.delta_bytes_saved = 1000  # by the runs before
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        assert metrics["inbound.delta_bytes_saved"] == 0
+
+    @pytest.mark.asyncio
+    async def test_acknowledged_orders_leave_the_journal(self, tmp_path):
+        settings = Settings(
+            data_outbound_dir=tmp_path / "outbound",
+            checkpoint_path=tmp_path / "journal.jsonl",
+        )
+        settings.data_outbound_dir.mkdir()
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(n) for n in range(5)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+        await journal.open()
+        pipeline = main.outbound_pipeline(
+            settings, ClientERP(), tracos, RunMetrics(), journal
+        )
+
+        await pipeline.run(main.claim_outbound_batches(settings, tracos))
+
+        # recorded once exported, forgotten once acknowledged
+        assert len(settings.checkpoint_path.read_text().splitlines()) == 1
+        assert not journal.completed["outbound"]
+
+    @pytest.mark.asyncio
+    async def test_adaptive_batching_grows_fast_batches(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_journal="off",
+            outbound_batch_size=10,
+            adaptive_batching=True,
+            batch_size_min=5,
+            batch_size_max=325,
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(n) for n in range(100, 300)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+        sizers = main.BatchSizers.from_settings(settings)
+
+        metrics = await main.run_cycle(
+            settings, ClientERP(), tracos, journal, sizers=sizers
+        )
+
+        assert metrics["outbound.acknowledged"] == 200
+        assert metrics["batching.outbound_claim.largest"] > 10
+        assert metrics["batching.outbound_claim.decreases"] == 0
+        assert metrics["batching.outbound_ack.size"] > 10
+        # tuned sizes carry over to the next run
+        assert sizers.outbound_claim.size == metrics["batching.outbound_claim.size"]
@@ -0,0 +1,110 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from services.memory_budget import (
+    DEFAULT_RECORD_BYTES,
+    SCAN_ENTRY_BYTES,
+    MemoryBudget,
+    current_rss,
+    deep_sizeof,
+    peak_rss,
+)
+from services.metrics import RunMetrics
+
+BENCH_MEMORY = Path(__file__).resolve().parents[1] / "benchmarks" / "bench_memory.py"
+# make test-memory runs it over 1M orders
+MEMORY_TEST_ORDERS = int(os.getenv("MEMORY_TEST_ORDERS", "10000"))
+MEMORY_CEILING_MB = 96
+# a key per record would take as many entries as the orders, 10k already by default
+JOURNAL_ENTRIES_CEILING = 100
+
+
+def budget_with_headroom(headroom: int) -> MemoryBudget:
+    """A budget whose high-water mark is headroom bytes above the current RSS"""
+    return MemoryBudget(int((current_rss() + headroom) / 0.9) + 1)
+
+
+class TestMemoryBudget:
+    """Tests for MemoryBudget"""
+
+    def test_rss_is_measured(self):
+        assert current_rss() > 0 and peak_rss() > 0
+
+    def test_deep_sizeof_follows_references(self):
+        small = {"payload": {"summary": "x"}}
+        large = {"payload": {"summary": "x" * 10_000}}
+        assert deep_sizeof(large) - deep_sizeof(small) > 9_000
+        shared = ["y" * 10_000]
+        assert deep_sizeof([shared, shared]) < deep_sizeof([shared, ["y" * 10_000]])
+
+    def test_disabled_budget_keeps_configured_sizes(self):
+        budget = MemoryBudget()
+        assert budget.batch_size("inbound", 100) == 100
+        assert budget.scan_window(0) == 0
+        metrics = RunMetrics()
+        budget.report(metrics)
+        assert not metrics.gauges
+
+    def test_batch_size_fits_headroom(self):
+        budget = budget_with_headroom(64 << 20)
+        # about 64 MiB / DEFAULT_RECORD_BYTES, give or take what RSS moved since
+        expected = (64 << 20) // DEFAULT_RECORD_BYTES
+        assert expected // 2 < budget.batch_size("inbound", 10_000) < 10_000
+
+        budget.measure("inbound", [{"summary": "x" * 60_000}], 1)
+        assert budget.record_bytes["inbound"] > 60_000
+        # two batches held at once get half the room each
+        one = budget.batch_size("inbound", 10_000, in_flight=1)
+        two = budget.batch_size("inbound", 10_000, in_flight=2)
+        assert 1 < two < one < 10_000
+        assert budget.batch_size("inbound", 10) == 10
+
+    def test_measured_footprint_keeps_the_largest(self):
+        budget = MemoryBudget(1 << 30)
+        budget.measure("outbound", [{"a": "x" * 1000}], 1)
+        large = budget.record_bytes["outbound"]
+        budget.measure("outbound", [{"a": "x"}], 1)
+        assert budget.record_bytes["outbound"] == large
+
+    def test_pressure_shrinks_batches_to_one(self):
+        budget = MemoryBudget(current_rss())
+
+        assert budget.batch_size("outbound", 500, in_flight=4) == 1
+        assert budget.pressure == 1
+        metrics = RunMetrics()
+        budget.report(metrics)
+        assert metrics["memory.outbound.smallest_batch"] == 1
+        assert metrics["memory.pressure"] == 1
+        assert metrics["memory.peak_rss_bytes"] > 0
+
+    def test_scan_window(self):
+        budget = MemoryBudget(100 << 20)
+        assert budget.scan_window(0) == int((100 << 20) * 0.1) // SCAN_ENTRY_BYTES
+        assert budget.scan_window(50) == 50
+
+    def test_negative_budget_rejected(self):
+        with pytest.raises(ValueError):
+            MemoryBudget(-1)
+
+
+def test_peak_rss_stays_under_ceiling():
+    """A run over MEMORY_TEST_ORDERS synthetic orders, in a process of its own and
+    with the default settings, peaks under a ceiling that does not depend on the
+    number of orders, and so does its checkpoint journal"""
+    result = subprocess.run(
+        [sys.executable, str(BENCH_MEMORY), str(MEMORY_TEST_ORDERS)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "MEMORY_BUDGET_MB": str(MEMORY_CEILING_MB)},
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+
+    assert report["synced"] == MEMORY_TEST_ORDERS, report
+    assert report["peak_rss_mb"] < MEMORY_CEILING_MB, report
+    assert report["journal_entries"] < JOURNAL_ENTRIES_CEILING, report
@@ -0,0 +1,66 @@
+import pytest
+
+from adapters.mongo_options import MongoClientOptions
+from adapters.tracos_adapter import TracOSAdapter
+
+
+class TestMongoClientOptions:
+    """Tests for MongoClientOptions"""
+
+    def test_defaults_keep_previous_timeouts(self):
+        kwargs = MongoClientOptions().as_client_kwargs()
+
+        assert kwargs["connectTimeoutMS"] == 5000
+        assert kwargs["socketTimeoutMS"] == 5000
+        assert kwargs["timeoutMS"] == 5000
+        assert "compressors" not in kwargs
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "20")
+        monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "5")
+        monkeypatch.setenv("MONGO_COMPRESSORS", "zlib, snappy")
+        monkeypatch.setenv("MONGO_ZLIB_COMPRESSION_LEVEL", "6")
+        monkeypatch.setenv("MONGO_WRITE_CONCERN_W", "majority")
+
+        options = MongoClientOptions.from_env()
+
+        assert options.max_pool_size == 20
+        assert options.min_pool_size == 5
+        assert options.compressors == ("zlib", "snappy")
+        assert options.write_concern_w == "majority"
+
+    def test_numeric_write_concern_from_env(self, monkeypatch):
+        monkeypatch.setenv("MONGO_WRITE_CONCERN_W", "2")
+
+        assert MongoClientOptions.from_env().write_concern_w == 2
+
+    def test_zlib_level_only_sent_with_zlib(self):
+        kwargs = MongoClientOptions(
+            compressors=("zlib",), zlib_compression_level=9
+        ).as_client_kwargs()
+
+        assert kwargs["compressors"] == "zlib"
+        assert kwargs["zlibCompressionLevel"] == 9
+
+    @pytest.mark.parametrize(
+        "overrides",
+        [
+            {"max_pool_size": 0},
+            {"min_pool_size": 200},
+            {"compressors": ("lz4",)},
+            {"zlib_compression_level": 10},
+            {"read_concern_level": "eventual"},
+            {"timeout_ms": 0},
+        ],
+    )
+    def test_invalid_options_rejected(self, overrides):
+        with pytest.raises(ValueError):
+            MongoClientOptions(**overrides)
+
+    def test_adapter_applies_pool_options(self):
+        options = MongoClientOptions(max_pool_size=7, min_pool_size=2)
+        adapter = TracOSAdapter("mongodb://localhost:27017", "db", "c", options)
+
+        pool_options = adapter.client.delegate.options.pool_options
+        assert pool_options.max_pool_size == 7
+        assert pool_options.min_pool_size == 2
@@ -0,0 +1,243 @@
+import pytest
+from datetime import datetime, timezone
+from pymongo.errors import (
+    AutoReconnect,
+    BulkWriteError,
+    DuplicateKeyError,
+    OperationFailure,
+)
+
+from adapters.mongo_retry import (
+    CircuitBreaker,
+    MongoDBUnavailable,
+    RetryPolicy,
+    retry_on_mongodb_error,
+)
+from adapters.tracos_adapter import TracOSAdapter
+from models.tracOS_models import TracOSWorkorder
+
+
+FAST_POLICY = RetryPolicy(
+    max_attempts=4,
+    base_delay=0.0,
+    max_delay=0.0,
+    deadline=5.0,
+    breaker_threshold=2,
+    breaker_cooldown=0.0,
+)
+
+
+def make_workorder(number: int) -> TracOSWorkorder:
+    now = datetime.now(timezone.utc)
+    return TracOSWorkorder(
+        number=number,
+        status="pending",
+        title=f"Example workorder #{number}",
+        description="Retry test",
+        createdAt=now,
+        updatedAt=now,
+        deleted=False,
+        isSynced=False,
+    )
+
+
+class FlakyOperation:
+    """Raises the given errors in order, then succeeds"""
+
+    def __init__(self, *errors):
+        self.retry_policy = FAST_POLICY
+        self.circuit_breaker = CircuitBreaker(2, 0.0)
+        self.errors = list(errors)
+        self.calls = 0
+
+    @retry_on_mongodb_error
+    async def run(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class FakeBulkResult:
+    def __init__(self, count: int):
+        self.upserted_count = count
+        self.modified_count = 0
+        self.matched_count = 0
+        self.upserted_ids = {i: i for i in range(count)}
+
+
+class FakeCollection:
+    """Fails a bulk write once for the given request indexes, then succeeds"""
+
+    def __init__(self, failing: dict[int, int]):
+        self.failing = failing
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered):
+        self.batches.append(list(requests))
+        if len(self.batches) == 1 and self.failing:
+            errors = [
+                {"index": i, "code": code, "errmsg": f"error {code}"}
+                for i, code in self.failing.items()
+            ]
+            raise BulkWriteError(
+                {
+                    "writeErrors": errors,
+                    "nUpserted": len(requests) - len(errors),
+                    "nModified": 0,
+                    "upserted": [
+                        {"index": i, "_id": i}
+                        for i in range(len(requests))
+                        if i not in self.failing
+                    ],
+                }
+            )
+        return FakeBulkResult(len(requests))
+
+
+class ExistingFirst:
+    """The first bulk write matches existing documents instead of upserting"""
+
+    def __init__(self, bulk_write):
+        self.bulk_write = bulk_write
+        self.calls = 0
+
+    async def __call__(self, requests, ordered):
+        result = await self.bulk_write(requests, ordered)
+        self.calls += 1
+        if self.calls == 1:
+            result.upserted_count, result.upserted_ids = 0, {}
+            result.matched_count = len(requests)
+        return result
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy"""
+
+    def test_backoff_is_bounded_by_max_delay(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+        for attempt in range(1, 10):
+            assert 0 <= policy.backoff(attempt) <= 2.0
+
+    def test_network_errors_are_transient(self):
+        assert RetryPolicy().is_transient(AutoReconnect("primary stepped down"))
+
+    def test_transient_server_codes(self):
+        assert RetryPolicy().is_transient(OperationFailure("stepdown", code=189))
+
+    def test_duplicate_key_is_not_transient(self):
+        assert not RetryPolicy().is_transient(DuplicateKeyError("dup", code=11000))
+
+    def test_invalid_settings_rejected(self):
+        with pytest.raises(ValueError):
+            RetryPolicy(max_attempts=0)
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker"""
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+    def test_half_open_after_cooldown_and_closes_on_success(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure()
+        assert breaker.state == "half_open"
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failures_are_counted_across_closes(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.failures == 2
+
+
+class TestRetryDecorator:
+    """Tests for retry_on_mongodb_error"""
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors_until_success(self):
+        op = FlakyOperation(AutoReconnect("down"), AutoReconnect("down"))
+        assert await op.run() == "ok"
+        assert op.calls == 3
+        assert op.circuit_breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_non_transient_error_is_retried_once(self):
+        op = FlakyOperation(OperationFailure("blip", code=13))
+        assert await op.run() == "ok"
+        assert op.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_gives_up_on_a_repeated_non_transient_error(self):
+        unauthorized = OperationFailure("unauthorized", code=13)
+        op = FlakyOperation(unauthorized, unauthorized)
+        with pytest.raises(MongoDBUnavailable) as e:
+            await op.run()
+        assert op.calls == 2
+        assert e.value.operation == "run"
+        assert e.value.__cause__ is unauthorized
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self):
+        op = FlakyOperation(*[AutoReconnect("down")] * 10)
+        with pytest.raises(MongoDBUnavailable):
+            await op.run()
+        assert op.calls == FAST_POLICY.max_attempts
+
+
+class TestWriteWorkorders:
+    """Tests for TracOSAdapter.write_workorders partial-batch retry"""
+
+    @pytest.mark.asyncio
+    async def test_only_failed_operations_are_retried(self):
+        adapter = TracOSAdapter(
+            "mongodb://localhost:27017", "db", "c", retry_policy=FAST_POLICY
+        )
+        adapter.collection = FakeCollection(failing={1: 189, 3: 121})
+
+        result = await adapter.write_workorders(
+            [make_workorder(n) for n in range(4)], []
+        )
+
+        first, second = adapter.collection.batches
+        assert len(first) == 4
+        # the validation failure (index 3) is permanent, only index 1 is retried
+        assert [request._filter for request in second] == [{"number": 1}]
+        assert result.written == 3
+        assert result.failed == {3: "error 121"}
+
+    @pytest.mark.asyncio
+    async def test_insert_losing_a_race_is_retried_as_update(self):
+        adapter = TracOSAdapter(
+            "mongodb://localhost:27017", "db", "c", retry_policy=FAST_POLICY
+        )
+        adapter.collection = FakeCollection(failing={0: 11000})
+        order = make_workorder(7)
+
+        await adapter.write_workorders([order], [])
+
+        _, second = adapter.collection.batches
+        assert second[0]._filter["number"] == 7
+        assert second[0]._filter["updatedAt"] == {"$lt": order.updatedAt}
+        assert adapter.circuit_breaker.consecutive_failures == 0
+
+    @pytest.mark.asyncio
+    async def test_insert_matching_an_existing_document_is_retried_as_update(self):
+        adapter = TracOSAdapter(
+            "mongodb://localhost:27017", "db", "c", retry_policy=FAST_POLICY
+        )
+        adapter.collection = FakeCollection(failing={})
+        adapter.collection.bulk_write = ExistingFirst(adapter.collection.bulk_write)
+        order = make_workorder(8)
+
+        await adapter.write_workorders([order], [])
+
+        _, second = adapter.collection.batches
+        assert second[0]._filter["updatedAt"] == {"$lt": order.updatedAt}
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import tarfile
+import zipfile
+import pytest
+
+from adapters.client_erp_adapter import ClientERP
+from adapters.outbound_bundler import MANIFEST_NAME, OutboundBundler
+
+
+@pytest.fixture
+def outbound_dir(tmp_path):
+    """Outbound directory with 5 exports in the hash layout"""
+    outbound = tmp_path / "outbound"
+    outbound.mkdir()
+    client = ClientERP()
+    for order_no in range(5):
+        client.write_json_file(outbound, {"orderNo": order_no}, layout="hash")
+    return outbound
+
+
+class TestOutboundLayout:
+    """Tests for ClientERP.write_json_file layouts"""
+
+    def test_hash_layout_spreads_files_over_subdirectories(self, outbound_dir):
+        files = list(outbound_dir.rglob("*.json"))
+        assert len(files) == 5
+        assert all(
+            len(f.parent.name) == 2 and f.parent.parent == outbound_dir for f in files
+        )
+        assert not list(outbound_dir.rglob(".*"))
+
+    def test_date_layout(self, tmp_path):
+        ClientERP().write_json_file(tmp_path, {"orderNo": 1}, layout="date")
+        (written,) = tmp_path.rglob("1.json")
+        assert len(written.parent.name) == len("2025-06-01")
+
+    def test_unknown_layout_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            ClientERP().write_json_file(tmp_path, {"orderNo": 1}, layout="tree")
+
+
+class TestOutboundBundler:
+    """Tests for OutboundBundler"""
+
+    def test_tar_bundles_with_manifest(self, outbound_dir):
+        bundler = OutboundBundler(outbound_dir, outbound_dir / "bundles", max_files=2)
+
+        bundles = bundler.bundle()
+
+        assert len(bundles) == 3
+        assert bundler.completed_exports() == []
+        with tarfile.open(bundles[0]) as archive:
+            manifest = json.load(archive.extractfile(MANIFEST_NAME))
+            assert manifest["count"] == 2
+            for entry in manifest["files"]:
+                content = archive.extractfile(entry["name"]).read()
+                assert hashlib.sha256(content).hexdigest() == entry["sha256"]
+
+    def test_zip_bundle(self, outbound_dir):
+        bundler = OutboundBundler(outbound_dir, outbound_dir / "bundles", format="zip")
+
+        (bundle,) = bundler.bundle()
+
+        with zipfile.ZipFile(bundle) as archive:
+            assert len(archive.namelist()) == 6
+        assert not list((outbound_dir / "bundles").glob(".*"))
+
+    def test_nothing_to_bundle(self, tmp_path):
+        assert OutboundBundler(tmp_path, tmp_path / "bundles").bundle() == []
+
+    def test_invalid_format_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            OutboundBundler(tmp_path, tmp_path / "bundles", format="rar")
@@ -0,0 +1,49 @@
+import pytest
+from pathlib import Path
+
+from services.partitioning import WorkerPartition, shard_of
+
+
+class TestShardOf:
+    """Tests for shard_of"""
+
+    def test_shard_is_stable(self):
+        assert shard_of("123.json", 4) == shard_of("123.json", 4)
+
+    def test_shard_within_range(self):
+        assert all(0 <= shard_of(f"{i}.json", 3) < 3 for i in range(100))
+
+
+class TestWorkerPartition:
+    """Tests for WorkerPartition"""
+
+    def test_single_worker_owns_everything(self):
+        partition = WorkerPartition()
+
+        assert partition.is_leader
+        assert all(partition.owns(Path(f"{i}.json")) for i in range(50))
+
+    def test_workers_split_files_disjointly_and_completely(self):
+        files = [Path(f"data/inbound/{i}.json") for i in range(1000)]
+        partitions = [WorkerPartition(index=i, count=4) for i in range(4)]
+
+        owners = [[p.index for p in partitions if p.owns(f)] for f in files]
+
+        assert all(len(o) == 1 for o in owners)
+        # the split is roughly even
+        for partition in partitions:
+            assert sum(o == [partition.index] for o in owners) > 150
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("WORKER_INDEX", "2")
+        monkeypatch.setenv("WORKER_COUNT", "3")
+
+        partition = WorkerPartition.from_env()
+
+        assert partition == WorkerPartition(index=2, count=3)
+        assert not partition.is_leader
+
+    @pytest.mark.parametrize("index,count", [(0, 0), (3, 3), (-1, 2)])
+    def test_invalid_partition_rejected(self, index, count):
+        with pytest.raises(ValueError):
+            WorkerPartition(index=index, count=count)
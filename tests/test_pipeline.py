@@ -0,0 +1,230 @@
+import asyncio
+import pytest
+
+from services.pipeline import Pipeline, Stage, merge
+
+
+class TestPipeline:
+    """Tests for the staged Pipeline"""
+
+    @pytest.mark.asyncio
+    async def test_items_flow_through_all_stages(self):
+        results = []
+
+        async def collect(item):
+            results.append(item)
+
+        pipeline = Pipeline(
+            "test",
+            [
+                Stage("double", lambda x: x * 2, concurrency=3),
+                Stage("odd_only", lambda x: x if x % 4 else None),
+                Stage("collect", collect),
+            ],
+        )
+        stats = await pipeline.run(range(10))
+
+        assert sorted(results) == [2, 6, 10, 14, 18]
+        assert [s.received for s in stats.stages] == [10, 10, 5]
+        assert stats.stages[1].dropped == 5
+
+    @pytest.mark.asyncio
+    async def test_batched_stage_receives_lists(self):
+        batches = []
+
+        async def sink(batch):
+            batches.append(batch)
+
+        pipeline = Pipeline("test", [Stage("sink", sink, batched=True, batch_size=4)])
+        await pipeline.run(range(10))
+
+        assert sorted(x for b in batches for x in b) == list(range(10))
+        assert all(len(b) <= 4 for b in batches)
+
+    @pytest.mark.asyncio
+    async def test_batch_size_function_is_called_per_batch(self):
+        batches = []
+        sizes = iter([1, 2, 3, 100])
+
+        async def sink(batch):
+            batches.append(batch)
+
+        stage = Stage("sink", sink, batched=True, batch_size=lambda: next(sizes))
+        await Pipeline("test", [stage]).run(range(10))
+
+        assert [len(b) for b in batches] == [1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_fan_out_and_async_source(self):
+        results = []
+
+        async def source():
+            for i in range(3):
+                yield i
+
+        pipeline = Pipeline(
+            "test",
+            [
+                Stage("repeat", lambda x: [x] * x, fan_out=True),
+                Stage("collect", results.append),
+            ],
+        )
+        await pipeline.run(source())
+
+        assert sorted(results) == [1, 2, 2]
+
+    @pytest.mark.asyncio
+    async def test_failures_are_counted_not_raised(self):
+        def fragile(x):
+            if x == 3:
+                raise ValueError("bad record")
+            return x
+
+        stats = await Pipeline("test", [Stage("fragile", fragile)]).run(range(5))
+
+        assert stats.stages[0].failed == 1
+        assert stats.stages[0].received == 5
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_throttles_source(self):
+        produced = 0
+        in_flight = []
+
+        def source():
+            nonlocal produced
+            for i in range(50):
+                produced += 1
+                yield i
+
+        async def slow_sink(item):
+            in_flight.append(produced - item)
+            await asyncio.sleep(0.001)
+
+        queue_size = 5
+        pipeline = Pipeline(
+            "test",
+            [Stage("pass", lambda x: x), Stage("sink", slow_sink)],
+            queue_size=queue_size,
+        )
+        stats = await pipeline.run(source())
+
+        # at most two full queues plus one item per worker are ever buffered
+        assert max(in_flight) <= 2 * queue_size + 3
+        assert stats.bottleneck.name == "sink"
+        assert stats.stages[0].blocked_seconds > 0
+
+    @pytest.mark.asyncio
+    async def test_failing_source_stops_every_worker(self):
+        async def failing():
+            yield 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("claim failed")
+
+        pipeline = Pipeline(
+            "test",
+            [Stage("pass", lambda x: x, concurrency=3), Stage("sink", lambda x: x)],
+        )
+        with pytest.raises(RuntimeError):
+            await pipeline.run(failing())
+
+        # no worker is left waiting on its queue
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    @pytest.mark.asyncio
+    async def test_fatal_error_stops_the_pipeline(self):
+        class Unavailable(Exception):
+            pass
+
+        def handle(item):
+            if item == 3:
+                raise Unavailable()
+            if item == 1:
+                raise ValueError("bad item")
+            return item
+
+        pipeline = Pipeline(
+            "test",
+            [Stage("handle", handle, concurrency=2), Stage("sink", lambda x: x)],
+            fatal=(Unavailable,),
+        )
+        with pytest.raises(Unavailable):
+            await pipeline.run(range(100))
+
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    def test_invalid_stage_rejected(self):
+        with pytest.raises(ValueError):
+            Stage("bad", print, batch_size=10)
+
+    @pytest.mark.asyncio
+    async def test_blocking_generator_streams_under_backpressure(self):
+        pulled = 0
+        in_flight = []
+
+        def expand(n):
+            nonlocal pulled
+            for i in range(n):
+                pulled += 1
+                yield i
+
+        async def slow_sink(item):
+            in_flight.append(pulled - item)
+            await asyncio.sleep(0.001)
+
+        pipeline = Pipeline(
+            "test",
+            [
+                Stage("expand", expand, blocking=True, fan_out=True),
+                Stage("sink", slow_sink),
+            ],
+            queue_size=2,
+        )
+        stats = await pipeline.run([30])
+
+        assert stats.stages[0].emitted == 30
+        # the generator is never far ahead of the consumer
+        assert max(in_flight) <= 2 + 3
+
+
+class TestMerge:
+    """Tests for merge"""
+
+    @pytest.mark.asyncio
+    async def test_sources_are_drained_concurrently(self):
+        active, peak = 0, 0
+
+        async def source(start: int):
+            nonlocal active, peak
+            for i in range(start, start + 3):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+                yield i
+
+        items = [item async for item in merge([source(0), source(10), source(20)])]
+
+        assert sorted(items) == [0, 1, 2, 10, 11, 12, 20, 21, 22]
+        assert peak == 3
+
+    @pytest.mark.asyncio
+    async def test_failing_source_cancels_the_others(self):
+        cancelled = asyncio.Event()
+
+        async def endless():
+            try:
+                while True:
+                    yield 1
+                    await asyncio.sleep(0.001)
+            finally:
+                cancelled.set()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("cursor lost")
+            yield
+
+        with pytest.raises(RuntimeError):
+            async for _ in merge([endless(), failing()]):
+                pass
+        assert cancelled.is_set()
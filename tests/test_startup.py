@@ -0,0 +1,53 @@
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# Dependencies main.py only imports when a run needs them
+HEAVY_MODULES = ("motor", "pymongo", "bson", "jsonschema", "pydantic")
+
+# Generous, to stay green on slow CI hosts: `import main` takes ~0.1s here,
+# against ~0.25s when every dependency was imported eagerly
+STARTUP_BUDGET_SECONDS = 0.6
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative import time in seconds of every module imported by `import module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class TestStartup:
+    """Tests for the import cost of main.py"""
+
+    def test_import_has_no_heavy_dependencies(self):
+        imported = import_times("main")
+        loaded = [name for name in imported if name.split(".")[0] in HEAVY_MODULES]
+        assert loaded == []
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        subprocess.run(
+            [sys.executable, "-c", "import main"],
+            cwd=tmp_path,
+            env={"PYTHONPATH": str(SRC), "DATA_OUTBOUND_DIR": "outbound"},
+            check=True,
+        )
+        assert list(tmp_path.iterdir()) == []
+
+    def test_import_time_within_budget(self):
+        # best of three: the first run may pay for cold disk caches
+        best = min(import_times("main")["main"] for _ in range(3))
+        assert best < STARTUP_BUDGET_SECONDS, f"import main took {best * 1000:.1f} ms"
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import pytest
+from pathlib import Path
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import FaultInjection, InMemoryTracOSAdapter
+from adapters.mongo_retry import RetryPolicy
+from services.metrics import RunMetrics
+from settings import Settings
+from tenants import (
+    TENANT_DIRS,
+    Tenant,
+    TenantScheduler,
+    load_tenants,
+    tenant_settings,
+)
+
+
+def write_config(tmp_path: Path, config: dict) -> Path:
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps(config))
+    return path
+
+
+def client_workorder(number: int) -> dict:
+    date = "2025-06-01T00:00:00+00:00"
+    return {
+        "orderNo": number,
+        "isActive": False,
+        "isCanceled": False,
+        "isDeleted": False,
+        "isDone": True,
+        "isOnHold": False,
+        "isPending": False,
+        "isSynced": False,
+        "summary": f"Tenant order {number}",
+        "creationDate": date,
+        "lastUpdateDate": date,
+        "deletedDate": None,
+    }
+
+
+def tenant_dirs(name: str) -> dict[str, str]:
+    return {
+        setting: f"{name}/{setting.removeprefix('data_').removesuffix('_dir')}"
+        for setting in TENANT_DIRS
+    }
+
+
+class TestTenantSettings:
+    """Tests for tenant_settings and load_tenants"""
+
+    def test_overrides_are_converted_to_setting_types(self):
+        settings = tenant_settings(
+            Settings(),
+            "acme",
+            {
+                "mongo_collection": "acme",
+                "data_inbound_dir": "data/acme/inbound",
+                "inbound_scan_options": {"max_files": 10},
+            },
+        )
+
+        assert settings.mongo_collection == "acme"
+        assert settings.data_inbound_dir == Path("data/acme/inbound")
+        assert settings.inbound_scan_options.max_files == 10
+        assert settings.inbound_scan_options.oldest_first
+
+    def test_tenant_files_do_not_collide(self):
+        first = tenant_settings(Settings(), "a", {"mongo_collection": "a"})
+        second = tenant_settings(Settings(), "b", {"mongo_collection": "b"})
+
+        assert first.checkpoint_path != second.checkpoint_path
+        assert first.existence_filter_path != second.existence_filter_path
+        assert first.worker_owner != second.worker_owner
+
+    def test_trace_path_is_per_tenant_only_when_tracing(self):
+        assert tenant_settings(Settings(), "a", {}).trace_path is None
+        traced = Settings(trace_path=Path("traces.jsonl"))
+        assert tenant_settings(traced, "a", {}).trace_path.parent.name == "a"
+        explicit = tenant_settings(Settings(), "a", {"trace_path": "a.jsonl"})
+        assert explicit.trace_path == Path("a.jsonl")
+
+    def test_unknown_setting_is_rejected(self):
+        with pytest.raises(ValueError):
+            tenant_settings(Settings(), "acme", {"mongo_colection": "acme"})
+
+    def test_shared_client_settings_cannot_be_overridden(self):
+        with pytest.raises(ValueError):
+            tenant_settings(Settings(), "acme", {"mongo_uri": "mongodb://other"})
+
+    def test_tenants_need_their_own_collection(self, tmp_path):
+        config = write_config(tmp_path, {"tenants": [{"name": "a"}, {"name": "b"}]})
+        with pytest.raises(ValueError):
+            load_tenants(config, Settings())
+
+    def test_tenants_need_their_own_directories(self, tmp_path):
+        config = write_config(
+            tmp_path,
+            {
+                "tenants": [
+                    {"name": "a", "mongo_collection": "a", **tenant_dirs("a")},
+                    {
+                        "name": "b",
+                        "mongo_collection": "b",
+                        **tenant_dirs("b"),
+                        # archiving into the inbound directory of a
+                        "data_archive_dir": "a/inbound/",
+                    },
+                ],
+            },
+        )
+        with pytest.raises(ValueError, match="data_archive_dir"):
+            load_tenants(config, Settings())
+
+    def test_load_tenants(self, tmp_path):
+        config = write_config(
+            tmp_path,
+            {
+                "max_active": 2,
+                "tenants": [
+                    {"name": "a", "mongo_collection": "a", **tenant_dirs("a")},
+                    {"name": "b", "mongo_collection": "b", **tenant_dirs("b")},
+                ],
+            },
+        )
+
+        tenants, max_active = load_tenants(config, Settings())
+
+        assert [t.name for t in tenants] == ["a", "b"]
+        assert max_active == 2
+
+
+class TestTenantScheduler:
+    """Tests for TenantScheduler"""
+
+    def make_tenants(self, count: int) -> list[Tenant]:
+        return [
+            Tenant(f"t{i}", Settings(mongo_collection=f"t{i}")) for i in range(count)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_tenants_take_turns_within_the_limit(self):
+        tenants = self.make_tenants(5)
+        order, active, peak = [], 0, 0
+
+        async def cycle(tenant: Tenant) -> RunMetrics:
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            order.append(tenant.name)
+            await asyncio.sleep(0.01)
+            active -= 1
+            metrics = RunMetrics()
+            metrics.incr("inbound.inserted", 3)
+            return metrics
+
+        await TenantScheduler(tenants, cycle, max_active=2).run()
+
+        assert order == [f"t{i}" for i in range(5)]
+        assert peak == 2
+        assert all(
+            t.cycles == 1 and t.metrics["inbound.inserted"] == 3 for t in tenants
+        )
+
+    @pytest.mark.asyncio
+    async def test_failing_tenant_does_not_stop_the_others(self, tmp_path):
+        # every round trip of t0 times out: its cycle gives up on MongoDB
+        faults = {
+            "t0": FaultInjection(latency=0.01, timeout=0.001),
+            "t1": FaultInjection(),
+        }
+        tenants = []
+        for name in faults:
+            settings = tenant_settings(
+                Settings(checkpoint_journal="off"),
+                name,
+                {"mongo_collection": name, **tenant_dirs(str(tmp_path / name))},
+            )
+            settings.data_inbound_dir.mkdir(parents=True)
+            settings.data_outbound_dir.mkdir(parents=True)
+            for number in range(3):
+                (settings.data_inbound_dir / f"{number}.json").write_text(
+                    json.dumps(client_workorder(number))
+                )
+            tenants.append(Tenant(name, settings))
+        adapters = {
+            name: InMemoryTracOSAdapter(
+                fault, retry_policy=RetryPolicy(max_attempts=2, base_delay=0)
+            )
+            for name, fault in faults.items()
+        }
+
+        async def cycle(tenant: Tenant) -> RunMetrics:
+            tracos = adapters[tenant.name]
+            journal = main.open_checkpoint_journal(tenant.settings, tracos)
+            return await main.run_cycle(tenant.settings, ClientERP(), tracos, journal)
+
+        await TenantScheduler(tenants, cycle, max_active=2).run()
+
+        assert [t.failures for t in tenants] == [1, 0]
+        assert all(t.cycles == 1 for t in tenants)
+        assert tenants[1].metrics["inbound.inserted"] == 3
+        assert sorted(adapters["t1"].documents) == [0, 1, 2]
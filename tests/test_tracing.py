@@ -0,0 +1,175 @@
+import json
+import pytest
+from datetime import datetime, timezone
+
+import main
+from adapters.client_erp_adapter import ClientERP
+from adapters.memory_adapter import InMemoryTracOSAdapter
+from services import tracing
+from services.metrics import RunMetrics
+from services.tracing import (
+    STATUS_CODE_ERROR,
+    RecordTrace,
+    Tracer,
+    datetime_ns,
+    percentile,
+)
+from settings import Settings
+from test_memory_adapter import stored_document
+
+
+class Item:
+    def __init__(self, trace: RecordTrace | None):
+        self.traces = [trace] if trace is not None else []
+
+
+def read_spans(path) -> list[dict]:
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans += scope["spans"]
+    return spans
+
+
+class TestTracer:
+    """Tests for Tracer"""
+
+    def test_percentiles_are_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 50) == 0.0
+
+    def test_datetime_ns_keeps_microseconds(self):
+        value = datetime(2025, 6, 1, 0, 0, 0, 123456, tzinfo=timezone.utc)
+        assert datetime_ns(value) == 1748736000_123456000
+
+    def test_sampling_is_deterministic_and_near_rate(self, tmp_path):
+        tracer = Tracer(tmp_path / "traces.jsonl", sample_rate=0.1)
+        keys = [f"file-{i}.json#0" for i in range(10_000)]
+
+        sampled = [key for key in keys if tracer.start("inbound", key, 0)]
+
+        assert 800 < len(sampled) < 1200
+        assert sampled == [key for key in keys if tracer.start("inbound", key, 0)]
+
+    def test_no_path_samples_nothing(self):
+        tracer = Tracer(sample_rate=1.0)
+        assert tracer.start("inbound", "key", 0) is None
+        handler = lambda item: item
+        assert tracer.stage("validate", handler) is handler
+
+    @pytest.mark.asyncio
+    async def test_stages_record_spans_and_finish_traces(self, tmp_path):
+        tracer = Tracer(tmp_path / "traces.jsonl", sample_rate=1.0)
+        kept = Item(tracer.start("inbound", "kept", 1_000))
+        dropped = Item(tracer.start("inbound", "dropped", 1_000))
+
+        async def sync(batch):
+            return batch
+
+        validate = tracer.stage("validate", lambda i: None if i is dropped else i)
+        validate(kept), validate(dropped)
+        await tracer.stage("db_write", sync)([kept])
+        tracer.stage("archive", lambda i: i, finish=True)(kept)
+
+        # a root span per record, plus one per stage it went through
+        assert tracer.flush() == (1 + 3) + (1 + 1)
+        spans = read_spans(tmp_path / "traces.jsonl")
+        roots = {
+            s["attributes"][1]["value"]["stringValue"]: s
+            for s in spans
+            if not s["parentSpanId"]
+        }
+        assert roots["dropped"]["status"]["code"] == STATUS_CODE_ERROR
+        assert roots["kept"]["startTimeUnixNano"] == "1000"
+        children = [
+            s["name"] for s in spans if s["parentSpanId"] == roots["kept"]["spanId"]
+        ]
+        assert children == ["inbound.validate", "inbound.db_write", "inbound.archive"]
+
+    def test_report_sets_lag_percentiles(self):
+        tracer = Tracer()
+        for lag in range(1, 101):
+            tracer.observe_lag("inbound", 0, lag * 10**9)
+        metrics = RunMetrics()
+
+        tracer.report(metrics)
+
+        assert metrics["inbound.lag_p50_seconds"] == 50
+        assert metrics["inbound.lag_p99_seconds"] == 99
+        assert metrics["inbound.lag_max_seconds"] == 100
+
+    def test_lags_are_sampled_beyond_the_reservoir(self, monkeypatch):
+        monkeypatch.setattr(tracing, "LAG_SAMPLES", 10)
+        tracer = Tracer()
+        for lag in range(1, 1001):
+            tracer.observe_lag("outbound", 0, lag * 10**9)
+        metrics = RunMetrics()
+
+        tracer.report(metrics)
+
+        assert len(tracer.lags["outbound"]) == 10
+        assert metrics["outbound.lag_max_seconds"] == 1000
+
+
+class TestRunCycleTracing:
+    """Tests for tracing in run_cycle, against InMemoryTracOSAdapter"""
+
+    @pytest.mark.asyncio
+    async def test_records_are_traced_end_to_end(self, tmp_path):
+        settings = Settings(
+            data_inbound_dir=tmp_path / "inbound",
+            data_outbound_dir=tmp_path / "outbound",
+            data_archive_dir=tmp_path / "archive",
+            data_dead_letter_dir=tmp_path / "dead_letter",
+            checkpoint_journal="off",
+            trace_path=tmp_path / "traces.jsonl",
+            trace_sample_rate=1.0,
+        )
+        settings.data_inbound_dir.mkdir()
+        settings.data_outbound_dir.mkdir()
+        now = datetime.now(timezone.utc).isoformat()
+        (settings.data_inbound_dir / "1.json").write_text(
+            json.dumps(
+                {
+                    "orderNo": 1,
+                    "isActive": True,
+                    "isCanceled": False,
+                    "isDeleted": False,
+                    "isDone": False,
+                    "isOnHold": False,
+                    "isPending": False,
+                    "isSynced": False,
+                    "summary": "Traced",
+                    "creationDate": now,
+                    "lastUpdateDate": now,
+                    "deletedDate": None,
+                }
+            )
+        )
+        tracos = InMemoryTracOSAdapter()
+        tracos.insert_documents([stored_document(100)])
+        journal = main.open_checkpoint_journal(settings, tracos)
+
+        metrics = await main.run_cycle(settings, ClientERP(), tracos, journal)
+
+        names = {span["name"] for span in read_spans(settings.trace_path)}
+        assert {
+            "inbound.workorder",
+            "inbound.landing",
+            "inbound.read",
+            "inbound.validate",
+            "inbound.db_write",
+            "inbound.archive",
+            "outbound.workorder",
+            "outbound.claim",
+            "outbound.translate",
+            "outbound.export",
+            "outbound.ack",
+        } <= names
+        assert metrics["tracing.spans"] > 0
+        assert metrics["inbound.lag_p50_seconds"] >= 0
+        # stored_document(100) was last updated in 2025
+        assert metrics["outbound.lag_max_seconds"] > 86_400
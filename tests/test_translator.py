@@ -0,0 +1,82 @@
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from adapters.memory_adapter import project
+from models.tracOS_models import TracOSWorkorder
+from services.translator import (
+    TRACOS_TO_CLIENT_PROJECTION,
+    client_json,
+    tracos_to_client,
+)
+
+BASE_TIME = datetime(2025, 6, 1, 12, 30, 15, 123000, tzinfo=timezone.utc)
+
+
+def stored_workorder(**overrides: Any) -> dict[str, Any]:
+    doc = {
+        "_id": None,
+        "number": 42,
+        "status": "pending",
+        "title": "Example workorder #42",
+        "description": "Replace bearing",
+        "createdAt": BASE_TIME,
+        "updatedAt": BASE_TIME + timedelta(hours=1),
+        "deleted": False,
+        "deletedAt": None,
+        "isSynced": False,
+        "syncedAt": None,
+    }
+    doc.update(overrides)
+    return doc
+
+
+class TestServerSideTranslation:
+    """Tests for TRACOS_TO_CLIENT_PROJECTION and client_json"""
+
+    @pytest.mark.parametrize(
+        "overrides",
+        [
+            {},
+            {"status": "in_progress"},
+            {"status": "completed", "updatedAt": BASE_TIME.replace(microsecond=0)},
+            {"status": "on_hold", "description": 'Ünïcode "quoted"\n'},
+            {"status": "cancelled", "deletedAt": BASE_TIME},
+        ],
+    )
+    def test_output_is_byte_identical_to_python_translation(self, overrides):
+        doc = stored_workorder(**overrides)
+
+        python = tracos_to_client(TracOSWorkorder.model_validate(doc))
+        server = client_json(project(doc, TRACOS_TO_CLIENT_PROJECTION))
+
+        assert json.dumps(server) == json.dumps(python.model_dump(mode="json"))
+
+    def test_missing_deleted_at_projects_to_null(self):
+        doc = stored_workorder()
+        del doc["deletedAt"]
+        assert (
+            client_json(project(doc, TRACOS_TO_CLIENT_PROJECTION))["deletedDate"]
+            is None
+        )
+
+    def test_invalid_status_is_rejected(self):
+        with pytest.raises(ValueError):
+            client_json(
+                project(stored_workorder(status="unknown"), TRACOS_TO_CLIENT_PROJECTION)
+            )
+
+    def test_rejected_like_python_translation(self):
+        # deleted and cancelled: two status flags, as tracos_to_client rejects too
+        doc = stored_workorder(status="cancelled", deleted=True)
+        with pytest.raises(ValueError):
+            tracos_to_client(TracOSWorkorder.model_validate(doc))
+        with pytest.raises(ValueError):
+            client_json(project(doc, TRACOS_TO_CLIENT_PROJECTION))
+
+    def test_missing_field_is_rejected(self):
+        doc = stored_workorder()
+        del doc["description"]
+        with pytest.raises(ValueError):
+            client_json(project(doc, TRACOS_TO_CLIENT_PROJECTION))
@@ -0,0 +1,110 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from adapters.tracos_adapter import TracOSAdapter
+from adapters.version_cache import VersionCache
+from models.tracOS_models import TracOSWorkorder
+
+
+NOW = datetime(2025, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_workorder(number: int, updated_at: datetime = NOW) -> TracOSWorkorder:
+    return TracOSWorkorder(
+        number=number,
+        status="pending",
+        title=f"Example workorder #{number}",
+        description="Cache test",
+        createdAt=NOW,
+        updatedAt=updated_at,
+        deleted=False,
+        isSynced=False,
+    )
+
+
+class TestVersionCache:
+    """Tests for VersionCache"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = VersionCache(max_entries=2)
+        cache.put(1, NOW, "a")
+        cache.put(2, NOW, "b")
+        assert cache.get(1) is not None
+        cache.put(3, NOW, "c")
+
+        assert cache.get(2) is None
+        assert cache.get(1) is not None
+        assert cache.evictions == 1
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = VersionCache(ttl=10, clock=clock)
+        cache.put(1, NOW, "a")
+        clock.now = 11
+
+        assert cache.get(1) is None
+        assert cache.expirations == 1
+        assert len(cache) == 0
+
+    def test_hit_rate(self):
+        cache = VersionCache()
+        cache.put(1, NOW, "a")
+        cache.get(1)
+        cache.get(1)
+        cache.get(2)
+        assert cache.hit_rate == pytest.approx(2 / 3)
+
+    def test_older_version_does_not_replace_newer(self):
+        cache = VersionCache()
+        cache.put(1, NOW + timedelta(hours=1), "new")
+        cache.put(1, NOW, "old")
+        assert cache.get(1).content_hash == "new"
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = VersionCache(max_entries=0)
+        cache.put(1, NOW, "a")
+        assert cache.get(1) is None
+        assert cache.misses == 0
+
+
+class TestAdapterCache:
+    """Tests for the stored versions TracOSAdapter caches around bulk writes"""
+
+    def make_adapter(self) -> TracOSAdapter:
+        return TracOSAdapter(
+            "mongodb://localhost:27017", "db", "c", version_cache=VersionCache()
+        )
+
+    def test_written_versions_are_cached(self):
+        adapter = self.make_adapter()
+        pending = [(make_workorder(1), True), (make_workorder(2), False)]
+
+        adapter._remember_bulk_write(pending, upserted={0}, failed=set(), matched=1)
+
+        assert adapter.version_cache.get(1).updated_at == NOW
+        assert adapter.version_cache.get(2).updated_at == NOW
+
+    def test_failed_and_skipped_writes_are_invalidated(self):
+        adapter = self.make_adapter()
+        for number in (1, 2, 3):
+            adapter.version_cache.put(number, NOW - timedelta(hours=1), "old")
+        pending = [
+            (make_workorder(1), True),  # existing document, not upserted
+            (make_workorder(2), False),  # failed
+            (make_workorder(3), False),
+        ]
+
+        adapter._remember_bulk_write(pending, upserted=set(), failed={1}, matched=1)
+
+        assert adapter.version_cache.get(1) is None
+        assert adapter.version_cache.get(2) is None
+        # the matched operation may be the insert: the update is not known to apply
+        assert adapter.version_cache.get(3) is None
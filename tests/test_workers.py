@@ -0,0 +1,37 @@
+import pytest
+
+import workers
+
+
+class FakeProcess:
+    def __init__(self, code: int):
+        self.code = code
+
+    def wait(self) -> int:
+        return self.code
+
+
+def run_with_exit_codes(monkeypatch, codes: list[int]) -> int:
+    pending = iter(codes)
+    monkeypatch.setattr(
+        workers.subprocess, "Popen", lambda *args, **kwargs: FakeProcess(next(pending))
+    )
+    return workers.run_workers(len(codes))
+
+
+class TestRunWorkers:
+    """Tests for run_workers"""
+
+    @pytest.mark.parametrize(
+        "codes, expected",
+        [
+            ([0, 0], 0),
+            ([0, 2], 2),
+            ([3, 2], 3),
+            # killed by SIGKILL, e.g. by the OOM killer
+            ([0, -9], 1),
+            ([-15, 2], 1),
+        ],
+    )
+    def test_any_failed_worker_fails_the_run(self, monkeypatch, codes, expected):
+        assert run_with_exit_codes(monkeypatch, codes) == expected